@@ -19,4 +19,4 @@
 
 __version__ = "0.3"
 
-__all__ = ["document", "pixbufcache", "ui", "util"]
+__all__ = ["document", "export", "frames", "launcher", "memory", "pixbufcache", "screensaver", "search", "stats", "thumbnails", "tiles", "ui", "util", "watchdog", "watcher"]
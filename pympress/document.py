@@ -32,14 +32,208 @@ elsewhere).
 """
 
 
+import collections
+import hashlib
+import mmap
+import resource
 import sys
+import threading
+import time
 
+import cairo
+import gobject
 import poppler
 
-import pympress.ui
 import pympress.util
 
-from pympress.ui import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
+#: "Regular" PDF file (without notes)
+PDF_REGULAR      = 0
+#: Content page (left side) of a PDF file with notes
+PDF_CONTENT_PAGE = 1
+#: Notes page (right side) of a PDF file with notes
+PDF_NOTES_PAGE   = 2
+
+
+def guess_notes_layout(sizes):
+    """
+    Guess which pages of a document have notes, from the sizes of all its pages.
+
+    "Regular" pages will have an aspect ratio of 4/3, 16/9, 16/10... Full A4
+    pages will have an aspect ratio < 1. So if the aspect ratio is >= 2, we can
+    assume it is a page with notes (i.e. two slides side by side).
+
+    :param sizes: sizes of all the pages of a document
+    :type  sizes: list of (float, float)
+    :return: for each page, ``True`` if it has notes, ``False`` otherwise
+    :rtype: list of booleans
+    """
+    return [pw >= 2 * ph for pw, ph in sizes]
+
+
+#: C functions used to open a document from a memory-mapped file (see
+#: :func:`load_poppler_api`): ``None`` until they are loaded, ``False`` if they
+#: are not available.
+poppler_api = None
+
+
+def load_poppler_api():
+    """
+    Load the C functions needed by :func:`document_new_from_mmap`.
+
+    poppler-python only accepts strings without NUL bytes as document data, so
+    the document must be created by ``poppler_document_new_from_data()`` itself,
+    and then wrapped in a :class:`poppler.Document` by the C API of PyGObject.
+
+    :return: the functions, or ``None`` if they are not available
+    :rtype: dictionary
+    """
+    global poppler_api
+    if poppler_api is not None:
+        return poppler_api or None
+
+    # ctypes is only needed with memory-mapped files
+    import ctypes
+    import ctypes.util
+
+    class GError(ctypes.Structure):
+        _fields_ = [("domain", ctypes.c_uint32), ("code", ctypes.c_int), ("message", ctypes.c_char_p)]
+
+    class PyGObjectFunctions(ctypes.Structure):
+        # Beginning of struct _PyGObject_Functions (see pygobject.h)
+        _fields_ = [("register_class", ctypes.c_void_p),
+                    ("register_wrapper", ctypes.c_void_p),
+                    ("register_sinkfunc", ctypes.c_void_p),
+                    ("lookup_class", ctypes.c_void_p),
+                    ("newgobj", ctypes.PYFUNCTYPE(ctypes.py_object, ctypes.c_void_p))]
+
+    poppler_api = False
+    libpoppler = ctypes.util.find_library("poppler-glib")
+    libgobject = ctypes.util.find_library("gobject-2.0")
+    libglib = ctypes.util.find_library("glib-2.0")
+    if None in (libpoppler, libgobject, libglib) or not hasattr(gobject, "_PyGObject_API"):
+        return None
+    try:
+        new_from_data = ctypes.CDLL(libpoppler).poppler_document_new_from_data
+        unref = ctypes.CDLL(libgobject).g_object_unref
+        error_free = ctypes.CDLL(libglib).g_error_free
+        as_void_ptr = ctypes.pythonapi.PyCObject_AsVoidPtr
+    except (OSError, AttributeError):
+        return None
+
+    new_from_data.restype = ctypes.c_void_p
+    new_from_data.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_char_p,
+                              ctypes.POINTER(ctypes.POINTER(GError))]
+    unref.argtypes = [ctypes.c_void_p]
+    error_free.argtypes = [ctypes.POINTER(GError)]
+    as_void_ptr.restype = ctypes.c_void_p
+    as_void_ptr.argtypes = [ctypes.py_object]
+    functions = PyGObjectFunctions.from_address(as_void_ptr(gobject._PyGObject_API))
+
+    poppler_api = {
+        "ctypes": ctypes,
+        "GError": GError,
+        "new_from_data": new_from_data,
+        "unref": unref,
+        "error_free": error_free,
+        "newgobj": functions.newgobj,
+    }
+    return poppler_api
+
+
+def mmap_available():
+    """Check if documents can be opened from memory-mapped files.
+
+    :return: ``True`` if :func:`document_new_from_mmap` can be used, ``False``
+       otherwise
+    :rtype: boolean
+    """
+    return load_poppler_api() is not None
+
+
+def document_new_from_mmap(data):
+    """
+    Open a document from a memory-mapped file, without copying it. The mapping
+    must be kept open as long as the document is used.
+
+    :param data: the mapping of the file, which must be writable (e.g. opened
+       with :const:`mmap.ACCESS_COPY`) so that its address can be taken
+    :type  data: :class:`mmap.mmap`
+    :return: the document
+    :rtype: :class:`poppler.Document`
+    :raise gobject.GError: if the document can't be opened
+    :raise ValueError: if memory-mapped files are not supported (see
+       :func:`mmap_available`)
+    """
+    api = load_poppler_api()
+    if api is None:
+        raise ValueError("Memory-mapped files are not supported: libpoppler-glib could not be loaded")
+    ctypes = api["ctypes"]
+
+    buf = (ctypes.c_char * len(data)).from_buffer(data)
+    error = ctypes.POINTER(api["GError"])()
+    ptr = api["new_from_data"](ctypes.addressof(buf), len(data), None, ctypes.byref(error))
+    del buf
+    if not ptr:
+        message = error.contents.message if error else "unknown error"
+        if error:
+            api["error_free"](error)
+        raise gobject.GError(message)
+
+    # The wrapper holds its own reference
+    doc = api["newgobj"](ptr)
+    api["unref"](ptr)
+    return doc
+
+
+#: Width (in pixels) of the small renders used to compute page fingerprints
+FINGERPRINT_WIDTH = 64
+
+
+def fingerprint_pages(doc, page_notes, full):
+    """
+    Compute the fingerprint of the pages of a document (see
+    :meth:`Page.fingerprint`).
+
+    The small render of a page re-decodes all its images, which is slow for
+    large scanned documents. Unless ``full`` is ``True``, only the pages whose
+    :meth:`~Page.summary` is shared with another page are rendered, since they
+    are the only ones which may be identical to another page: the fingerprint
+    of the other pages is their summary.
+
+    :param doc: the PDF document
+    :type  doc: :class:`poppler.Document`
+    :param page_notes: layout of each page (see
+       :attr:`Document.page_notes`)
+    :type  page_notes: list of booleans
+    :param full: ``True`` if all the pages must be rendered, which is needed to
+       compare them with another version of the document
+    :type  full: boolean
+    :return: the fingerprint of each page, the time it took to render it
+       (``None`` for the pages that were not rendered), and the time it took
+       to compute its summary
+    :rtype: (list of strings, list of floats, list of floats)
+    """
+    pages = [Page(doc, i, notes) for i, notes in enumerate(page_notes)]
+    summaries = []
+    summary_times = []
+    for page in pages:
+        start = time.time()
+        summaries.append(page.summary())
+        summary_times.append(time.time() - start)
+    shared = collections.Counter(summaries)
+
+    fingerprints = []
+    times = []
+    for page, summary in zip(pages, summaries):
+        if full or shared[summary] > 1:
+            start = time.time()
+            fingerprints.append(page.fingerprint(summary))
+            times.append(time.time() - start)
+        else:
+            fingerprints.append(summary)
+            times.append(None)
+    return fingerprints, times, summary_times
+
 
 class Link:
     """This class encapsulates one hyperlink of the document."""
@@ -115,16 +309,21 @@ class Page:
     pw = 0.
     #: Page height as a float
     ph = 0.
+    #: Whether this page is made of a content half and a notes half
+    notes = False
 
-    def __init__(self, doc, number):
+    def __init__(self, doc, number, notes=False):
         """
         :param doc: the PDF document
         :type  doc: :class:`poppler.Document`
         :param number: number of the page to fetch in the document
         :type  number: integer
+        :param notes: ``True`` if the page has notes, ``False`` otherwise
+        :type  notes: boolean
         """
         self.page = doc.get_page(number)
         self.page_nb = number
+        self.notes = notes
 
         # Read page size
         self.pw, self.ph = self.page.get_size()
@@ -174,6 +373,85 @@ class Page:
 
         return None
 
+    def layout_type(self, type):
+        """
+        Get the type of document that is actually used to display this page.
+
+        Pages without notes are always displayed as regular pages, even when
+        the UI asks for their content or notes half: this way, slides without
+        notes in a document with notes are displayed correctly.
+
+        :param type: the type of document requested by the UI
+        :type  type: integer
+        :return: the type of document to use for this page
+        :rtype: integer
+        """
+        if self.notes:
+            return type
+        else:
+            return PDF_REGULAR
+
+    def get_text(self):
+        """Get the text of the page.
+
+        :return: the text of the whole page
+        :rtype: string
+        """
+        try:
+            text = self.page.get_text()
+        except TypeError:
+            # Older poppler-python versions need a selection style and area
+            rect = poppler.Rectangle()
+            rect.x1, rect.y1, rect.x2, rect.y2 = 0, 0, self.pw, self.ph
+            text = self.page.get_text(poppler.SELECTION_GLYPH, rect)
+
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        return text or ""
+
+    def summary(self):
+        """
+        Compute a cheap fingerprint of the page, from its size, layout, links
+        and text only. Two pages with different summaries are different, but
+        pages with the same summary may still differ by their images or
+        graphics (see :meth:`fingerprint`).
+
+        :return: the summary of the page
+        :rtype: string
+        """
+        h = hashlib.sha1()
+        h.update(repr((self.pw, self.ph, self.notes)))
+        for link in self.links:
+            h.update(repr((link.x1, link.y1, link.x2, link.y2, link.dest)))
+        h.update(self.get_text())
+        return h.hexdigest()
+
+    def fingerprint(self, summary=None):
+        """
+        Compute a fingerprint of the page contents.
+
+        Poppler does not give access to the content stream of the page, so the
+        fingerprint is computed from the :meth:`summary` of the page, and from a
+        very small render of the page.
+
+        :param summary: the summary of the page, if it is already known
+        :type  summary: string
+        :return: a fingerprint which only changes when the page changes
+        :rtype: string
+        """
+        h = hashlib.sha1()
+        h.update(summary or self.summary())
+
+        ww = FINGERPRINT_WIDTH
+        wh = max(1, int(round(ww * self.ph / self.pw)))
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, ww, wh)
+        cr = cairo.Context(surface)
+        self.render_cairo(cr, ww, wh)
+        surface.flush()
+        h.update(str(surface.get_data()))
+
+        return h.hexdigest()
+
     def get_size(self, type=PDF_REGULAR):
         """Get the page size.
 
@@ -182,6 +460,7 @@ class Page:
         :return: page size
         :rtype: (float, float)
         """
+        type = self.layout_type(type)
         if type == PDF_REGULAR:
             return (self.pw, self.ph)
         else:
@@ -195,6 +474,7 @@ class Page:
         :return: page aspect ratio
         :rtype: float
         """
+        type = self.layout_type(type)
         if type == PDF_REGULAR:
             return self.pw / self.ph
         else:
@@ -213,6 +493,7 @@ class Page:
         :type  type: integer
         """
 
+        type = self.layout_type(type)
         pw, ph = self.get_size(type)
 
         cr.set_source_rgb(1, 1, 1)
@@ -238,6 +519,11 @@ class Page:
 class Document:
     """This is the main document handling class.
 
+    A document does not depend on any GUI: it is opened with :meth:`open` (or
+    :meth:`open_async` in a GLib main loop), and the object that displays it, if
+    any, is notified of what happens through a listener (see
+    :meth:`set_listener`).
+
     .. note:: The internal page numbering scheme is the same as in Poppler: it
        starts at 0.
     """
@@ -248,53 +534,340 @@ class Document:
     nb_pages = -1
     #: Number of the current page
     cur_page = -1
-    #: Document with notes or not
+    #: Document with notes or not (i.e. at least one of its pages has notes)
     notes = False
+    #: Layout of each page: list of booleans, ``True`` for pages with notes
+    page_notes = []
     #: Pages cache (dictionary of :class:`pympress.document.Page`). This makes
     #: navigation in the document faster by avoiding calls to Poppler when loading
     #: a page that has already been loaded.
     pages_cache = {}
-    #: Instance of :class:`pympress.ui.UI` used when opening a document
-    ui = None
-
-    def __init__(self, uri, page=0):
+    #: Object notified of the events of the document (e.g. a
+    #: :class:`pympress.ui.UI` instance), or ``None``. See
+    #: :meth:`set_listener` for the methods it must implement.
+    listener = None
+    #: URI of the PDF file
+    uri = None
+    #: Path of the PDF file
+    path = None
+    #: :class:`~pympress.util.TrackedLock` used to manage concurrent
+    #: accesses to the document
+    lock = None
+    #: Number of times the document has been reloaded. This allows other threads
+    #: to detect that the document has changed while they were using it.
+    generation = 0
+    #: Fingerprint of each page (see :meth:`pympress.document.Page.fingerprint`),
+    #: used to detect which pages have been modified when the document is
+    #: reloaded, and which pages are identical. Empty if the fingerprints are
+    #: not known yet.
+    fingerprints = []
+    #: Number of the first page identical to each page (i.e. with the same
+    #: fingerprint), see :meth:`canonical_page`. Empty if the fingerprints are
+    #: not known yet.
+    canonical = []
+    #: Time (in seconds) it took to compute the fingerprint of each page, which
+    #: includes a small render: it gives an early estimate of how expensive the
+    #: page is to render (see :meth:`fingerprint_time`). ``None`` for the pages
+    #: that were not rendered (see :func:`fingerprint_pages`), empty if the
+    #: fingerprints are not known yet.
+    fingerprint_times = []
+    #: Time (in seconds) it took to compute the summary of each page (see
+    #: :meth:`pympress.document.Page.summary`): Poppler then reads the whole
+    #: content of the page, but does not draw it. It gives an estimate of how
+    #: expensive the pages that are not rendered for their fingerprint are (see
+    #: :meth:`summary_time`). Empty if the fingerprints are not known yet.
+    summary_times = []
+    #: :class:`~pympress.watcher.FileWatcher` used to reload the document when
+    #: the file is modified, or ``None``
+    watcher = None
+    #: Read-only :class:`mmap.mmap` of the PDF file, shared by all users of
+    #: :attr:`doc`, or ``None`` if the file is read by Poppler itself
+    data = None
+    #: Whether the document must be reloaded when the file is modified (this
+    #: needs a GLib main loop)
+    watch = False
+    #: Whether the file must be mapped in memory (see :meth:`open_file`)
+    use_mmap = False
+    #: Time at which pympress was started, used to report how long the startup
+    #: steps take, or ``None`` if they must not be reported
+    start_time = None
+
+    def __init__(self, uri, page=0, watch=False, use_mmap=False, start_time=None):
         """
         :param uri: URI to the PDF file to open (local only, starting with
            :file:`file://`)
         :type  uri: string
         :param page: page number to which the file should be opened
         :type  page: integer
+        :param watch: ``True`` if the document must be reloaded each time the
+           file is modified, ``False`` otherwise
+        :type  watch: boolean
+        :param use_mmap: ``True`` if the file must be mapped in memory once
+           instead of being read by Poppler (see :meth:`open_file`)
+        :type  use_mmap: boolean
+        :param start_time: see :attr:`start_time`
+        :type  start_time: float
         """
 
         # Check poppler-python version -- we need Bazaar rev. 62
         if not pympress.util.poppler_links_available():
             print >>sys.stderr, "Hyperlink support not found in poppler-python -- be sure to use at least bazaar rev. 62 to have them working"
 
-        # Open PDF file
-        self.doc = poppler.document_new_from_file(uri, None)
-
-        # Pages number
-        self.nb_pages = self.doc.get_n_pages()
+        self.uri = uri
+        self.path = uri[len("file://"):] if uri.startswith("file://") else uri
+        self.lock = pympress.util.TrackedLock("document lock")
+        self.watch = watch
+        self.start_time = start_time
 
         # Number of the current page
         self.cur_page = page
 
         # Pages cache
         self.pages_cache = {}
+        self.fingerprints = []
+        self.canonical = []
+        self.fingerprint_times = []
+        self.summary_times = []
 
-        # Guess if the document has notes
-        page0 = self.page(page)
-        if page0 is not None:
-            # "Regular" pages will have an apsect ratio of 4/3, 16/9, 16/10...
-            # Full A4 pages will have an aspect ratio < 1.
-            # So if the aspect ratio is >= 2, we can assume it is a document with notes.
-            ar = page0.get_aspect_ratio()
-            self.notes = (ar >= 2)
+        if watch and use_mmap:
+            raise ValueError("Memory-mapped files can't be reloaded")
+        self.use_mmap = use_mmap
 
-        # Create windows
-        self.ui = pympress.ui.UI(self)
-        self.ui.on_page_change(False)
-        self.ui.run()
+    def set_listener(self, listener):
+        """
+        Set the object notified of the events of the document. It must
+        implement the following methods, which are always called from the
+        thread that uses the document (i.e. the main loop):
+
+        - ``on_document_ready()``: the document has been opened;
+        - ``on_open_failed(message)``: the document could not be opened;
+        - ``on_page_change()``: the current page has changed;
+        - ``on_document_reload(mapping)``: the document has been reloaded (see
+          :meth:`swap`).
+
+        :param listener: see :attr:`listener`
+        :type  listener: object
+        """
+        self.listener = listener
+
+    def open(self):
+        """
+        Open the PDF file, and wait until it is opened.
+
+        :raise gobject.GError: if the file can't be opened
+        """
+        self.on_open(*self.read())
+
+    def open_async(self):
+        """
+        Open the PDF file in a background thread. The document is then handed
+        to the GLib main loop (see :meth:`on_open`), so this must only be used
+        when such a loop is running (or about to run).
+        """
+        thread = threading.Thread(target=self.opener)
+        thread.daemon = True
+        thread.start()
+
+    def read(self):
+        """
+        Open the PDF file and guess which pages have notes.
+
+        :return: the document, the memory-mapped file (see :meth:`open_file`)
+           and the layout of each page (see :attr:`page_notes`)
+        :rtype: (:class:`poppler.Document`, :class:`mmap.mmap`, list of booleans)
+        :raise gobject.GError: if the file can't be opened
+        """
+        doc, data = self.open_file(self.use_mmap)
+        self.report_time("Document opened")
+
+        # Guess which pages have notes, all at once
+        sizes = [doc.get_page(i).get_size() for i in range(doc.get_n_pages())]
+        page_notes = guess_notes_layout(sizes)
+        return doc, data, page_notes
+
+    def opener(self):
+        """
+        Open the PDF file (see :meth:`read`) in a background thread, and hand it
+        to the main loop.
+        """
+        try:
+            result = self.read()
+        except (gobject.GError, EnvironmentError, ValueError), e:
+            gobject.idle_add(self.on_open_failed, "Could not open %s: %s" % (self.path, e))
+            return
+
+        gobject.idle_add(self.on_open, *result)
+
+    def on_open_failed(self, message):
+        """
+        Tell the listener that the document could not be opened.
+
+        :param message: the error message
+        :type  message: string
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        if self.listener is not None:
+            self.listener.on_open_failed(message)
+        else:
+            print >>sys.stderr, message
+        return False
+
+    def on_open(self, doc, data, page_notes):
+        """
+        Start using the document once it has been opened: tell the listener
+        (which displays the current page), and in watch mode, start watching
+        the file once the main loop is idle.
+
+        :param doc: the opened document
+        :type  doc: :class:`poppler.Document`
+        :param data: the memory-mapped file, or ``None`` (see :meth:`open_file`)
+        :type  data: :class:`mmap.mmap`
+        :param page_notes: see :attr:`page_notes`
+        :type  page_notes: list of booleans
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        with self.lock:
+            self.doc, self.data = doc, data
+            self.nb_pages = doc.get_n_pages()
+            self.page_notes = page_notes
+            self.notes = True in page_notes
+            self.cur_page = max(0, min(self.cur_page, self.nb_pages - 1))
+
+        if self.listener is not None:
+            self.listener.on_document_ready()
+            self.report_time("First slide displayed")
+
+        if self.watch:
+            gobject.idle_add(self.start_watching, priority=gobject.PRIORITY_LOW)
+        return False
+
+    def start_watching(self):
+        """
+        Start watching the file for modifications, and compute the fingerprints
+        of the current version of the document.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        # Only needed in watch mode
+        import pympress.watcher
+        self.watcher = pympress.watcher.FileWatcher(self.path, self.reload)
+        return self.start_fingerprinting()
+
+    def start_fingerprinting(self):
+        """
+        Compute the fingerprints of the pages of the document in the
+        background. All the pages are rendered only in watch mode, where the
+        fingerprints are needed to compare the document with its next version
+        (see :func:`fingerprint_pages`).
+
+        This is done automatically in watch mode. Otherwise, the fingerprints
+        are only used to share the renders of identical pages and to estimate
+        render costs, so it is up to the user of the document (e.g. the GUI) to
+        call this method once the document is open.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        self.start_loader(False)
+        return False
+
+    def set_fingerprints(self, fingerprints, times, summary_times):
+        """
+        Set the fingerprints of the pages of the document, and find which pages
+        are identical. Must be called with :attr:`lock` acquired.
+
+        :param fingerprints: see :attr:`fingerprints`
+        :type  fingerprints: list of strings
+        :param times: see :attr:`fingerprint_times`
+        :type  times: list of floats
+        :param summary_times: see :attr:`summary_times`
+        :type  summary_times: list of floats
+        """
+        first = {}
+        self.canonical = [first.setdefault(fp, number) for number, fp in enumerate(fingerprints)]
+        self.fingerprints = fingerprints
+        self.fingerprint_times = times
+        self.summary_times = summary_times
+
+    def canonical_page(self, number):
+        """
+        Get the number of the first page identical to a page, so that identical
+        pages (e.g. repeated section dividers or outlines) can share the same
+        renders.
+
+        :param number: number of the page
+        :type  number: integer
+        :return: the number of the first page with the same fingerprint, or
+           ``number`` itself if the fingerprints are not known yet
+        :rtype: integer
+        """
+        canonical = self.canonical
+        if 0 <= number < len(canonical):
+            return canonical[number]
+        return number
+
+    def fingerprint_time(self, number):
+        """
+        Get the time it took to compute the fingerprint of a page. Complex pages
+        (large images, detailed vector graphics...) take much longer than
+        simple ones, so this is a rough estimate of the cost of rendering the
+        page before it has ever been rendered.
+
+        :param number: number of the page
+        :type  number: integer
+        :return: the time in seconds, or ``None`` if the fingerprints are not
+           known yet or if the page was not rendered to compute its fingerprint
+        :rtype: float
+        """
+        times = self.fingerprint_times
+        if 0 <= number < len(times):
+            return times[number]
+        return None
+
+    def summary_time(self, number):
+        """
+        Get the time it took to compute the summary of a page (see
+        :attr:`summary_times`). It is known for all the pages, even those that
+        were not rendered to compute their fingerprint, but it is a less
+        accurate estimate of the cost of rendering the page than
+        :meth:`fingerprint_time`.
+
+        :param number: number of the page
+        :type  number: integer
+        :return: the time in seconds, or ``None`` if the fingerprints are not
+           known yet
+        :rtype: float
+        """
+        times = self.summary_times
+        if 0 <= number < len(times):
+            return times[number]
+        return None
+
+    def is_open(self):
+        """Tell if the document has been opened.
+
+        :return: ``True`` if the document is open and can be used, ``False``
+           if it is still being opened
+        :rtype: boolean
+        """
+        return self.doc is not None
+
+    def report_time(self, step):
+        """
+        Print how long it took to reach a step of the startup, and how many
+        page faults occurred so far, if :attr:`start_time` is set.
+
+        :param step: description of the step that has just been reached
+        :type  step: string
+        """
+        if self.start_time is None:
+            return
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        print "%s after %.3f s (%d major / %d minor page faults)" \
+            % (step, time.time() - self.start_time, usage.ru_majflt, usage.ru_minflt)
 
     def has_notes(self):
         """Get the document mode.
@@ -304,6 +877,176 @@ class Document:
         """
         return self.notes
 
+    def page_has_notes(self, number):
+        """Get the layout of a page.
+
+        :param number: number of the page
+        :type  number: integer
+        :return: ``True`` if the page has notes, ``False`` otherwise
+        :rtype: boolean
+        """
+        return self.page_notes[number]
+
+    def open_file(self, use_mmap=False):
+        """
+        Open the PDF file with Poppler.
+
+        If ``use_mmap`` is ``True``, the file is mapped in memory (as a private
+        mapping, which is never written back to the file) and Poppler reads the
+        document from this buffer (see :func:`document_new_from_mmap`). The file is then only
+        read from disk when a page is accessed for the first time, which is much
+        faster for large files on network filesystems. Once the document is
+        open, the other :class:`poppler.Document` instances opened with
+        ``use_mmap`` (e.g. by the fingerprinting thread or by the search index)
+        are built from the same mapping (:attr:`data`), so the file is only read
+        once.
+
+        .. warning:: A memory-mapped file must not be modified while it is
+           open: accessing a truncated file crashes the program. This is why it
+           can't be used together with automatic reloading.
+
+        :param use_mmap: ``True`` if the file must be mapped in memory,
+           ``False`` if it should be read by Poppler itself
+        :type  use_mmap: boolean
+        :return: the document, and the memory-mapped file (or ``None``), which
+           must be kept as long as the document is used
+        :rtype: (:class:`poppler.Document`, :class:`mmap.mmap`)
+        :raise gobject.GError: if the file can't be opened
+        :raise ValueError: if ``use_mmap`` is ``True`` but memory-mapped files
+           are not supported (see :func:`mmap_available`)
+        """
+        if not use_mmap:
+            return poppler.document_new_from_file(self.uri, None), None
+
+        data = self.data
+        if data is None:
+            # A private mapping is never written to the file, but it is
+            # writable, which is needed to pass its address to Poppler
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        return document_new_from_mmap(data), data
+
+    def reload(self):
+        """
+        Reload the document after the file has been modified.
+
+        The new version of the file is opened and fingerprinted in a background
+        thread, and then replaces the current one in the main loop (see
+        :meth:`swap`).
+        """
+        self.start_loader(True)
+
+    def start_loader(self, reload):
+        """
+        Start a thread that will open the file and compute the fingerprint of
+        each page (see :meth:`loader`).
+
+        :param reload: ``True`` if the document must be replaced by the new
+           version of the file, ``False`` if only the fingerprints of the
+           current document must be computed
+        :type  reload: boolean
+        """
+        thread = threading.Thread(target=self.loader, args=(reload, self.generation))
+        thread.daemon = True
+        thread.start()
+
+    def loader(self, reload, generation):
+        """
+        Open the file and compute the fingerprint of each page.
+
+        This is meant to be run in a background thread. It uses its own
+        :class:`poppler.Document`, so it does not interfere with rendering. If
+        the file is modified while it is being read, the results are discarded:
+        the :attr:`watcher` will trigger another reload anyway.
+
+        :param reload: see :meth:`start_loader`
+        :type  reload: boolean
+        :param generation: value of :attr:`generation` when the thread started
+        :type  generation: integer
+        """
+        import pympress.watcher
+        state = pympress.watcher.file_state(self.path)
+        try:
+            doc, data = self.open_file(self.use_mmap)
+        except gobject.GError, e:
+            print >>sys.stderr, "Could not open %s: %s" % (self.path, e)
+            return
+
+        nb_pages = doc.get_n_pages()
+        sizes = [doc.get_page(i).get_size() for i in range(nb_pages)]
+        page_notes = guess_notes_layout(sizes)
+        fingerprints, times, summary_times = fingerprint_pages(doc, page_notes, self.watch)
+
+        if pympress.watcher.file_state(self.path) != state:
+            return
+
+        if reload:
+            gobject.idle_add(self.swap, doc, page_notes, fingerprints, times, summary_times)
+        else:
+            with self.lock:
+                if self.generation == generation:
+                    self.set_fingerprints(fingerprints, times, summary_times)
+
+    def swap(self, doc, page_notes, fingerprints, times, summary_times):
+        """
+        Replace the current document with a new version of the same file.
+
+        Pages that did not change (i.e. have the same fingerprint) keep their
+        :class:`~pympress.document.Page` instance and their links, and the UI is
+        told which renders can be kept.
+
+        :param doc: the new version of the document
+        :type  doc: :class:`poppler.Document`
+        :param page_notes: layout of each page of the new version (see
+           :attr:`page_notes`)
+        :type  page_notes: list of booleans
+        :param fingerprints: fingerprint of each page of the new version
+        :type  fingerprints: list of strings
+        :param times: time it took to compute each fingerprint (see
+           :attr:`fingerprint_times`)
+        :type  times: list of floats
+        :param summary_times: time it took to compute the summary of each page
+           (see :attr:`summary_times`)
+        :type  summary_times: list of floats
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        # Find where each unchanged page was in the old version
+        old_numbers = {}
+        for number, fp in enumerate(self.fingerprints):
+            old_numbers.setdefault(fp, number)
+
+        mapping = {}
+        for number, fp in enumerate(fingerprints):
+            if number < len(self.fingerprints) and self.fingerprints[number] == fp:
+                mapping[number] = number
+            elif fp in old_numbers:
+                mapping[number] = old_numbers[fp]
+
+        with self.lock:
+            # Keep unchanged pages, but make them use the new document: the
+            # old one may be reading garbage from the modified file.
+            pages_cache = {}
+            for number, old_number in mapping.iteritems():
+                if number == old_number and number in self.pages_cache:
+                    page = self.pages_cache[number]
+                    page.page = doc.get_page(number)
+                    pages_cache[number] = page
+
+            self.doc = doc
+            self.nb_pages = doc.get_n_pages()
+            self.page_notes = page_notes
+            self.notes = True in page_notes
+            self.set_fingerprints(fingerprints, times, summary_times)
+            self.pages_cache = pages_cache
+            self.generation += 1
+            self.cur_page = max(0, min(self.cur_page, self.nb_pages - 1))
+
+        print "Reloaded %s: %d page(s) changed" % (self.path, self.nb_pages - len(mapping))
+        if self.listener is not None:
+            self.listener.on_document_reload(mapping)
+        return False
+
     def page(self, number):
         """Get the specified page.
 
@@ -316,7 +1059,7 @@ class Document:
             return None
 
         if not number in self.pages_cache:
-            self.pages_cache[number] = Page(self.doc, number)
+            self.pages_cache[number] = Page(self.doc, number, self.page_notes[number])
         return self.pages_cache[number]
 
 
@@ -359,7 +1102,8 @@ class Document:
 
         if number != self.cur_page:
             self.cur_page = number
-            self.ui.on_page_change()
+            if self.listener is not None:
+                self.listener.on_page_change()
 
     def goto_next(self):
         """Switch to the next page."""
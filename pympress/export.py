@@ -0,0 +1,239 @@
+#       export.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.export` -- headless export of pages to image files
+-----------------------------------------------------------------
+
+This module renders pages of a PDF file to image files without any GUI (it does
+not import GTK), e.g. to generate handouts or thumbnails for a website.
+
+Pages are rendered in parallel by a pool of processes, each of them with its own
+:class:`poppler.Document`, and each file is written by the process that rendered
+it, as soon as it is ready. Two formats are available:
+
+- ``png``: PNG images;
+- ``raw``: the uncompressed pixels, as 32-bit native-endian xRGB values, line
+  by line, without any header (the size of the image is part of the file name).
+"""
+
+import multiprocessing
+import os
+import os.path
+import time
+
+import poppler
+
+import pympress.pixbufcache
+
+from pympress.document import Document, Page
+from pympress.document import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
+
+#: Document types that can be exported, indexed by their names.
+TYPES = {
+    "regular": PDF_REGULAR,
+    "content": PDF_CONTENT_PAGE,
+    "notes":   PDF_NOTES_PAGE,
+}
+
+#: Available output formats.
+FORMATS = ("png", "raw")
+
+#: Default pattern of the names of the exported files. It is used with a
+#: dictionary containing the page number (``page``, starting at 1), the name of
+#: the type (``type``), the size of the image (``width`` and ``height``) and
+#: the file extension (``ext``).
+DEFAULT_NAME = "page-%(page)03d-%(type)s-%(width)dx%(height)d.%(ext)s"
+
+#: :class:`poppler.Document` used by the current worker process (see
+#: :func:`init_worker`).
+worker_doc = None
+
+
+def parse_range(spec, nb_pages):
+    """
+    Parse a page range such as ``1-10,15,20-``.
+
+    :param spec: the page range, with page numbers starting at 1, or ``None``
+       for all the pages
+    :type  spec: string
+    :param nb_pages: number of pages of the document
+    :type  nb_pages: integer
+    :return: numbers of the selected pages (starting at 0), in order
+    :rtype: list of integers
+    :raise ValueError: if the range is invalid
+    """
+    if not spec:
+        return range(nb_pages)
+
+    pages = set()
+    for part in spec.split(","):
+        first, sep, last = part.strip().partition("-")
+        first = int(first) if first else 1
+        last = (int(last) if last else nb_pages) if sep else first
+        if first < 1 or last > nb_pages or first > last:
+            raise ValueError("invalid page range: %s" % part)
+        pages.update(range(first - 1, last))
+    return sorted(pages)
+
+
+def parse_size(spec):
+    """
+    Parse an image size such as ``1024x768`` or ``160``.
+
+    :param spec: the size, as ``WIDTHxHEIGHT`` or ``WIDTH``
+    :type  spec: string
+    :return: the width and the height (``None`` if it must be computed from
+       the aspect ratio of each page)
+    :rtype: (integer, integer)
+    :raise ValueError: if the size is invalid
+    """
+    width, sep, height = spec.lower().partition("x")
+    width, height = int(width), int(height) if height else None
+    if width <= 0 or (height is not None and height <= 0):
+        raise ValueError("invalid size: %s" % spec)
+    return width, height
+
+
+def init_worker(uri):
+    """
+    Open the document in a worker process.
+
+    :param uri: URI of the PDF file
+    :type  uri: string
+    """
+    global worker_doc
+    worker_doc = poppler.document_new_from_file(uri, None)
+
+
+def render_job(job):
+    """
+    Render a page and write it to a file, in a worker process.
+
+    :param job: the page number, whether it has notes, the width and height of
+       the image (the height may be ``None``), the name of the document type,
+       the output format and the pattern of the file name (see
+       :const:`DEFAULT_NAME`), prefixed with the output directory
+    :type  job: tuple
+    :return: the page number, the path to the written file, and the time it
+       took in seconds
+    :rtype: (integer, string, float)
+    """
+    number, notes, width, height, type_name, fmt, pattern = job
+    start = time.time()
+
+    page = Page(worker_doc, number, notes)
+    type = TYPES[type_name]
+    if height is None:
+        height = max(1, int(round(width / page.get_aspect_ratio(type))))
+    surface = pympress.pixbufcache.render_surface(page, width, height, type)
+
+    path = pattern % {"page": number + 1, "type": type_name, "width": width,
+                      "height": height, "ext": fmt}
+    if fmt == "png":
+        surface.write_to_png(path)
+    else:
+        with open(path, "wb") as f:
+            f.write(str(surface.get_data()))
+
+    return number, path, time.time() - start
+
+
+def export(path, out_dir, pages=None, sizes=("1024",), types=("regular",), fmt="png",
+           name=DEFAULT_NAME, processes=None, verbose=True):
+    """
+    Export pages of a PDF file to image files.
+
+    :param path: path to the PDF file
+    :type  path: string
+    :param out_dir: directory in which the files are written (created if
+       needed)
+    :type  out_dir: string
+    :param pages: page range (see :func:`parse_range`)
+    :type  pages: string
+    :param sizes: sizes of the images (see :func:`parse_size`); each page is
+       exported once per size and per type
+    :type  sizes: list of strings
+    :param types: names of the document types to export (see :const:`TYPES`)
+    :type  types: list of strings
+    :param fmt: output format (see :const:`FORMATS`)
+    :type  fmt: string
+    :param name: pattern of the file names (see :const:`DEFAULT_NAME`)
+    :type  name: string
+    :param processes: number of worker processes, or ``None`` to use all the
+       processors
+    :type  processes: integer
+    :param verbose: ``True`` to print each file as soon as it is written
+    :type  verbose: boolean
+    :return: the number of written files
+    :rtype: integer
+    :raise ValueError: if a parameter is invalid
+    :raise gobject.GError: if the file can't be opened
+    """
+    if fmt not in FORMATS:
+        raise ValueError("invalid format: %s" % fmt)
+    for type_name in types:
+        if type_name not in TYPES:
+            raise ValueError("invalid type: %s" % type_name)
+    sizes = [parse_size(s) for s in sizes]
+    try:
+        name % {"page": 1, "type": types[0], "width": 1, "height": 1, "ext": fmt}
+    except (KeyError, ValueError, TypeError):
+        raise ValueError("invalid file name pattern: %s" % name)
+
+    uri = "file://" + os.path.abspath(path)
+    doc = Document(uri)
+    doc.open()
+    page_numbers = parse_range(pages, doc.pages_number())
+    page_notes = doc.page_notes
+    del doc
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    pattern = os.path.join(out_dir.replace("%", "%%"), name)
+    jobs = [(number, page_notes[number], width, height, type_name, fmt, pattern)
+            for number in page_numbers
+            for width, height in sizes
+            for type_name in types]
+
+    start = time.time()
+    pool = multiprocessing.Pool(processes, init_worker, (uri,))
+    try:
+        for done, (number, out_path, duration) in enumerate(pool.imap_unordered(render_job, jobs)):
+            if verbose:
+                print "[%d/%d] Page %d -> %s (%.3f s)" % (done + 1, len(jobs), number + 1, out_path, duration)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if verbose:
+        elapsed = time.time() - start
+        print "Exported %d file(s) in %.3f s (%.1f files/s)" % (len(jobs), elapsed, len(jobs) / max(elapsed, 1e-6))
+    return len(jobs)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,339 @@
+#       frames.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.frames` -- frame output for external programs
+------------------------------------------------------------
+
+This module publishes the frames displayed in the Content window, so that other
+programs on the same machine (e.g. a recorder streaming the talk) can get the
+exact pixels of the slides without capturing the screen.
+
+Frames are written in a ring buffer in shared memory (a file in
+:file:`/dev/shm`, mapped in memory by pympress and by the consumers), and each
+new frame is announced on a Unix socket. Consumers can use the pixels directly
+in the shared memory, without copying them.
+
+The shared memory contains a header of :const:`HEADER_SIZE` bytes (see
+:const:`HEADER`: magic string, version, number of slots, size of the pixel data
+of a slot, sequence number of the last frame), followed by the slots. Each slot
+has a header of :const:`SLOT_HEADER_SIZE` bytes (see :const:`SLOT`: sequence
+number of the frame, page number, width, height, stride, pixel format and time)
+followed by the pixel data. The pixels are 32-bit native-endian xRGB values
+(like :const:`cairo.FORMAT_RGB24`).
+
+The socket accepts any number of clients. Each of them receives text lines:
+
+- ``buffer PATH`` when it connects: the path to the shared memory;
+- ``resize`` when the layout of the shared memory changes (it must be mapped
+  again; since this notification may be missed too, consumers should also
+  check the slot size in the header before reading a slot);
+- ``frame SEQUENCE SLOT`` each time a new frame is available.
+
+The sequence number of a slot is 0 while it is being written. A consumer must
+check that it is still equal to the announced sequence number after using the
+pixels: otherwise, the slot has been overwritten meanwhile and the frame must be
+discarded. Notifications are never waited for: a consumer that does not read
+them fast enough misses some of them (it can still find the last frame in the
+header).
+
+See :program:`pympress-frames` (:file:`bin/pympress-frames`) for a reference
+consumer.
+"""
+
+import errno
+import mmap
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import time
+
+import gobject
+
+import pympress.stats
+
+#: Magic string at the beginning of the shared memory.
+MAGIC = "PYMPRESS"
+
+#: Version of the layout of the shared memory.
+VERSION = 1
+
+#: Header of the shared memory: magic string, version, number of slots, size
+#: of the pixel data of a slot, sequence number of the last frame.
+HEADER = struct.Struct("=8sIIIQ")
+
+#: Offset of the sequence number of the last frame in :const:`HEADER`.
+HEADER_SEQUENCE_OFFSET = 20
+
+#: Space reserved for the header of the shared memory.
+HEADER_SIZE = 64
+
+#: Header of a slot: sequence number, page number, width, height, stride,
+#: pixel format (see :const:`FORMAT_RGB24`) and time of the frame.
+SLOT = struct.Struct("=QiIIIId")
+
+#: Space reserved for the header of a slot.
+SLOT_HEADER_SIZE = 64
+
+#: Pixel format: 32-bit native-endian xRGB values.
+FORMAT_RGB24 = 0
+
+
+def slot_offset(index, slot_size):
+    """
+    Get the position of a slot in the shared memory.
+
+    :param index: index of the slot
+    :type  index: integer
+    :param slot_size: size of the pixel data of a slot
+    :type  slot_size: integer
+    :return: the offset of the header of the slot (its pixel data is
+       :const:`SLOT_HEADER_SIZE` bytes further)
+    :rtype: integer
+    """
+    return HEADER_SIZE + index * (SLOT_HEADER_SIZE + slot_size)
+
+
+def get_shm_path():
+    """
+    Get a path for the shared memory of the current process.
+
+    :return: a path in :file:`/dev/shm` if possible, or in the temporary
+       directory otherwise
+    :rtype: string
+    """
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "pympress-%d.frames" % os.getpid())
+
+
+class FramePublisher:
+    """Publication of frames in a shared-memory ring buffer."""
+
+    #: Number of slots of the ring buffer.
+    slots = 4
+
+    #: Size of the pixel data of each slot, in bytes (0 until the first frame
+    #: is published).
+    slot_size = 0
+
+    #: Sequence number of the last published frame.
+    sequence = 0
+
+    #: Path to the shared memory.
+    shm_path = None
+
+    #: File of the shared memory.
+    shm_file = None
+
+    #: :class:`mmap.mmap` of the shared memory, or ``None``.
+    mm = None
+
+    #: Path to the Unix socket.
+    socket_path = None
+
+    #: Listening :class:`socket.socket`.
+    server = None
+
+    #: Connected consumers, as a list of :class:`socket.socket`.
+    clients = []
+
+    def __init__(self, socket_path, shm_path=None, watch=True):
+        """
+        :param socket_path: see :attr:`socket_path`; an existing socket at this
+           path is replaced
+        :type  socket_path: string
+        :param shm_path: see :attr:`shm_path` (it must not exist); by default,
+           see :func:`get_shm_path`
+        :type  shm_path: string
+        :param watch: ``True`` to accept consumers from the GLib main loop,
+           ``False`` if :meth:`accept` is called by hand
+        :type  watch: boolean
+        :raise ValueError: if ``socket_path`` exists and is not a socket
+        :raise OSError: if the shared memory can't be created
+        :raise socket.error: if the socket can't be created
+        """
+        self.socket_path = socket_path
+        self.shm_path = shm_path or get_shm_path()
+        self.clients = []
+
+        if os.path.lexists(socket_path):
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise ValueError("%s exists and is not a socket" % socket_path)
+            os.unlink(socket_path)
+
+        # The frames may be confidential: only the current user can read them
+        fd = os.open(self.shm_path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0600)
+        self.shm_file = os.fdopen(fd, "w+b")
+
+        try:
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(socket_path)
+            self.server.listen(5)
+        except socket.error:
+            self.shm_file.close()
+            os.unlink(self.shm_path)
+            raise
+        self.server.setblocking(False)
+        if watch:
+            gobject.io_add_watch(self.server, gobject.IO_IN, self.on_connect)
+
+    def on_connect(self, source, condition):
+        """
+        Accept new consumers, when called by the GLib main loop.
+
+        :return: ``True`` (to keep watching the socket)
+        :rtype: boolean
+        """
+        self.accept()
+        return True
+
+    def accept(self):
+        """Accept the pending connections of new consumers."""
+        while True:
+            try:
+                client, address = self.server.accept()
+            except socket.error, e:
+                if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    print >>sys.stderr, "Warning: Could not accept a frame consumer: %s" % e
+                return
+            client.setblocking(False)
+            self.clients.append(client)
+            self.send(client, "buffer %s\n" % self.shm_path)
+            pympress.stats.log("Frame consumer connected")
+
+    def send(self, client, message):
+        """
+        Send a message to a consumer, without waiting. Consumers that are gone
+        are forgotten.
+
+        :param client: the consumer
+        :type  client: :class:`socket.socket`
+        :param message: the message
+        :type  message: string
+        """
+        try:
+            client.send(message)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                pympress.stats.count("frame notifications dropped")
+                return
+            client.close()
+            self.clients.remove(client)
+            pympress.stats.log("Frame consumer disconnected")
+
+    def notify(self, message):
+        """
+        Send a message to all the consumers.
+
+        :param message: the message
+        :type  message: string
+        """
+        for client in list(self.clients):
+            self.send(client, message)
+
+    def allocate(self, size):
+        """
+        (Re)create the ring buffer, with slots of at least the given size, and
+        tell the consumers to map it again.
+
+        :param size: size of the pixel data of a frame
+        :type  size: integer
+        """
+        self.slot_size = (size + mmap.PAGESIZE - 1) / mmap.PAGESIZE * mmap.PAGESIZE
+        total = slot_offset(self.slots, self.slot_size)
+        if self.mm is not None:
+            self.mm.close()
+        self.shm_file.truncate(total)
+        self.mm = mmap.mmap(self.shm_file.fileno(), total)
+        self.mm[0:HEADER.size] = HEADER.pack(MAGIC, VERSION, self.slots, self.slot_size, self.sequence)
+        self.notify("resize\n")
+
+    def publish(self, data, width, height, stride, page_nb):
+        """
+        Publish a frame.
+
+        :param data: the pixels (32-bit native-endian xRGB values)
+        :type  data: buffer
+        :param width: width of the frame in pixels
+        :type  width: integer
+        :param height: height of the frame in pixels
+        :type  height: integer
+        :param stride: size of a line of pixels, in bytes
+        :type  stride: integer
+        :param page_nb: number of the page displayed in the frame
+        :type  page_nb: integer
+        """
+        size = stride * height
+        if size > self.slot_size:
+            self.allocate(size)
+
+        self.sequence += 1
+        index = self.sequence % self.slots
+        offset = slot_offset(index, self.slot_size)
+
+        mm = self.mm
+        mm[offset:offset + 8] = struct.pack("=Q", 0)
+        mm.seek(offset + SLOT_HEADER_SIZE)
+        mm.write(data)
+        mm[offset:offset + SLOT.size] = SLOT.pack(self.sequence, page_nb, width, height, stride,
+                                                  FORMAT_RGB24, time.time())
+        mm[HEADER_SEQUENCE_OFFSET:HEADER_SEQUENCE_OFFSET + 8] = struct.pack("=Q", self.sequence)
+
+        self.notify("frame %d %d\n" % (self.sequence, index))
+        pympress.stats.count("frames published")
+
+    def publish_surface(self, surface, page_nb):
+        """
+        Publish a rendered page.
+
+        :param surface: the rendered page
+        :type  surface: :class:`cairo.ImageSurface`
+        :param page_nb: number of the page
+        :type  page_nb: integer
+        """
+        surface.flush()
+        self.publish(surface.get_data(), surface.get_width(), surface.get_height(),
+                     surface.get_stride(), page_nb)
+
+    def close(self):
+        """Disconnect the consumers, and remove the socket and the shared memory."""
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        self.server.close()
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.shm_file.close()
+        for path in (self.socket_path, self.shm_path):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
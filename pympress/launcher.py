@@ -0,0 +1,100 @@
+#       launcher.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.launcher` -- presentation startup
+------------------------------------------------
+
+This module wires a :class:`~pympress.document.Document` and the GUI
+(:class:`~pympress.ui.UI`) together to run a presentation. The document itself
+does not know anything about the GUI, so it can also be used alone, e.g.::
+
+    doc = pympress.document.Document("file:///path/to/file.pdf")
+    doc.open()
+    page = doc.page(0)
+    page.render_cairo(cr, width, height)
+"""
+
+import sys
+
+import pympress.document
+
+
+def launch(uri, page=0, watch=False, use_mmap=False, start_time=None, watchdog=None, frame_socket=None):
+    """
+    Open a document and present it, until the GUI is closed.
+
+    The file is opened in the background while the windows are created, and
+    the first slide is displayed as soon as it is ready.
+
+    :param uri: URI to the PDF file to open (see
+       :class:`~pympress.document.Document`)
+    :type  uri: string
+    :param page: page number to which the file should be opened
+    :type  page: integer
+    :param watch: ``True`` if the document must be reloaded each time the file
+       is modified, ``False`` otherwise
+    :type  watch: boolean
+    :param use_mmap: ``True`` if the file must be mapped in memory (see
+       :meth:`~pympress.document.Document.open_file`)
+    :type  use_mmap: boolean
+    :param start_time: time at which pympress was started, to report how long
+       the startup takes, or ``None``
+    :type  start_time: float
+    :param watchdog: if not ``None``, report the stalls of the GUI longer than
+       this number of milliseconds (see :class:`pympress.watchdog.Watchdog`)
+    :type  watchdog: integer
+    :param frame_socket: if not ``None``, path to the Unix socket through which
+       the frames of the Content window are published (see
+       :mod:`pympress.frames`)
+    :type  frame_socket: string
+    :return: the document
+    :rtype: :class:`~pympress.document.Document`
+    """
+    doc = pympress.document.Document(uri, page, watch=watch, use_mmap=use_mmap, start_time=start_time)
+    doc.open_async()
+
+    # The GUI is only imported now, since it is slow to import: this is done
+    # while the file is being opened.
+    import pympress.ui
+    ui = pympress.ui.UI(doc)
+    doc.set_listener(ui)
+    if watchdog is not None:
+        import pympress.watchdog
+        pympress.watchdog.Watchdog(watchdog).start()
+    if frame_socket is not None:
+        import pympress.frames
+        try:
+            ui.frames = pympress.frames.FramePublisher(frame_socket)
+        except (ValueError, EnvironmentError), e:
+            print >>sys.stderr, "Warning: Could not publish the frames: %s" % e
+    try:
+        ui.run()
+    finally:
+        if ui.frames is not None:
+            ui.frames.close()
+    return doc
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
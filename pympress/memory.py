@@ -0,0 +1,323 @@
+#       memory.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.memory` -- system memory monitoring
+--------------------------------------------------
+
+This module contains the :class:`~pympress.memory.MemoryMonitor` class, which
+watches how much memory is left on the system, so that the caches of pympress
+can be shrunk before the system starts swapping (pympress often runs next to a
+browser or a video-call application, which use a lot of memory).
+
+Memory pressure is estimated from the memory available on the system (read from
+:file:`/proc/meminfo`) and, with Linux cgroups v2, from the pressure stall
+information of the cgroup of pympress (:file:`memory.pressure`). When the kernel
+allows it, a PSI trigger is registered so that the monitor is woken up as soon
+as the pressure rises, instead of noticing it at its next check. On systems
+without :file:`/proc`, the monitor does nothing.
+
+The memory used by pympress itself is taken into account too: when its resident
+set size grows much more than what the caches should use, the caches are shrunk
+even if the system still has memory to spare.
+"""
+
+import os
+import select
+import threading
+import time
+
+import pympress.stats
+
+#: Pressure levels
+NORMAL, HIGH, CRITICAL = range(3)
+
+#: Names of the pressure levels, for logging.
+LEVEL_NAMES = ("normal", "high", "critical")
+
+#: Proportion of their normal size that the caches may use at each pressure
+#: level.
+BUDGETS = (1.0, 0.5, 0.25)
+
+
+def read_meminfo():
+    """
+    Read the memory statistics of the system.
+
+    :return: values of :file:`/proc/meminfo` in kB, indexed by their names, or
+       ``None`` if they are not available
+    :rtype: dictionary
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            info = {}
+            for line in f:
+                name, sep, value = line.partition(":")
+                info[name] = int(value.split()[0])
+            return info
+    except (IOError, ValueError, IndexError):
+        return None
+
+
+def read_rss():
+    """
+    Get the resident set size of the current process.
+
+    :return: the RSS in bytes, or ``None`` if it is not available
+    :rtype: integer
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def get_pressure_path():
+    """
+    Find the :file:`memory.pressure` file of the cgroup v2 of the current
+    process.
+
+    :return: path to the file, or ``None`` if there is none
+    :rtype: string
+    """
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    path = "/sys/fs/cgroup%s/memory.pressure" % line[3:].strip().rstrip("/")
+                    if os.path.exists(path):
+                        return path
+    except IOError:
+        pass
+    if os.path.exists("/proc/pressure/memory"):
+        return "/proc/pressure/memory"
+    return None
+
+
+def read_pressure(path):
+    """
+    Read the pressure stall information for memory.
+
+    :param path: path to the file (see :func:`get_pressure_path`)
+    :type  path: string
+    :return: percentage of the last 10 seconds during which at least one task
+       was stalled waiting for memory, or ``None`` if it is not available
+    :rtype: float
+    """
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if fields and fields[0] == "some":
+                    return float(dict(fd.split("=") for fd in fields[1:])["avg10"])
+    except (IOError, ValueError, KeyError):
+        pass
+    return None
+
+
+class MemoryMonitor:
+    """Background monitoring of the memory pressure of the system."""
+
+    #: Time between two checks, in seconds (the PSI trigger, if any, wakes the
+    #: monitor up earlier).
+    interval = 5
+
+    #: Proportion of the memory of the system that must be available, below
+    #: which the pressure is considered high.
+    high_available = 0.15
+    #: Proportion of the memory of the system that must be available, below
+    #: which the pressure is considered critical.
+    critical_available = 0.05
+
+    #: Percentage of stalled time (see :func:`read_pressure`) above which the
+    #: pressure is considered high.
+    high_stall = 10.
+    #: Percentage of stalled time above which the pressure is considered
+    #: critical.
+    critical_stall = 40.
+
+    #: Number of consecutive checks at a lower level needed before going back
+    #: to it, so that the caches do not oscillate.
+    recovery_checks = 3
+
+    #: How many times the normal size of the caches (see :attr:`cache_size`)
+    #: the RSS of pympress may grow above :attr:`base_rss` before the pressure
+    #: is considered high.
+    high_rss = 2.
+    #: How many times the normal size of the caches the RSS of pympress may
+    #: grow above :attr:`base_rss` before the pressure is considered critical.
+    critical_rss = 4.
+
+    #: RSS of pympress when the monitor was started, before the caches were
+    #: filled, in bytes, or ``None``.
+    base_rss = None
+
+    #: Function returning the memory used by the caches at their normal size,
+    #: in bytes, or ``None`` if the RSS of pympress must not be taken into
+    #: account.
+    cache_size = None
+
+    #: PSI trigger registered on the cgroup: a stall of 150 ms within 1 s.
+    trigger = "some 150000 1000000"
+
+    #: Current pressure level (:const:`NORMAL`, :const:`HIGH` or
+    #: :const:`CRITICAL`).
+    level = NORMAL
+
+    #: Number of consecutive checks at a level lower than :attr:`level`.
+    lower_checks = 0
+
+    #: Path to the :file:`memory.pressure` file, or ``None``.
+    pressure_path = None
+
+    #: Function called (from the monitoring thread) with the new budget of the
+    #: caches (see :const:`BUDGETS`) each time the pressure level changes.
+    callback = None
+
+    def __init__(self, callback, cache_size=None):
+        """
+        :param callback: see :attr:`callback`
+        :type  callback: function
+        :param cache_size: see :attr:`cache_size`
+        :type  cache_size: function
+        """
+        self.callback = callback
+        self.cache_size = cache_size
+        if read_meminfo() is None:
+            return
+        self.pressure_path = get_pressure_path()
+        self.base_rss = read_rss()
+
+        thread = threading.Thread(target=self.monitor)
+        thread.daemon = True
+        thread.start()
+
+    def get_level(self):
+        """
+        Estimate the current memory pressure.
+
+        :return: the pressure level, and a description of the measures
+        :rtype: (integer, string)
+        """
+        level = NORMAL
+        details = []
+
+        info = read_meminfo()
+        if info is not None and info.get("MemTotal") and "MemAvailable" in info:
+            available = float(info["MemAvailable"]) / info["MemTotal"]
+            details.append("%d%% available" % (available * 100))
+            if available < self.critical_available:
+                level = CRITICAL
+            elif available < self.high_available:
+                level = HIGH
+
+        if self.pressure_path is not None:
+            stall = read_pressure(self.pressure_path)
+            if stall is not None:
+                details.append("%.1f%% stalled" % stall)
+                if stall > self.critical_stall:
+                    level = CRITICAL
+                elif stall > self.high_stall:
+                    level = max(level, HIGH)
+
+        rss = read_rss()
+        if rss is not None:
+            pympress.stats.record("process RSS (MB)", rss / 1048576.)
+            details.append("RSS %d MB" % (rss / 1048576))
+            if self.base_rss is not None and self.cache_size is not None:
+                growth = float(rss - self.base_rss) / max(1, self.cache_size())
+                if growth > self.critical_rss:
+                    level = CRITICAL
+                elif growth > self.high_rss:
+                    level = max(level, HIGH)
+
+        return level, ", ".join(details)
+
+    def check(self):
+        """
+        Check the memory pressure, and call :attr:`callback` if its level
+        changed. It rises immediately, but only goes down after
+        :attr:`recovery_checks` checks.
+        """
+        level, details = self.get_level()
+        if level < self.level:
+            self.lower_checks += 1
+            if self.lower_checks < self.recovery_checks:
+                return
+        elif level == self.level:
+            self.lower_checks = 0
+            return
+
+        self.lower_checks = 0
+        self.level = level
+        pympress.stats.count("memory pressure changes")
+        pympress.stats.log("Memory pressure %s (%s): caches limited to %d%%"
+                           % (LEVEL_NAMES[level], details, BUDGETS[level] * 100))
+        self.callback(BUDGETS[level])
+
+    def open_trigger(self):
+        """
+        Register a PSI trigger on :attr:`pressure_path`.
+
+        :return: the file on which the trigger is registered (to be polled for
+           ``POLLPRI`` events), or ``None`` if it is not possible
+        :rtype: file
+        """
+        if self.pressure_path is None or not hasattr(select, "poll"):
+            return None
+        try:
+            f = open(self.pressure_path, "r+")
+            f.write(self.trigger)
+            f.flush()
+            return f
+        except (IOError, OSError):
+            return None
+
+    def monitor(self):
+        """
+        Monitoring thread: check the memory pressure every :attr:`interval`
+        seconds, or as soon as the PSI trigger fires. It runs infinitely (until
+        the program ends).
+        """
+        trigger = self.open_trigger()
+        poll = None
+        if trigger is not None:
+            poll = select.poll()
+            poll.register(trigger.fileno(), select.POLLPRI)
+
+        while True:
+            if poll is not None:
+                events = poll.poll(self.interval * 1000)
+                if any(e & ~select.POLLPRI for fd, e in events):
+                    # The cgroup is gone: just check periodically
+                    poll = None
+                elif events:
+                    pympress.stats.count("memory pressure triggers")
+            else:
+                time.sleep(self.interval)
+            self.check()
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -23,32 +23,350 @@
 
 This modules contains stuff needed for caching pages and prerendering them. This
 is done by the :class:`~pympress.pixbufcache.PixbufCache` class, using several
-dictionaries of :class:`gtk.gdk.Pixbuf` for storing rendered pages.
+dictionaries of :class:`cairo.ImageSurface` for storing rendered pages. These
+surfaces live in the client (not in the X server), so they can be rendered
+without touching the display, and painted on any part of a widget.
 
 When used, the prerendering is done asynchronously in another thread.
 
-.. warning:: The prerendering code is currently quite dumb and does exactly what
-   it is told to do by the :class:`~pympress.ui.UI` class. So if told to eat all
-   the memory by prerendering all the pages in a 1000+ pages PDF document, it
-   *will* do so. A future version may however include some mechanism to limit
-   the memory consumption. But for now, be careful with the size of your
-   documents.
+Each widget keeps at most :attr:`~pympress.pixbufcache.PixbufCache.max_pages`
+pages: when there are more, the pages farthest from the current page are
+evicted. The surfaces of evicted pages are given back to a
+:class:`~pympress.pixbufcache.BufferPool`, and new pages are rendered in pooled
+surfaces of the same size, so navigating in a document does not allocate (and
+free) several megabytes for each page.
+
+Evicted pages are not lost, though: they are compressed in the background
+(rendered slides are mostly flat colors, which compress very well) and kept in
+a second tier, with its own memory budget. When such a page is needed again, it
+is simply decompressed instead of being rendered by Poppler.
+
+Consecutive pages are often almost identical (e.g. overlays in Beamer
+presentations), so renders are split in tiles (bands of a few lines), which are
+hashed. In the second tier, a page that only differs from one of its neighbours
+by a few tiles is stored as these tiles only (see :class:`~pympress.pixbufcache.CompressedPage`).
+The same hashes tell the GUI which parts of a widget must be repainted when
+going from a page to the next one (see
+:meth:`~pympress.pixbufcache.PixbufCache.dirty_area`).
+
+Pages are stored under the number of the first identical page of the document
+(see :meth:`pympress.document.Document.canonical_page`), so repeated pages
+(section dividers, outlines, blank slides...) are only rendered and stored once.
+
+Render times vary a lot between pages (a slide with a large photo or a complex
+plot can take 100 times longer than a slide of text), so the cache keeps a cost
+model of the pages: the render time of each page, or an estimate before it has
+been rendered. Expensive pages are prerendered earlier and further ahead, while
+cheap ones can be rendered at the last moment (see
+:meth:`~pympress.pixbufcache.PixbufCache.prerender_around`).
+
+Optionally, the idle time before a talk can be used to prerender the whole
+document in the second tier (see
+:meth:`~pympress.pixbufcache.PixbufCache.idle_prerenderer`).
+
+When the system runs short of memory, or when pympress itself uses much more
+memory than the caches should, both tiers are shrunk to a fraction of their
+normal size (see :mod:`pympress.memory`), and grow again when memory is
+available.
 """
 
+import itertools
+import math
+import os
 import Queue
+import sys
 import threading
 import time
+import zlib
+
+import cairo
+import gobject
+
+import pympress.memory
+import pympress.stats
+import pympress.util
+
+#: Priority of the jobs for pages that are needed right now
+URGENT    = 0
+#: Priority of the jobs for pages that will probably be needed soon
+PRERENDER = 1
+
+def render_surface(page, ww, wh, type, surface=None):
+    """
+    Render a page on a client-side surface.
+
+    :param page: the page to render
+    :type  page: :class:`pympress.document.Page`
+    :param ww: width of the surface in pixels
+    :type  ww: integer
+    :param wh: height of the surface in pixels
+    :type  wh: integer
+    :param type: the type of document that should be rendered
+    :type  type: integer
+    :param surface: surface of the right size to render the page on (its
+       previous content is erased), or ``None`` to use a new surface
+    :type  surface: :class:`cairo.ImageSurface`
+    :return: the rendered page
+    :rtype: :class:`cairo.ImageSurface`
+    """
+    if surface is None:
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, ww, wh)
+        cr = cairo.Context(surface)
+    else:
+        cr = cairo.Context(surface)
+        cr.set_source_rgb(0, 0, 0)
+        cr.paint()
+    page.render_cairo(cr, ww, wh, type)
+    surface.flush()
+    return surface
+
+
+#: Height (in lines of pixels) of the tiles used to compare renders of similar
+#: pages. Tiles span the whole width of the render: each of them is a
+#: contiguous block of memory, so that it can be hashed in one call.
+TILE_HEIGHT = 16
+
+
+def tile_rect(index, width, height):
+    """
+    Get the area covered by a tile of a rendered page.
+
+    :param index: index of the tile (tiles are numbered from the top)
+    :type  index: integer
+    :param width: width of the rendered page in pixels
+    :type  width: integer
+    :param height: height of the rendered page in pixels
+    :type  height: integer
+    :return: the area of the tile, as ``(x, y, width, height)``
+    :rtype: (integer, integer, integer, integer)
+    """
+    y = index * TILE_HEIGHT
+    return 0, y, width, min(TILE_HEIGHT, height - y)
+
+
+def tile_hashes(data, width, height, stride):
+    """
+    Compute a hash of each tile of a rendered page.
+
+    :param data: pixels of the rendered page
+    :type  data: string or buffer
+    :param width: width of the rendered page in pixels
+    :type  width: integer
+    :param height: height of the rendered page in pixels
+    :type  height: integer
+    :param stride: length of a line of pixels in bytes
+    :type  stride: integer
+    :return: the hash of each tile (tiles are numbered from the top)
+    :rtype: list of integers
+    """
+    # Hashing buffers avoids copying the pixels
+    return [zlib.crc32(buffer(data, y * stride, (min(height, y + TILE_HEIGHT) - y) * stride))
+            for y in range(0, height, TILE_HEIGHT)]
+
+
+def extract_tiles(data, tiles, width, height, stride):
+    """
+    Extract the pixels of some tiles of a rendered page.
+
+    :param data: pixels of the rendered page
+    :type  data: string
+    :param tiles: indices of the tiles to extract
+    :type  tiles: list of integers
+    :param width: width of the rendered page in pixels
+    :type  width: integer
+    :param height: height of the rendered page in pixels
+    :type  height: integer
+    :param stride: length of a line of pixels in bytes
+    :type  stride: integer
+    :return: the pixels of the tiles, one after the other
+    :rtype: string
+    """
+    parts = []
+    for index in tiles:
+        x, y, w, h = tile_rect(index, width, height)
+        parts.append(data[y * stride:(y + h) * stride])
+    return "".join(parts)
+
+
+def apply_tiles(data, tiles_data, tiles, width, height, stride):
+    """
+    Replace some tiles of a rendered page (see :func:`extract_tiles`).
+
+    :param data: pixels of the rendered page, modified in place
+    :type  data: bytearray
+    :param tiles_data: pixels of the tiles, as returned by
+       :func:`extract_tiles`
+    :type  tiles_data: string
+    :param tiles: indices of the tiles
+    :type  tiles: list of integers
+    :param width: width of the rendered page in pixels
+    :type  width: integer
+    :param height: height of the rendered page in pixels
+    :type  height: integer
+    :param stride: length of a line of pixels in bytes
+    :type  stride: integer
+    """
+    pos = 0
+    for index in tiles:
+        x, y, w, h = tile_rect(index, width, height)
+        data[y * stride:(y + h) * stride] = tiles_data[pos:pos + h * stride]
+        pos += h * stride
+
+
+def get_codec():
+    """
+    Get the functions used to compress the pages of the second tier of the
+    cache: LZ4 if `its Python bindings <https://github.com/python-lz4/python-lz4>`_
+    are available, fast zlib compression otherwise.
+
+    :return: compression and decompression functions, which take and return
+       strings
+    :rtype: (function, function)
+    """
+    try:
+        import lz4.block
+        return lz4.block.compress, lz4.block.decompress
+    except ImportError:
+        return (lambda data: zlib.compress(data, 1)), zlib.decompress
+
+
+class CompressedPage:
+    """
+    A page in the second tier of the cache: either a whole render, or the
+    tiles that differ from the render of a neighbouring page (its base).
+    """
+
+    #: Width of the render in pixels.
+    width = 0
+    #: Height of the render in pixels.
+    height = 0
+    #: Type of document of the render.
+    type = None
+    #: Length of a line of pixels in bytes.
+    stride = 0
+    #: Compressed pixels: the whole render, or the tiles listed in
+    #: :attr:`tiles` (see :func:`extract_tiles`).
+    data = None
+    #: Hashes of the tiles of the render (see :func:`tile_hashes`).
+    hashes = None
+    #: Number of the page whose render is the base of this one, or ``None`` if
+    #: :attr:`data` contains the whole render.
+    base = None
+    #: Indices of the tiles stored in :attr:`data`, if :attr:`base` is set.
+    tiles = None
+
+    def __init__(self, width, height, type, stride, data, hashes, base=None, tiles=None):
+        """
+        :param width: see :attr:`width`
+        :type  width: integer
+        :param height: see :attr:`height`
+        :type  height: integer
+        :param type: see :attr:`type`
+        :type  type: integer
+        :param stride: see :attr:`stride`
+        :type  stride: integer
+        :param data: see :attr:`data`
+        :type  data: string
+        :param hashes: see :attr:`hashes`
+        :type  hashes: list of integers
+        :param base: see :attr:`base`
+        :type  base: integer
+        :param tiles: see :attr:`tiles`
+        :type  tiles: list of integers
+        """
+        self.width, self.height, self.type, self.stride = width, height, type, stride
+        self.data, self.hashes = data, hashes
+        self.base, self.tiles = base, tiles
+
+    def size(self):
+        """
+        Get the memory used by the compressed pixels.
+
+        :return: size in bytes
+        :rtype: integer
+        """
+        return len(self.data)
+
+
+class BufferPool:
+    """Reusable surfaces, indexed by their size."""
+
+    #: Maximum memory used by the surfaces kept in the pool, in bytes.
+    max_memory = 64 * 1024 * 1024
+
+    #: Memory currently used by the surfaces kept in the pool, in bytes.
+    memory = 0
+
+    #: Available surfaces, as a dictionary of lists of
+    #: :class:`cairo.ImageSurface` indexed by ``(width, height)`` tuples.
+    buffers = {}
+
+    #: :class:`~threading.Lock` used to manage concurrent accesses to
+    #: :attr:`buffers` and :attr:`memory`.
+    lock = None
+
+    def __init__(self):
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    def get(self, width, height):
+        """
+        Get a surface from the pool, or allocate a new one if there is no
+        surface of this size in the pool.
+
+        :param width: width of the surface in pixels
+        :type  width: integer
+        :param height: height of the surface in pixels
+        :type  height: integer
+        :return: a surface, or ``None`` if a new one must be allocated
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        with self.lock:
+            available = self.buffers.get((width, height))
+            if available:
+                surface = available.pop()
+                self.memory -= surface.get_stride() * height
+                pympress.stats.count("render buffers reused")
+                return surface
+        pympress.stats.count("render buffers allocated")
+        return None
+
+    def put(self, surface):
+        """
+        Give a surface back to the pool, so that it can be reused.
+
+        The surface is only kept if nothing else uses it: the caller must not
+        keep any reference to it (e.g. ``pool.put(cache.pop(key))``). It is
+        simply forgotten if the pool is full.
+
+        :param surface: the surface to reuse
+        :type  surface: :class:`cairo.ImageSurface`
+        """
+        # References: the caller, the parameter and the argument of getrefcount
+        if sys.getrefcount(surface) > 3:
+            return
+
+        size = surface.get_stride() * surface.get_height()
+        with self.lock:
+            if self.memory + size > self.max_memory:
+                return
+            self.buffers.setdefault((surface.get_width(), surface.get_height()), []).append(surface)
+            self.memory += size
+
+    def clear(self):
+        """Forget all the surfaces of the pool."""
+        with self.lock:
+            self.buffers.clear()
+            self.memory = 0
 
-import pygtk
-pygtk.require('2.0')
-import gtk
 
 class PixbufCache:
     """Pages caching and prerendering made (almost) easy."""
 
     #: The actual cache. It is a dictionary of dictionaries: its keys are widget
     #: names and its values are dictionaries whose keys are page numbers and
-    #: values are instances of :class:`gtk.gdk.Pixbuf`.
+    #: values are instances of :class:`cairo.ImageSurface`. Pages are stored
+    #: under the number of the first identical page (see :meth:`key`).
     pixbuf_cache = {}
 
     #: Size of the different managed widgets, as a dictionary of tuples
@@ -56,35 +374,203 @@ class PixbufCache:
 
     #: Type of document handled by each widget. It is a dictionary: its keys are
     #: widget names and its values are document types
-    #: (:const:`~pympress.ui.PDF_REGULAR`, :const:`~pympress.ui.PDF_CONTENT_PAGE`
-    #: or :const:`~pympress.ui.PDF_NOTES_PAGE`).
+    #: (:const:`~pympress.document.PDF_REGULAR`,
+    #: :const:`~pympress.document.PDF_CONTENT_PAGE` or
+    #: :const:`~pympress.document.PDF_NOTES_PAGE`).
     pixbuf_type = {}
 
-    #: Dictionary of :class:`~threading.Lock`\ s used for managing conccurent
-    #: accesses to :attr:`pixbuf_cache`, :attr:`pixbuf_size`, and :attr:`jobs`.
+    #: Dictionary of :class:`~pympress.util.TrackedLock`\ s used for
+    #: managing conccurent accesses to :attr:`pixbuf_cache`,
+    #: :attr:`pixbuf_size`, and :attr:`jobs`.
     locks = {}
 
     #: Dictionaries of the prerendering threads.
     threads = {}
 
-    #: Dictionaries of :class:`~Queue.Queue`\ s used to store what has to
-    #: be prerendered by each thread.
+    #: Dictionaries of :class:`~Queue.PriorityQueue`\ s used to store what has
+    #: to be rendered by each thread. Jobs are ``(priority, sequence number,
+    #: page number)`` tuples, so that :const:`URGENT` jobs are handled before
+    #: :const:`PRERENDER` ones, and jobs with the same priority are handled in
+    #: order.
     jobs = {}
 
+    #: Counter used to generate the sequence numbers of the jobs.
+    job_counter = None
+
+    #: :class:`~pympress.util.TrackedLock` used to make sure only one
+    #: thread renders a page with Poppler at any given time.
+    render_lock = None
+
+    #: Function called (in the main loop) with a widget name and a page number
+    #: each time a page requested with :meth:`request` has been rendered, or
+    #: ``None``.
+    rendered_callback = None
+
+    #: :class:`~threading.Condition` notified each time a page has been
+    #: rendered by a prerendering thread (see :meth:`wait`).
+    rendered = None
+
     #: The current :class:`~pympress.document.Document`.
     doc = None
 
     #: :class:`~threading.Lock` used to manage conccurent accesses to
-    #: :attr:`doc`.
+    #: :attr:`doc` (this is the :attr:`~pympress.document.Document.lock` of the
+    #: document).
     doc_lock = None
 
-    def __init__(self, doc):
+    #: Maximum number of pages kept in the cache of each widget.
+    max_pages = 16
+
+    #: Minimum number of pages kept in the cache of each widget, even when the
+    #: system is short of memory.
+    min_pages = 3
+
+    #: Proportion of :attr:`max_pages` and :attr:`max_compressed_memory` that
+    #: may currently be used, lowered when the system is short of memory (see
+    #: :meth:`set_budget`).
+    budget = 1.0
+
+    #: :class:`~pympress.memory.MemoryMonitor` which calls :meth:`set_budget`.
+    monitor = None
+
+    #: Longest measured render time of each page, in seconds, indexed by page
+    #: keys (see :meth:`key`).
+    costs = {}
+
+    #: Ratio between the render time of a page and the time it took to compute
+    #: its fingerprint (see
+    #: :meth:`pympress.document.Document.fingerprint_time`), used to estimate
+    #: the cost of pages that have not been rendered yet. It is learned from
+    #: the pages that have been rendered.
+    cost_ratio = 10.
+
+    #: Ratio between the render time of a page and the time it took to compute
+    #: its summary (see
+    #: :meth:`pympress.document.Document.summary_time`), used to estimate the
+    #: cost of the pages that were not rendered to compute their fingerprint.
+    #: It is learned from the pages that have been rendered.
+    summary_ratio = 10.
+
+    #: Number of pages after the current one that are always prerendered.
+    prerender_ahead = 4
+
+    #: Number of pages after the current one that are prerendered if they are
+    #: expensive (see :attr:`expensive_cost`).
+    lookahead = 12
+
+    #: Estimated render time (in seconds) above which a page is expensive.
+    expensive_cost = 0.15
+
+    #: Shortest time expected to be spent on a slide, in seconds: a page ``n``
+    #: slides ahead may be needed in ``n`` times this time.
+    slide_time = 0.5
+
+    #: Whether the whole document must be prerendered in the second tier when
+    #: pympress is idle (see :meth:`idle_prerenderer`).
+    prerender_all = False
+
+    #: Time without navigation (in seconds) after which pympress is considered
+    #: idle.
+    idle_delay = 5
+
+    #: Load average per processor above which idle prerendering pauses.
+    max_load = 0.5
+
+    #: Maximum proportion of the time spent rendering by the idle prerendering
+    #: thread.
+    idle_duty = 0.5
+
+    #: Time between two checks of the load average, in seconds, while the
+    #: system is busy.
+    load_interval = 5
+
+    #: Number of processors kept busy by pympress itself, averaged like the
+    #: 1-minute load average (see :meth:`own_load`).
+    own_load_average = 0.
+
+    #: Time and CPU time of pympress at the last call of :meth:`own_load`, or
+    #: ``None``.
+    cpu_sample = None
+
+    #: Time of the last navigation event (see :meth:`prerender_around` and
+    #: :meth:`request`).
+    last_activity = 0
+
+    #: :class:`~threading.Event` set when the idle prerendering thread may have
+    #: something new to do (navigation, reload, change of the memory budget),
+    #: or ``None`` if it is not running.
+    idle_event = None
+
+    #: Hashes of the tiles of the pages of the first tier (see
+    #: :func:`tile_hashes`), as a dictionary of dictionaries (like
+    #: :attr:`pixbuf_cache`). Pages rendered by the GUI itself may have none.
+    hashes = {}
+
+    #: Second tier of the cache: compressed pages, as a dictionary of
+    #: dictionaries (like :attr:`pixbuf_cache`) whose values are
+    #: :class:`~pympress.pixbufcache.CompressedPage` instances. A page can be
+    #: in both tiers.
+    compressed = {}
+
+    #: Maximum proportion of tiles that may differ from the render of a
+    #: neighbouring page for a page to be stored as a delta in the second tier.
+    max_delta_ratio = 0.5
+
+    #: Memory used by the compressed pages, in bytes.
+    compressed_memory = 0
+
+    #: Maximum memory used by the compressed pages, in bytes.
+    max_compressed_memory = 128 * 1024 * 1024
+
+    #: :class:`~pympress.util.TrackedLock` used to manage concurrent accesses to
+    #: :attr:`compressed` and :attr:`compressed_memory`.
+    compressed_lock = None
+
+    #: :class:`~Queue.Queue` of the pages to compress. Jobs are ``[widget name,
+    #: page number, width, height, type, generation, hashes, surface]`` lists.
+    compress_jobs = None
+
+    #: Pages queued for compression, as a set of ``(widget name, page number)``
+    #: tuples, so that they are not considered missing from the cache while
+    #: they are in no tier. Protected by :attr:`compressed_lock`.
+    compressing = set()
+
+    #: Compression and decompression functions (see :func:`get_codec`).
+    codec = None
+
+    #: :class:`~pympress.pixbufcache.BufferPool` of the surfaces used for
+    #: rendering.
+    pool = None
+
+    def __init__(self, doc, rendered_callback=None):
         """
         :param doc: the current document
         :type  doc: :class:`pympress.document.Document`
+        :param rendered_callback: see :attr:`rendered_callback`
+        :type  rendered_callback: function
         """
         self.doc = doc
-        self.doc_lock = threading.Lock()
+        self.doc_lock = doc.lock
+        self.job_counter = itertools.count()
+        self.render_lock = pympress.util.TrackedLock("render lock")
+        self.rendered_callback = rendered_callback
+        self.rendered = threading.Condition()
+        self.pool = BufferPool()
+        self.compressed = {}
+        self.compressing = set()
+        self.costs = {}
+        self.compressed_lock = pympress.util.TrackedLock("compressed tier lock")
+        self.compress_jobs = Queue.Queue(0)
+        thread = threading.Thread(target=self.compressor)
+        thread.daemon = True
+        thread.start()
+        self.monitor = pympress.memory.MemoryMonitor(self.set_budget, self.normal_memory)
+        self.last_activity = time.time()
+        if self.prerender_all:
+            self.idle_event = threading.Event()
+            thread = threading.Thread(target=self.idle_prerenderer)
+            thread.daemon = True
+            thread.start()
 
     def add_widget(self, widget_name, type):
         """
@@ -103,16 +589,22 @@ class PixbufCache:
         self.pixbuf_cache[widget_name] = {}
         self.pixbuf_size[widget_name] = (-1, -1)
         self.pixbuf_type[widget_name] = type
-        self.locks[widget_name] = threading.Lock()
+        self.locks[widget_name] = pympress.util.TrackedLock("cache lock (%s)" % widget_name)
+        self.hashes[widget_name] = {}
+        self.compressed[widget_name] = {}
         self.threads[widget_name] = threading.Thread(target=self.renderer, args=(widget_name,))
         self.threads[widget_name].daemon = True
-        self.jobs[widget_name] = Queue.Queue(0)
+        self.jobs[widget_name] = Queue.PriorityQueue(0)
         self.threads[widget_name].start()
 
     def set_widget_type(self, widget_name, type):
         """
         Set the document type of a widget.
 
+        Only the cached pages that have notes are invalidated: pages without
+        notes are rendered the same way whatever the document type is, so their
+        entries in the second tier are simply given the new type.
+
         :param widget_name: string used to identify a widget
         :type  widget_name: string
         :param type: type of document handled by the widget (see :attr:`pixbuf_type`)
@@ -121,7 +613,19 @@ class PixbufCache:
         with self.locks[widget_name]:
             if self.pixbuf_type[widget_name] != type :
                 self.pixbuf_type[widget_name] = type
-                self.pixbuf_cache[widget_name].clear()
+                pc = self.pixbuf_cache[widget_name]
+                for page_nb in pc.keys():
+                    if self.doc.page_has_notes(page_nb):
+                        self.hashes[widget_name].pop(page_nb, None)
+                        self.pool.put(pc.pop(page_nb))
+                with self.compressed_lock:
+                    cc = self.compressed[widget_name]
+                    for page_nb in cc.keys():
+                        if self.doc.page_has_notes(page_nb):
+                            self.drop_compressed(widget_name, page_nb)
+                    # The other pages are still valid for the new type
+                    for entry in cc.itervalues():
+                        entry.type = type
 
     def get_widget_type(self, widget_name):
         """
@@ -147,8 +651,26 @@ class PixbufCache:
         """
         with self.locks[widget_name]:
             if (width, height) != self.pixbuf_size[widget_name]:
+                # Surfaces of the old size will probably never be reused
                 self.pixbuf_cache[widget_name].clear()
+                self.hashes[widget_name].clear()
                 self.pixbuf_size[widget_name] = (width, height)
+                with self.compressed_lock:
+                    cc = self.compressed[widget_name]
+                    self.compressed_memory -= sum(entry.size() for entry in cc.itervalues())
+                    cc.clear()
+
+    def key(self, page_nb):
+        """
+        Get the number under which a page is stored in the cache: the number of
+        the first identical page of the document.
+
+        :param page_nb: number of the page
+        :type  page_nb: integer
+        :return: the key of the page in the cache
+        :rtype: integer
+        """
+        return self.doc.canonical_page(page_nb)
 
     def get(self, widget_name, page_nb):
         """
@@ -159,14 +681,88 @@ class PixbufCache:
         :param page_nb: number of the page to fetch in the cache
         :type  page_nb: integer
         :return: the cached page if available, or ``None`` otherwise
-        :rtype: :class:`gtk.gdk.Pixbuf`
+        :rtype: :class:`cairo.ImageSurface`
         """
+        page_nb = self.key(page_nb)
         with self.locks[widget_name]:
-            pc = self.pixbuf_cache[widget_name]
-            if page_nb in pc:
-                return pc[page_nb]
-            else:
-                return None
+            pb = self.pixbuf_cache[widget_name].get(page_nb)
+        if pb is not None:
+            pympress.stats.count("cache hits")
+            return pb
+
+        pb = self.decompress(widget_name, page_nb)
+        if pb is not None:
+            pympress.stats.count("cache hits (compressed tier)")
+        else:
+            pympress.stats.count("cache misses")
+            if self.estimate_cost(page_nb) >= self.expensive_cost:
+                pympress.stats.count("cache misses (expensive pages)")
+        return pb
+
+    def lookup(self, widget_name, page_nb):
+        """
+        Fetch a page from the first tier of the cache only, without updating
+        the statistics.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to fetch in the cache
+        :type  page_nb: integer
+        :return: the cached page if available, or ``None`` otherwise
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        page_nb = self.key(page_nb)
+        with self.locks[widget_name]:
+            return self.pixbuf_cache[widget_name].get(page_nb)
+
+    def wait(self, widget_name, page_nb, timeout):
+        """
+        Wait until a page is available in the cache for the specified widget,
+        or until a timeout expires.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to fetch in the cache
+        :type  page_nb: integer
+        :param timeout: maximum time to wait, in seconds
+        :type  timeout: float
+        :return: the cached page if available in time, or ``None`` otherwise
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        end = time.time() + timeout
+        with self.rendered:
+            while True:
+                pb = self.lookup(widget_name, page_nb)
+                remaining = end - time.time()
+                if pb is not None or remaining <= 0:
+                    return pb
+                self.rendered.wait(remaining)
+
+    def get_substitute(self, widget_name, page_nb):
+        """
+        Find a page rendered for another widget that can be displayed (scaled)
+        instead of the page rendered for the specified widget.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to fetch in the cache
+        :type  page_nb: integer
+        :return: the biggest suitable cached page if there is one, or ``None``
+           otherwise
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        type = self.pixbuf_type[widget_name]
+        notes = self.doc.page_has_notes(page_nb)
+        best = None
+        for name in self.pixbuf_cache:
+            # Pages without notes are rendered the same way whatever the
+            # document type is
+            if name == widget_name or (notes and self.pixbuf_type[name] != type):
+                continue
+            pb = self.lookup(name, page_nb)
+            if pb is not None and (best is None or pb.get_width() > best.get_width()):
+                best = pb
+        return best
 
     def set(self, widget_name, page_nb, val):
         """
@@ -177,11 +773,435 @@ class PixbufCache:
         :param page_nb: number of the page to store in the cache
         :type  page_nb: integer
         :param val: content to store in the cache
-        :type  val: :class:`gtk.gdk.Pixbuf`
+        :type  val: :class:`cairo.ImageSurface`
         """
+        page_nb = self.key(page_nb)
         with self.locks[widget_name]:
             pc = self.pixbuf_cache[widget_name]
             pc[page_nb] = val
+            self.hashes[widget_name].pop(page_nb, None)
+            self.shrink(widget_name)
+
+    def dirty_area(self, widget_name, old_nb, new_nb):
+        """
+        Find which parts of a widget must be repainted to go from a page to
+        another one, by comparing the hashes of the tiles of their renders.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param old_nb: number of the page currently displayed
+        :type  old_nb: integer
+        :param new_nb: number of the page to display
+        :type  new_nb: integer
+        :return: the areas that differ, as ``(x, y, width, height)`` tuples
+           (consecutive tiles are merged), or ``None`` if the
+           renders can't be compared
+        :rtype: list of tuples
+        """
+        old_nb, new_nb = self.key(old_nb), self.key(new_nb)
+        if old_nb == new_nb:
+            return []
+        with self.locks[widget_name]:
+            old = self.hashes[widget_name].get(old_nb)
+            new = self.hashes[widget_name].get(new_nb)
+            ww, wh = self.pixbuf_size[widget_name]
+        if old is None or new is None or len(old) != len(new):
+            return None
+
+        rects = []
+        for index in [i for i in range(len(new)) if old[i] != new[i]]:
+            x, y, w, h = tile_rect(index, ww, wh)
+            if rects and rects[-1][1] + rects[-1][3] == y:
+                rects[-1] = (x, rects[-1][1], w, rects[-1][3] + h)
+            else:
+                rects.append((x, y, w, h))
+        return rects
+
+    def normal_memory(self):
+        """
+        Estimate the memory used by both tiers of the cache and the
+        :attr:`pool` when they are full, with a budget of 1.
+
+        :return: the memory in bytes
+        :rtype: integer
+        """
+        pages = sum(ww * wh * 4 for ww, wh in self.pixbuf_size.values())
+        return pages * self.max_pages + self.max_compressed_memory + self.pool.max_memory
+
+    def set_budget(self, budget):
+        """
+        Change the proportion of their normal size that both tiers of the cache
+        may use, and shrink them immediately if needed. When the budget is
+        lowered, the surfaces kept in the :attr:`pool` are released too.
+
+        :param budget: the new budget, between 0 and 1
+        :type  budget: float
+        """
+        shrinking = budget < self.budget
+        self.budget = budget
+        self.wake_idle()
+        if not shrinking:
+            return
+
+        before = self.compressed_memory
+        evicted = pympress.stats.get("pages evicted")
+        for name in self.locks:
+            with self.locks[name]:
+                self.shrink(name)
+        with self.compressed_lock:
+            self.shrink_compressed()
+        self.pool.clear()
+        pympress.stats.log("Cache shrunk: %d page(s) evicted, %.1f MB of compressed pages dropped"
+                           % (pympress.stats.get("pages evicted") - evicted,
+                              max(0, before - self.compressed_memory) / 1048576.))
+
+    def shrink(self, widget_name):
+        """
+        Evict the pages farthest from the current page from the cache of a
+        widget, until there are at most :attr:`max_pages` pages (or less,
+        according to the :attr:`budget`). Evicted pages
+        are queued for compression (see :meth:`compressor`), unless they are
+        already in the second tier, in which case their surfaces go straight
+        back to the :attr:`pool`. Must be called with the lock of the widget
+        acquired.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        """
+        pc = self.pixbuf_cache[widget_name]
+        cur = self.doc.cur_page
+        cur_key = self.key(cur)
+        max_pages = max(self.min_pages, int(self.max_pages * self.budget))
+        while len(pc) > max_pages:
+            page_nb = max(pc, key=lambda p: 0 if p == cur_key else abs(p - cur))
+            pympress.stats.count("pages evicted")
+            with self.compressed_lock:
+                compressed = page_nb in self.compressed[widget_name]
+                if not compressed:
+                    self.compressing.add((widget_name, page_nb))
+            hashes = self.hashes[widget_name].pop(page_nb, None)
+            if compressed:
+                self.pool.put(pc.pop(page_nb))
+            else:
+                ww, wh = self.pixbuf_size[widget_name]
+                self.compress_jobs.put([widget_name, page_nb, ww, wh, self.pixbuf_type[widget_name],
+                                        self.doc.generation, hashes, pc.pop(page_nb)])
+
+    def drop_compressed(self, widget_name, page_nb):
+        """
+        Remove a page from the second tier of the cache, together with the
+        pages stored as deltas from it. Must be called with
+        :attr:`compressed_lock` acquired.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to remove
+        :type  page_nb: integer
+        """
+        cc = self.compressed[widget_name]
+        entry = cc.pop(page_nb, None)
+        if entry is None:
+            return
+        self.compressed_memory -= entry.size()
+        if entry.base is None:
+            for other_nb in [p for p, e in cc.iteritems() if e.base == page_nb]:
+                self.drop_compressed(widget_name, other_nb)
+
+    def shrink_compressed(self):
+        """
+        Drop the compressed pages farthest from the current page, until
+        :attr:`max_compressed_memory` (reduced according to the :attr:`budget`)
+        is respected. Must be called with :attr:`compressed_lock` acquired.
+        """
+        cur = self.doc.cur_page
+        while self.compressed_memory > self.max_compressed_memory * self.budget:
+            candidates = [(abs(page_nb - cur), name, page_nb)
+                          for name, cc in self.compressed.iteritems() for page_nb in cc]
+            if not candidates:
+                break
+            distance, name, page_nb = max(candidates)
+            self.drop_compressed(name, page_nb)
+            pympress.stats.count("compressed pages dropped")
+
+    def find_base(self, widget_name, page_nb, width, height, type, hashes):
+        """
+        Find a neighbouring page of the second tier from which a page can be
+        stored as a delta. Must be called with :attr:`compressed_lock` acquired.
+
+        If the neighbour is itself a delta, the page is compared with the base
+        of the neighbour instead: this way, all the pages of a run of overlays
+        are stored as deltas of the same page.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to store
+        :type  page_nb: integer
+        :param width: width of the render in pixels
+        :type  width: integer
+        :param height: height of the render in pixels
+        :type  height: integer
+        :param type: type of document of the render
+        :type  type: integer
+        :param hashes: hashes of the tiles of the render
+        :type  hashes: list of integers
+        :return: the number of the base page and the entry of the second tier
+           for it, and the indices of the tiles that differ, or ``None`` if
+           there is no suitable base
+        :rtype: (integer, :class:`~pympress.pixbufcache.CompressedPage`, list of integers)
+        """
+        cc = self.compressed[widget_name]
+        for neighbour_nb in (page_nb - 1, page_nb + 1):
+            neighbour = cc.get(neighbour_nb)
+            if neighbour is None:
+                continue
+            base_nb = neighbour_nb if neighbour.base is None else neighbour.base
+            base = cc.get(base_nb)
+            if base is None or base.base is not None or base_nb == page_nb \
+                or (base.width, base.height, base.type) != (width, height, type) \
+                or len(base.hashes) != len(hashes):
+                continue
+            tiles = [i for i in range(len(hashes)) if hashes[i] != base.hashes[i]]
+            if len(tiles) <= self.max_delta_ratio * len(hashes):
+                return base_nb, base, tiles
+        return None
+
+    def compressor(self):
+        """
+        Compression thread: compress the pages evicted from the first tier of
+        the cache (see :meth:`shrink`), store them in the second tier, and give
+        their surfaces back to the :attr:`pool`. It runs infinitely (until the
+        program ends).
+        """
+        compress, decompress = self.codec = get_codec()
+        while True:
+            job = self.compress_jobs.get()
+            widget_name, page_nb, ww, wh, type, generation, hashes = job[:7]
+
+            surface = job[7]
+            stride = surface.get_stride()
+            raw = str(surface.get_data())
+            del surface
+            # This is the last reference to the surface (see BufferPool.put)
+            self.pool.put(job.pop())
+
+            if hashes is None:
+                hashes = tile_hashes(raw, ww, wh, stride)
+            with self.compressed_lock:
+                delta = self.find_base(widget_name, page_nb, ww, wh, type, hashes)
+
+            start = time.time()
+            if delta is not None:
+                base_nb, base, tiles = delta
+                data = compress(extract_tiles(raw, tiles, ww, wh, stride))
+                entry = CompressedPage(ww, wh, type, stride, data, hashes, base_nb, tiles)
+                pympress.stats.count("pages stored as deltas")
+            else:
+                data = compress(raw)
+                entry = CompressedPage(ww, wh, type, stride, data, hashes)
+            pympress.stats.record("compression time (ms)", (time.time() - start) * 1000)
+            pympress.stats.record("compression ratio", float(len(raw)) / len(data))
+            del raw
+
+            with self.locks[widget_name]:
+                with self.compressed_lock:
+                    self.compressing.discard((widget_name, page_nb))
+                    if (ww, wh) != self.pixbuf_size[widget_name] \
+                        or type != self.pixbuf_type[widget_name] \
+                        or generation != self.doc.generation:
+                        continue
+                    cc = self.compressed[widget_name]
+                    if delta is not None and cc.get(base_nb) is not base:
+                        # The base has been dropped meanwhile
+                        continue
+                    self.drop_compressed(widget_name, page_nb)
+                    cc[page_nb] = entry
+                    self.compressed_memory += entry.size()
+                    self.shrink_compressed()
+                    pympress.stats.record("compressed tier memory (MB)", self.compressed_memory / 1048576.)
+
+    def decompress(self, widget_name, page_nb):
+        """
+        Fetch a page from the second tier of the cache, and put it back in the
+        first tier.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to fetch in the cache
+        :type  page_nb: integer
+        :return: the decompressed page if available, or ``None`` otherwise
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        with self.compressed_lock:
+            entry = self.compressed[widget_name].get(page_nb)
+            base = None
+            if entry is not None and entry.base is not None:
+                base = self.compressed[widget_name].get(entry.base)
+                if base is None:
+                    return None
+        if entry is None:
+            return None
+        ww, wh, type, stride = entry.width, entry.height, entry.type, entry.stride
+        decompress = self.codec[1]
+
+        start = time.time()
+        surface = self.pool.get(ww, wh) or cairo.ImageSurface(cairo.FORMAT_RGB24, ww, wh)
+        if surface.get_stride() != stride:
+            return None
+        if base is None:
+            surface.get_data()[:] = decompress(entry.data)
+        else:
+            data = bytearray(decompress(base.data))
+            apply_tiles(data, decompress(entry.data), entry.tiles, ww, wh, stride)
+            surface.get_data()[:] = str(data)
+            del data
+        surface.mark_dirty()
+        pympress.stats.record("decompression time (ms)", (time.time() - start) * 1000)
+
+        with self.locks[widget_name]:
+            if (ww, wh) != self.pixbuf_size[widget_name] or type != self.pixbuf_type[widget_name]:
+                return None
+            pc = self.pixbuf_cache[widget_name]
+            if page_nb not in pc:
+                pc[page_nb] = surface
+                self.hashes[widget_name][page_nb] = entry.hashes
+                self.shrink(widget_name)
+            return pc[page_nb]
+
+    def remap(self, mapping):
+        """
+        Update the cache after the document has been reloaded.
+
+        Only the pages listed in ``mapping`` are kept (possibly with a new page
+        number): all the other cached pages are invalidated.
+
+        :param mapping: dictionary whose keys are the new page numbers of the
+           unchanged pages, and whose values are their old page numbers
+        :type  mapping: dictionary
+        """
+        self.costs = dict((nb, self.costs[old_nb]) for nb, old_nb in mapping.iteritems()
+                          if old_nb in self.costs)
+        self.wake_idle()
+        for widget_name in self.pixbuf_cache:
+            with self.locks[widget_name]:
+                for cache in [self.pixbuf_cache[widget_name], self.hashes[widget_name]]:
+                    kept = dict((nb, cache[old_nb]) for nb, old_nb in mapping.iteritems() if old_nb in cache)
+                    cache.clear()
+                    cache.update(kept)
+            with self.compressed_lock:
+                cc = self.compressed[widget_name]
+                new_numbers = dict((old_nb, nb) for nb, old_nb in mapping.iteritems())
+                kept = {}
+                for nb, old_nb in mapping.iteritems():
+                    entry = cc.get(old_nb)
+                    if entry is not None and entry.base is not None:
+                        # Deltas must follow their base
+                        base_nb = new_numbers.get(entry.base)
+                        if base_nb is None or entry.base not in cc:
+                            continue
+                        entry = CompressedPage(entry.width, entry.height, entry.type, entry.stride,
+                                               entry.data, entry.hashes, base_nb, entry.tiles)
+                    if entry is not None:
+                        kept[nb] = entry
+                cc.clear()
+                cc.update(kept)
+                self.compressed_memory = sum(entry.size() for c in self.compressed.itervalues()
+                                             for entry in c.itervalues())
+
+    def record_cost(self, page_nb, duration):
+        """
+        Record the time it took to render a page, and refine :attr:`cost_ratio`
+        with it.
+
+        :param page_nb: key of the page (see :meth:`key`)
+        :type  page_nb: integer
+        :param duration: render time in seconds
+        :type  duration: float
+        """
+        self.costs[page_nb] = max(duration, self.costs.get(page_nb, 0))
+        pympress.stats.record("render time (ms)", duration * 1000)
+
+        estimate = self.doc.fingerprint_time(page_nb)
+        if estimate:
+            self.cost_ratio = 0.9 * self.cost_ratio + 0.1 * (duration / estimate)
+        estimate = self.doc.summary_time(page_nb)
+        if estimate:
+            self.summary_ratio = 0.9 * self.summary_ratio + 0.1 * (duration / estimate)
+
+    def estimate_cost(self, page_nb):
+        """
+        Estimate the time it takes to render a page: its measured render time if
+        it has already been rendered, or an estimate based on the time it took
+        to compute its fingerprint otherwise, or on the time it took to compute
+        its summary if it was not rendered for its fingerprint.
+
+        :param page_nb: number of the page
+        :type  page_nb: integer
+        :return: the estimated render time in seconds (0 if nothing is known
+           about the page)
+        :rtype: float
+        """
+        page_nb = self.key(page_nb)
+        cost = self.costs.get(page_nb)
+        if cost is not None:
+            return cost
+        estimate = self.doc.fingerprint_time(page_nb)
+        if estimate is not None:
+            return estimate * self.cost_ratio
+        estimate = self.doc.summary_time(page_nb)
+        if estimate is not None:
+            return estimate * self.summary_ratio
+        return 0.
+
+    def render(self, page, ww, wh, type, blocking=True):
+        """
+        Render a page on a surface taken from the :attr:`pool`, making sure no
+        other thread is rendering at the same time.
+
+        :param page: the page to render
+        :type  page: :class:`pympress.document.Page`
+        :param ww: width of the surface in pixels
+        :type  ww: integer
+        :param wh: height of the surface in pixels
+        :type  wh: integer
+        :param type: the type of document that should be rendered
+        :type  type: integer
+        :param blocking: if ``False``, give up instead of waiting when another
+           thread is rendering
+        :type  blocking: boolean
+        :return: the rendered page, or ``None`` if ``blocking`` is ``False`` and
+           another thread is rendering
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        if not self.render_lock.acquire(blocking):
+            return None
+        try:
+            return render_surface(page, ww, wh, type, self.pool.get(ww, wh))
+        finally:
+            self.render_lock.release()
+
+    def timed_render(self, page, ww, wh, type):
+        """
+        Render a page like :meth:`render`, and measure the time it takes.
+
+        Only the rendering itself is measured, not the time spent waiting for
+        other threads to release the render lock: otherwise cheap pages would
+        look expensive whenever several threads are busy.
+
+        :param page: the page to render
+        :type  page: :class:`pympress.document.Page`
+        :param ww: width of the surface in pixels
+        :type  ww: integer
+        :param wh: height of the surface in pixels
+        :type  wh: integer
+        :param type: the type of document that should be rendered
+        :type  type: integer
+        :return: the rendered page and the render time in seconds
+        :rtype: (:class:`cairo.ImageSurface`, float)
+        """
+        with self.render_lock:
+            start = time.time()
+            surface = render_surface(page, ww, wh, type, self.pool.get(ww, wh))
+            return surface, time.time() - start
 
     def prerender(self, page_nb):
         """
@@ -193,7 +1213,175 @@ class PixbufCache:
         :type  page_nb: integer
         """
         for name in self.jobs:
-            self.jobs[name].put(page_nb)
+            self.jobs[name].put((PRERENDER, self.job_counter.next(), page_nb))
+
+    def prerender_around(self, page_nb):
+        """
+        Queue the pages around the current one for prerendering, the most urgent
+        ones first.
+
+        The :attr:`prerender_ahead` next pages and the previous one are always
+        prerendered, as well as the expensive pages up to :attr:`lookahead`
+        pages ahead. A page is all the more urgent that it is close to the
+        current page and expensive to render: pages are sorted by the time left
+        before they have to start being rendered, assuming that each slide is
+        shown for :attr:`slide_time` seconds.
+
+        :param page_nb: number of the current page
+        :type  page_nb: integer
+        """
+        self.last_activity = time.time()
+        self.wake_idle()
+        nb_pages = self.doc.pages_number()
+        near = range(page_nb + 1, min(nb_pages, page_nb + 1 + self.prerender_ahead)) \
+            + range(page_nb, max(-1, page_nb - 2), -1)
+        far = range(page_nb + 1 + self.prerender_ahead, min(nb_pages, page_nb + 1 + self.lookahead))
+
+        slack = {}
+        for p in near + far:
+            cost = self.estimate_cost(p)
+            if p in near or cost >= self.expensive_cost:
+                slack[p] = abs(p - page_nb) * self.slide_time - cost
+        for p in sorted(slack, key=slack.get):
+            self.prerender(p)
+
+    def request(self, widget_name, page_nb):
+        """
+        Queue a page for rendering as soon as possible for a widget.
+
+        :attr:`rendered_callback` will be called once the page is available in
+        the cache.
+
+        :param widget_name: name of the concerned widget
+        :type  widget_name: string
+        :param page_nb: number of the page to render
+        :type  page_nb: integer
+        """
+        self.last_activity = time.time()
+        self.jobs[widget_name].put((URGENT, self.job_counter.next(), page_nb))
+
+    def idle_wait_time(self):
+        """
+        Tell when the whole document can be prerendered: once there has been no
+        navigation for :attr:`idle_delay` seconds, if the system is not busy
+        with other programs (see :attr:`max_load`), there is no memory
+        pressure, and the second tier of the cache is not full.
+
+        :return: 0 if pympress is idle now, the time (in seconds) after which
+           it must be checked again, or ``None`` if nothing can be done until
+           something changes (see :attr:`idle_event`)
+        :rtype: float
+        """
+        left = self.last_activity + self.idle_delay - time.time()
+        if left > 0:
+            return left
+        if self.budget < 1 or self.compressed_memory > 0.9 * self.max_compressed_memory:
+            return None
+        try:
+            # The load caused by idle prerendering itself must not stop it
+            load = max(0, os.getloadavg()[0] - self.own_load()) \
+                / max(1, os.sysconf("SC_NPROCESSORS_ONLN"))
+        except (OSError, ValueError, AttributeError):
+            return 0
+        return self.load_interval if load >= self.max_load else 0
+
+    def own_load(self):
+        """
+        Estimate how many processors pympress itself keeps busy, from the CPU
+        time it used since the last call. It is averaged over about a minute,
+        like the load average it is subtracted from (see
+        :meth:`idle_wait_time`).
+
+        :return: the number of processors used by pympress
+        :rtype: float
+        """
+        now, cpu = time.time(), sum(os.times()[:2])
+        if self.cpu_sample is not None and now > self.cpu_sample[0]:
+            elapsed = now - self.cpu_sample[0]
+            usage = (cpu - self.cpu_sample[1]) / elapsed
+            self.own_load_average += (1 - math.exp(-elapsed / 60.)) * (usage - self.own_load_average)
+        self.cpu_sample = (now, cpu)
+        return self.own_load_average
+
+    def wake_idle(self):
+        """Tell the idle prerendering thread that something has changed."""
+        if self.idle_event is not None:
+            self.idle_event.set()
+
+    def next_idle_job(self):
+        """
+        Find the next page to prerender while pympress is idle: the page most
+        likely to be needed soon (the next pages first, then the previous ones)
+        that is in none of the tiers of the cache of a widget, nor queued for
+        compression.
+
+        :return: the name of the widget and the key of the page (see
+           :meth:`key`), or ``None`` if all the pages are cached
+        :rtype: (string, integer)
+        """
+        cur = self.doc.cur_page
+        nb_pages = self.doc.pages_number()
+        order = sorted(range(nb_pages), key=lambda p: p - cur if p >= cur else 2 * (cur - p))
+        for name in sorted(self.pixbuf_cache):
+            with self.locks[name]:
+                ww, wh = self.pixbuf_size[name]
+                cached = set(self.pixbuf_cache[name])
+            if ww <= 0 or wh <= 0:
+                continue
+            with self.compressed_lock:
+                cached.update(self.compressed[name])
+                cached.update(p for n, p in self.compressing if n == name)
+            for p in order:
+                key = self.key(p)
+                if key not in cached:
+                    return name, key
+        return None
+
+    def idle_prerenderer(self):
+        """
+        Idle prerendering thread: while pympress is idle (see
+        :meth:`idle_wait_time`), render the pages of the whole document one by
+        one, in order of predicted need (see :meth:`next_idle_job`), and queue
+        them for compression into the second tier. It runs infinitely (until the program
+        ends).
+
+        The thread throttles itself: it only spends :attr:`idle_duty` of its
+        time rendering, and stops as soon as a navigation event occurs (a page
+        that is being rendered can't be interrupted, though). It never polls:
+        it sleeps until the end of the :attr:`idle_delay` after the last
+        navigation event, or until :attr:`idle_event` is set when there is
+        nothing to do.
+        """
+        while True:
+            self.idle_event.clear()
+            wait = self.idle_wait_time()
+            job = self.next_idle_job() if wait == 0 else None
+            if wait is None or (wait == 0 and job is None):
+                self.idle_event.wait()
+                continue
+            elif wait > 0:
+                time.sleep(wait)
+                continue
+            name, key = job
+
+            with self.doc_lock:
+                page = self.doc.page(key)
+                if page is None:
+                    continue
+                generation = self.doc.generation
+            with self.locks[name]:
+                ww, wh = self.pixbuf_size[name]
+                type = self.pixbuf_type[name]
+
+            surface, duration = self.timed_render(page, ww, wh, type)
+            self.record_cost(key, duration)
+            pympress.stats.count("pages prerendered while idle")
+
+            with self.compressed_lock:
+                self.compressing.add((name, key))
+            self.compress_jobs.put([name, key, ww, wh, type, generation, None, surface])
+            del surface
+            time.sleep(duration * (1 - self.idle_duty) / self.idle_duty)
 
     def renderer(self, widget_name):
         """
@@ -206,11 +1394,14 @@ class PixbufCache:
         ends) and does the following steps:
 
         - fetch the number of a page to render from the jobs
-          :class:`~Queue.Queue`
-        - check if it is not already available in the cache
-        - render it in a new :class:`~gtk.gdk.Pixbuf` if necessary
+          :class:`~Queue.PriorityQueue`
+        - check if it is not already available in the cache, or decompress it
+          if it is in the second tier
+        - render it in a pooled :class:`~cairo.ImageSurface` if necessary
         - store it in the cache if it was not added there since the beginning of
-          the process
+          the process, evicting the pages farthest from the current page if
+          the cache is full (their surfaces go back to the pool)
+        - for urgent jobs, tell the UI that the page is available
 
         .. note:: There is a big huge ``print`` in the middle of this function
            which is used to check if everything works fine. It will be removed
@@ -219,41 +1410,69 @@ class PixbufCache:
         :param widget_name: name of the widget handled by this thread
         :type  widget_name: string
         """
-        # Give the program some time to start
-        time.sleep(5)
-
         while True:
             # Get something to do
-            page_nb = self.jobs[widget_name].get()
+            priority, seq, page_nb = self.jobs[widget_name].get()
+            key = self.key(page_nb)
 
             # So we have something to do. The main thread may have something to
-            # do too: let it acquire this lock first.
-            time.sleep(0.1)
+            # do too: unless it is waiting for this page, let it acquire this
+            # lock first.
+            if priority != URGENT:
+                time.sleep(0.1)
             with self.locks[widget_name]:
-                if page_nb in self.pixbuf_cache[widget_name]:
-                    # Already in cache
-                    continue
+                cached = key in self.pixbuf_cache[widget_name]
                 ww, wh = self.pixbuf_size[widget_name]
                 type = self.pixbuf_type[widget_name]
+            if cached:
+                # Already in cache (possibly as an identical page)
+                if key != page_nb:
+                    pympress.stats.count("renders skipped (identical pages)")
+                if priority == URGENT and self.rendered_callback is not None:
+                    gobject.idle_add(self.rendered_callback, widget_name, page_nb)
+                continue
+            if ww <= 0 or wh <= 0:
+                # The widget has not been displayed yet
+                continue
+
+            # Pages in the second tier are much faster to decompress than to
+            # render
+            if self.decompress(widget_name, key) is not None:
+                with self.rendered:
+                    self.rendered.notify_all()
+                if priority == URGENT and self.rendered_callback is not None:
+                    gobject.idle_add(self.rendered_callback, widget_name, page_nb)
+                continue
+
             with self.doc_lock:
-                page = self.doc.page(page_nb)
+                page = self.doc.page(key)
+                if page is None:
+                    # The document has been reloaded and is now shorter
+                    continue
                 pw, ph = page.get_size(type)
+                generation = self.doc.generation
 
-            print "Prerendering page %d for widget %s type %d" % (page_nb+1, widget_name, type)
+            print "Prerendering page %d for widget %s type %d" % (key+1, widget_name, type)
 
-            with gtk.gdk.lock:
-                # Render to a pixmap
-                pixmap = gtk.gdk.Pixmap(None, ww, wh, 24) # FIXME: 24 or 32?
-                cr = pixmap.cairo_create()
-                page.render_cairo(cr, ww, wh, type)
-
-                # Convert pixmap to pixbuf
-                pixbuf = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, ww, wh)
-                pixbuf.get_from_drawable(pixmap, gtk.gdk.colormap_get_system(),
-                                         0, 0, 0, 0, ww, wh)
+            pixbuf, duration = self.timed_render(page, ww, wh, type)
+            self.record_cost(key, duration)
+            hashes = tile_hashes(pixbuf.get_data(), ww, wh, pixbuf.get_stride())
 
             # Save if possible and necessary
             with self.locks[widget_name]:
                 pc = self.pixbuf_cache[widget_name]
-                if (ww, wh) == self.pixbuf_size[widget_name] and not page_nb in pc:
-                    pc[page_nb] = pixbuf
+                if (ww, wh) == self.pixbuf_size[widget_name] \
+                    and type == self.pixbuf_type[widget_name] \
+                    and generation == self.doc.generation and not key in pc:
+                    pc[key] = pixbuf
+                    self.hashes[widget_name][key] = hashes
+                    del pixbuf
+                    self.shrink(widget_name)
+                else:
+                    continue
+
+            with self.rendered:
+                self.rendered.notify_all()
+
+            if priority == URGENT and self.rendered_callback is not None:
+                gobject.idle_add(self.rendered_callback, widget_name, page_nb)
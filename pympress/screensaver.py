@@ -0,0 +1,405 @@
+#       screensaver.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.screensaver` -- screensaver and screen blanking control
+----------------------------------------------------------------------
+
+This module disables the screensaver and the screen blanking (DPMS) during a
+presentation, and enables them again afterwards, using the
+:command:`xdg-screensaver` and :command:`xset` commands.
+
+These commands may take a long time, or even hang, so they are never run
+synchronously: the :class:`~pympress.screensaver.CommandRunner` runs them in the
+background, one at a time, kills them if they take too long, and reports their
+results through the GLib main loop. The GUI is never blocked.
+
+The names of the commands are attributes of the
+:class:`~pympress.screensaver.Screensaver` class, so that stub executables can
+be used instead of the real ones, e.g. to check the behaviour of pympress when
+they fail or hang. Such stubs are in :file:`tools/screensaver-stubs`, and
+:file:`tools/check-screensaver` uses them to check that the commands are killed
+after their timeout, that the DPMS state is cached, and that
+:meth:`~pympress.screensaver.Screensaver.set_enabled` never blocks.
+"""
+
+import errno
+import fcntl
+import os
+import signal
+import sys
+import time
+
+import gobject
+
+import pympress.stats
+
+
+def describe_failure(code, output):
+    """
+    Describe why a command failed.
+
+    :param code: exit status of the command, or ``None``
+    :type  code: integer
+    :param output: error message (when ``code`` is ``None``)
+    :type  output: string
+    :return: a description of the failure
+    :rtype: string
+    """
+    if code is None:
+        return output
+    return "got status %d" % code
+
+
+class CommandRunner:
+    """
+    Asynchronous runner of external commands, integrated with the GLib main
+    loop. Commands are run one at a time, in order, so that their effects are
+    applied in the right order.
+    """
+
+    #: Commands waiting to be run, as a list of ``(argv, callback, output)``
+    #: tuples (see :meth:`run`).
+    queue = []
+
+    #: The command being run, as a dictionary with its ``argv``, ``callback``,
+    #: ``pid``, start time (``start``), output file descriptor (``fd``) and its
+    #: watch source (``watch``), output (``output``), and timeout source
+    #: (``timer``), or ``None``.
+    current = None
+
+    #: Maximum run time of a command, in milliseconds, after which it is
+    #: killed.
+    timeout = 2000
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: see :attr:`timeout`
+        :type  timeout: integer
+        """
+        self.queue = []
+        if timeout is not None:
+            self.timeout = timeout
+
+    def run(self, argv, callback=None, output=False):
+        """
+        Run a command in the background, after the commands that are already
+        queued.
+
+        :param argv: the command and its arguments (the command is searched in
+           the :envvar:`PATH`)
+        :type  argv: list of strings
+        :param callback: function called (in the main loop) when the command is
+           finished, with its exit status (``None`` if it could not be started,
+           was killed or timed out) and its output (or an error message), or
+           ``None``
+        :type  callback: function
+        :param output: ``True`` if the output of the command must be read,
+           ``False`` otherwise (commands which leave a process in the background
+           must not have their output read, since it would never end)
+        :type  output: boolean
+        """
+        self.queue.append((argv, callback, output))
+        if self.current is None:
+            self.start_next()
+
+    def start_next(self):
+        """
+        Start the first queued command, if any.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        while self.queue and self.current is None:
+            argv, callback, output = self.queue.pop(0)
+            flags = gobject.SPAWN_SEARCH_PATH | gobject.SPAWN_DO_NOT_REAP_CHILD
+            if not output:
+                flags |= gobject.SPAWN_STDOUT_TO_DEV_NULL
+            try:
+                pid, stdin, stdout, stderr = gobject.spawn_async(argv, flags=flags, standard_output=output)
+            except gobject.GError, e:
+                self.report(argv, callback, None, str(e), 0)
+                continue
+
+            self.current = {"argv": argv, "callback": callback, "pid": pid, "start": time.time(),
+                            "fd": stdout, "watch": None, "output": [], "timer": None}
+            if stdout is not None:
+                fcntl.fcntl(stdout, fcntl.F_SETFL, fcntl.fcntl(stdout, fcntl.F_GETFL) | os.O_NONBLOCK)
+                self.current["watch"] = gobject.io_add_watch(stdout, gobject.IO_IN | gobject.IO_HUP, self.on_output)
+            self.current["timer"] = gobject.timeout_add(self.timeout, self.on_timeout, pid)
+            gobject.child_watch_add(pid, self.on_exit)
+        return False
+
+    def read_output(self, command):
+        """
+        Read the available output of a command.
+
+        :param command: the command (see :attr:`current`)
+        :type  command: dictionary
+        :return: ``True`` if there may be more output, ``False`` at the end of
+           the output
+        :rtype: boolean
+        """
+        while True:
+            try:
+                data = os.read(command["fd"], 4096)
+            except OSError, e:
+                return e.errno == errno.EAGAIN
+            if not data:
+                return False
+            command["output"].append(data)
+
+    def on_output(self, fd, condition):
+        """
+        Read the output of the current command when it is available.
+
+        :param fd: the file descriptor of the output
+        :type  fd: integer
+        :param condition: what happened on the file descriptor
+        :type  condition: integer
+        :return: ``True`` to keep watching the output, ``False`` otherwise
+        :rtype: boolean
+        """
+        if self.current is None or self.current["fd"] != fd:
+            return False
+        if self.read_output(self.current):
+            return True
+        self.current["watch"] = None
+        return False
+
+    def on_timeout(self, pid):
+        """
+        Kill the current command if it is still running after :attr:`timeout`
+        milliseconds. Its exit will be reported normally, as killed.
+
+        :param pid: the process ID of the command
+        :type  pid: integer
+        :return: ``False`` (when used as a timeout callback)
+        :rtype: boolean
+        """
+        if self.current is not None and self.current["pid"] == pid:
+            self.current["timer"] = None
+            self.current["timed_out"] = True
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        return False
+
+    def on_exit(self, pid, status):
+        """
+        Report the result of the current command once it has exited, and start
+        the next one.
+
+        :param pid: the process ID of the command
+        :type  pid: integer
+        :param status: the exit status, as returned by :func:`os.waitpid`
+        :type  status: integer
+        """
+        current = self.current
+        if current is None or current["pid"] != pid:
+            return
+        self.current = None
+        if current["timer"] is not None:
+            gobject.source_remove(current["timer"])
+
+        if current["fd"] is not None:
+            if current["watch"] is not None:
+                gobject.source_remove(current["watch"])
+            self.read_output(current)
+            os.close(current["fd"])
+
+        output = "".join(current["output"])
+        if current.get("timed_out"):
+            code, output = None, "timed out after %d ms" % self.timeout
+        elif os.WIFEXITED(status):
+            code = os.WEXITSTATUS(status)
+        else:
+            code, output = None, "killed by signal %d" % os.WTERMSIG(status)
+        self.report(current["argv"], current["callback"], code, output, time.time() - current["start"])
+        gobject.idle_add(self.start_next)
+
+    def report(self, argv, callback, code, output, duration):
+        """
+        Report the result of a command.
+
+        :param argv: the command and its arguments
+        :type  argv: list of strings
+        :param callback: see :meth:`run`
+        :type  callback: function
+        :param code: the exit status of the command, or ``None`` if it failed
+        :type  code: integer
+        :param output: the output of the command, or an error message
+        :type  output: string
+        :param duration: run time of the command, in seconds
+        :type  duration: float
+        """
+        pympress.stats.record("external command time (ms)", duration * 1000)
+        if code != 0:
+            pympress.stats.log("Command %s failed: %s" % (" ".join(argv), describe_failure(code, output)))
+        if callback is not None:
+            callback(code, output)
+
+
+class Screensaver:
+    """Asynchronous control of the screensaver and of DPMS screen blanking."""
+
+    #: Command used to suspend and resume the screensaver.
+    xdg_screensaver = "xdg-screensaver"
+
+    #: Command used to query and set the DPMS state.
+    xset = "xset"
+
+    #: :class:`~pympress.screensaver.CommandRunner` running the commands.
+    runner = None
+
+    #: Cached DPMS state: ``True`` if screen blanking is enabled, ``False`` if
+    #: it is disabled, ``None`` if it is unknown (yet).
+    dpms_enabled = None
+
+    #: Whether DPMS has been disabled by pympress, and must be enabled again.
+    dpms_disabled = False
+
+    #: Whether the screensaver must be disabled (i.e. the last request).
+    must_disable = False
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout: maximum run time of the commands, in milliseconds (see
+           :attr:`pympress.screensaver.CommandRunner.timeout`)
+        :type  timeout: integer
+        """
+        self.runner = CommandRunner(timeout)
+        if self.is_supported():
+            # Query the DPMS state in advance, so that it is known when the
+            # screensaver has to be disabled
+            self.runner.run([self.xset, "q"], self.on_dpms_query, True)
+
+    def is_supported(self):
+        """
+        Tell if the screensaver can be controlled on this system.
+
+        :return: ``True`` on POSIX systems, ``False`` otherwise
+        :rtype: boolean
+        """
+        return os.name == "posix"
+
+    def set_enabled(self, enabled, xid):
+        """
+        Enable or disable the screensaver and DPMS screen blanking. This returns
+        immediately: the commands are run in the background.
+
+        :param enabled: ``True`` to enable the screensaver, ``False`` to
+           disable it
+        :type  enabled: boolean
+        :param xid: X window ID of the window for which the screensaver is
+           disabled
+        :type  xid: integer
+        """
+        if not self.is_supported():
+            print >>sys.stderr, "Warning: Unsupported OS: can't enable/disable screensaver"
+            return
+
+        self.must_disable = not enabled
+        cmd = "resume" if enabled else "suspend"
+        self.runner.run([self.xdg_screensaver, cmd, str(xid)], self.on_screensaver_set)
+
+        if not enabled:
+            if self.dpms_enabled is None:
+                self.runner.run([self.xset, "q"], self.on_dpms_query, True)
+            else:
+                self.update_dpms()
+        elif self.dpms_disabled:
+            self.dpms_disabled = False
+            self.runner.run([self.xset, "+dpms"], self.on_dpms_enabled)
+
+    def update_dpms(self):
+        """Disable DPMS if it is enabled and the screensaver must be disabled."""
+        if self.must_disable and self.dpms_enabled and not self.dpms_disabled:
+            self.dpms_disabled = True
+            self.runner.run([self.xset, "-dpms"], self.on_dpms_disabled)
+
+    def on_screensaver_set(self, code, output):
+        """
+        Report the result of :command:`xdg-screensaver`.
+
+        :param code: exit status of the command, or ``None``
+        :type  code: integer
+        :param output: error message
+        :type  output: string
+        """
+        if code != 0:
+            print >>sys.stderr, "Warning: Could not set screensaver status: %s" % describe_failure(code, output)
+
+    def on_dpms_query(self, code, output):
+        """
+        Cache the DPMS state returned by :command:`xset q`, and disable DPMS if
+        needed.
+
+        :param code: exit status of the command, or ``None``
+        :type  code: integer
+        :param output: output of the command
+        :type  output: string
+        """
+        if code != 0:
+            return
+        self.dpms_enabled = False
+        for line in output.splitlines():
+            # TODO: check if this works on all locales
+            if "DPMS is" in line:
+                self.dpms_enabled = line.split()[-1] == "Enabled"
+                break
+        self.update_dpms()
+
+    def on_dpms_disabled(self, code, output):
+        """
+        Update the cached DPMS state after :command:`xset -dpms`.
+
+        :param code: exit status of the command, or ``None``
+        :type  code: integer
+        :param output: error message
+        :type  output: string
+        """
+        if code == 0:
+            self.dpms_enabled = False
+        else:
+            print >>sys.stderr, "Warning: Could not disable DPMS screen blanking: %s" % describe_failure(code, output)
+            self.dpms_disabled = False
+
+    def on_dpms_enabled(self, code, output):
+        """
+        Update the cached DPMS state after :command:`xset +dpms`.
+
+        :param code: exit status of the command, or ``None``
+        :type  code: integer
+        :param output: error message
+        :type  output: string
+        """
+        if code == 0:
+            self.dpms_enabled = True
+        else:
+            print >>sys.stderr, "Warning: Could not enable DPMS screen blanking: %s" % describe_failure(code, output)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,315 @@
+#       search.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.search` -- full-text search
+------------------------------------------
+
+This module contains the :class:`~pympress.search.SearchIndex` class, which
+builds an inverted index of the words of each page of a document, so that the
+pages containing some text can be found instantly.
+
+The text of the pages is extracted in a background thread, using a separate
+:class:`poppler.Document` so that it does not interfere with rendering. The
+index can be queried while it is being built: the results are then simply
+incomplete. Once the whole document has been indexed, the text of the pages is
+saved in the cache directory of pympress (see
+:func:`pympress.util.get_cache_path`), so that it does not have to be extracted
+again the next time the same file is opened.
+"""
+
+import bisect
+import cPickle
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+
+import gobject
+
+import pympress.stats
+import pympress.util
+import pympress.watcher
+
+from pympress.document import Page
+
+#: Regular expression matching the words of a text.
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Split a text into normalized (lowercase) words.
+
+    :param text: the text, encoded in UTF-8
+    :type  text: string
+    :return: the words of the text
+    :rtype: list of unicode strings
+    """
+    return WORD_RE.findall(text.decode("utf-8", "replace").lower())
+
+
+class SearchIndex:
+    """Inverted index of the words of all the pages of a document."""
+
+    #: The current :class:`~pympress.document.Document`.
+    doc = None
+
+    #: Text of each page, as a dictionary of UTF-8 strings indexed by page
+    #: numbers.
+    texts = {}
+
+    #: Inverted index, as a dictionary of sets of page numbers indexed by
+    #: words.
+    index = {}
+
+    #: Sorted list of the words of :attr:`index`, used for prefix searches, or
+    #: ``None`` if it must be rebuilt.
+    words = None
+
+    #: Whether all the pages have been indexed.
+    complete = False
+
+    #: Incremented each time the index is restarted, so that an outdated
+    #: indexing thread knows that it must stop.
+    generation = 0
+
+    #: :class:`~threading.Lock` used to manage concurrent accesses to the
+    #: attributes above.
+    lock = None
+
+    #: Function called (in the main loop, without any argument) each time new
+    #: pages have been indexed, or ``None``.
+    callback = None
+
+    #: Number of pages indexed between two calls to :attr:`callback`.
+    progress_interval = 50
+
+    def __init__(self, doc, callback=None):
+        """
+        :param doc: the current document
+        :type  doc: :class:`pympress.document.Document`
+        :param callback: see :attr:`callback`
+        :type  callback: function
+        """
+        self.doc = doc
+        self.callback = callback
+        self.texts = {}
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start indexing the pages that are not indexed yet, in the background."""
+        thread = threading.Thread(target=self.builder, args=(self.generation,))
+        thread.daemon = True
+        thread.start()
+
+    def is_complete(self):
+        """
+        Tell if all the pages have been indexed.
+
+        :return: ``True`` if the index is complete, ``False`` if it is still
+           being built
+        :rtype: boolean
+        """
+        return self.complete
+
+    def add(self, page_nb, text):
+        """
+        Add the text of a page to the index. Must be called with :attr:`lock`
+        acquired.
+
+        :param page_nb: number of the page
+        :type  page_nb: integer
+        :param text: text of the page, encoded in UTF-8
+        :type  text: string
+        """
+        self.texts[page_nb] = text
+        for word in set(tokenize(text)):
+            self.index.setdefault(word, set()).add(page_nb)
+        self.words = None
+
+    def search(self, query):
+        """
+        Find the pages containing all the words of a query. The last word may be
+        incomplete, so every word is matched as a prefix.
+
+        :param query: the searched text
+        :type  query: string
+        :return: numbers of the matching pages, in order
+        :rtype: list of integers
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        start = time.time()
+        result = None
+        with self.lock:
+            if self.words is None:
+                self.words = sorted(self.index)
+            for term in terms:
+                pages = set()
+                i = bisect.bisect_left(self.words, term)
+                while i < len(self.words) and self.words[i].startswith(term):
+                    pages |= self.index[self.words[i]]
+                    i += 1
+                result = pages if result is None else result & pages
+                if not result:
+                    break
+
+        pympress.stats.record("search time (ms)", (time.time() - start) * 1000)
+        return sorted(result)
+
+    def remap(self, mapping):
+        """
+        Update the index after the document has been reloaded (see
+        :meth:`pympress.pixbufcache.PixbufCache.remap`), and index the pages
+        that changed in the background.
+
+        :param mapping: dictionary whose keys are the new page numbers of the
+           unchanged pages, and whose values are their old page numbers
+        :type  mapping: dictionary
+        """
+        with self.lock:
+            texts = dict((nb, self.texts[old_nb]) for nb, old_nb in mapping.iteritems()
+                         if old_nb in self.texts)
+            self.texts = {}
+            self.index = {}
+            for nb, text in texts.iteritems():
+                self.add(nb, text)
+            self.complete = False
+            self.generation += 1
+        self.start()
+
+    def cache_path(self):
+        """
+        Get the path to the file in which the text of the pages is saved.
+
+        :return: path to the file in the cache directory
+        :rtype: string
+        """
+        key = hashlib.sha1(os.path.abspath(self.doc.path)).hexdigest()
+        return pympress.util.get_cache_path("%s.text" % key)
+
+    def load(self, state):
+        """
+        Read the text of the pages from the cache, if it is up to date.
+
+        :param state: current state of the file (see
+           :func:`pympress.watcher.file_state`)
+        :type  state: (float, integer)
+        :return: the text of each page, or ``None`` if it is not in the cache
+        :rtype: list of strings
+        """
+        try:
+            with open(self.cache_path(), "rb") as f:
+                data = cPickle.load(f)
+            if data["state"] == state:
+                return data["texts"]
+        except (IOError, OSError, EOFError, KeyError, TypeError, ValueError, cPickle.UnpicklingError):
+            pass
+        return None
+
+    def save(self, state, texts):
+        """
+        Save the text of the pages in the cache.
+
+        :param state: state of the file from which the text was extracted (see
+           :func:`pympress.watcher.file_state`)
+        :type  state: (float, integer)
+        :param texts: the text of each page
+        :type  texts: list of strings
+        """
+        try:
+            path = self.cache_path()
+            with open(path + ".tmp", "wb") as f:
+                cPickle.dump({"state": state, "texts": texts}, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError), e:
+            print >>sys.stderr, "Warning: Could not save the search index: %s" % e
+
+    def builder(self, generation):
+        """
+        Indexing thread: extract the text of all the pages that are not indexed
+        yet (or read it from the cache), and add it to the index.
+
+        :param generation: value of :attr:`generation` when the thread started
+        :type  generation: integer
+        """
+        start = time.time()
+        state = pympress.watcher.file_state(self.doc.path)
+
+        texts = self.load(state)
+        if texts is not None:
+            with self.lock:
+                if generation != self.generation:
+                    return
+                for nb, text in enumerate(texts):
+                    if nb not in self.texts:
+                        self.add(nb, text)
+                self.complete = True
+            if self.callback is not None:
+                gobject.idle_add(self.callback)
+            return
+
+        try:
+            doc, data = self.doc.open_file(self.doc.use_mmap)
+        except gobject.GError, e:
+            print >>sys.stderr, "Could not index %s: %s" % (self.doc.path, e)
+            return
+
+        nb_pages = doc.get_n_pages()
+        for nb in range(nb_pages):
+            with self.lock:
+                if generation != self.generation:
+                    return
+                if nb in self.texts:
+                    continue
+
+            text = Page(doc, nb).get_text()
+
+            with self.lock:
+                if generation != self.generation:
+                    return
+                self.add(nb, text)
+            if self.callback is not None and nb % self.progress_interval == 0:
+                gobject.idle_add(self.callback)
+
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.complete = True
+            texts = [self.texts.get(nb, "") for nb in range(nb_pages)]
+
+        pympress.stats.record("search index build time (s)", time.time() - start)
+        if pympress.watcher.file_state(self.doc.path) == state:
+            self.save(state, texts)
+        if self.callback is not None:
+            gobject.idle_add(self.callback)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
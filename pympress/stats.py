@@ -0,0 +1,213 @@
+#       stats.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.stats` -- performance statistics
+-----------------------------------------------
+
+This module collects various statistics about what pympress is doing (cache
+hits, render times, missed deadlines...), so that its behaviour during a real
+presentation can be checked afterwards. It is safe to use from any thread.
+
+There are three kinds of statistics:
+
+- counters, which are simply incremented with :func:`count`;
+- measures (e.g. durations), recorded with :func:`record`, for which the number
+  of values, their total and their maximum are kept;
+- events, i.e. timestamped messages logged with :func:`log`.
+
+Everything can be printed with :func:`report`.
+
+On Linux, the number of wakeups of pympress can also be measured (see
+:func:`start_wakeups`): it is the number of voluntary context switches of its
+threads, i.e. how many times they went to sleep and were woken up. This is what
+keeps the processor from staying in its low-power states.
+"""
+
+import os
+import sys
+import threading
+import time
+
+#: :class:`~threading.Lock` used to manage concurrent accesses to the
+#: statistics.
+lock = threading.Lock()
+
+#: Counters, as a dictionary of integers indexed by their names.
+counters = {}
+
+#: Measures, as a dictionary of ``[count, total, maximum]`` lists indexed by
+#: their names.
+measures = {}
+
+#: Logged events, as a list of ``(time, message)`` tuples.
+events = []
+
+#: Maximum number of events kept in :data:`events`.
+max_events = 1000
+
+#: Whether logged events must also be printed immediately.
+verbose = False
+
+#: Time at which the measure of wakeups started, and the number of context
+#: switches of each thread at that time (see :func:`start_wakeups`), or
+#: ``None``.
+wakeups_start = None
+
+
+def count(name, n=1):
+    """
+    Increment a counter.
+
+    :param name: name of the counter
+    :type  name: string
+    :param n: value to add to the counter
+    :type  n: integer
+    """
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+def get(name):
+    """
+    Get the value of a counter.
+
+    :param name: name of the counter
+    :type  name: string
+    :return: the value of the counter (0 if it has never been incremented)
+    :rtype: integer
+    """
+    with lock:
+        return counters.get(name, 0)
+
+
+def record(name, value):
+    """
+    Record a new value for a measure.
+
+    :param name: name of the measure
+    :type  name: string
+    :param value: the value to record
+    :type  value: float
+    """
+    with lock:
+        m = measures.setdefault(name, [0, 0., value])
+        m[0] += 1
+        m[1] += value
+        m[2] = max(m[2], value)
+
+
+def log(message):
+    """
+    Log an event.
+
+    :param message: description of the event
+    :type  message: string
+    """
+    now = time.time()
+    with lock:
+        events.append((now, message))
+        del events[:-max_events]
+    if verbose:
+        print "[%s] %s" % (time.strftime("%H:%M:%S", time.localtime(now)), message)
+
+
+def context_switches():
+    """
+    Get the number of voluntary context switches of each thread of the process.
+
+    :return: the number of context switches, indexed by thread IDs (empty if
+       they are not available)
+    :rtype: dictionary
+    """
+    switches = {}
+    try:
+        tids = os.listdir("/proc/self/task")
+    except OSError:
+        return switches
+    for tid in tids:
+        try:
+            with open("/proc/self/task/%s/status" % tid) as f:
+                for line in f:
+                    if line.startswith("voluntary_ctxt_switches:"):
+                        switches[int(tid)] = int(line.split()[1])
+                        break
+        except (IOError, ValueError):
+            pass
+    return switches
+
+
+def start_wakeups():
+    """Start measuring the wakeups of the process (see :func:`report_wakeups`)."""
+    global wakeups_start
+    wakeups_start = (time.time(), context_switches())
+
+
+def report_wakeups(out=sys.stdout):
+    """
+    Print the number of wakeups per second since :func:`start_wakeups` was
+    called, for the whole process and for each thread (threads which have
+    already exited are not counted).
+
+    :param out: file where the statistics must be printed
+    :type  out: file
+    """
+    if wakeups_start is None:
+        return
+    start, before = wakeups_start
+    duration = max(time.time() - start, 1e-6)
+    after = context_switches()
+    main = os.getpid()
+
+    print >>out, "Wakeups per second (over %.1f s):" % duration
+    total = 0
+    for tid in sorted(after):
+        n = after[tid] - before.get(tid, 0)
+        total += n
+        print >>out, "  %-40s %.2f" % ("thread %d%s" % (tid, " (main loop)" if tid == main else ""), n / duration)
+    print >>out, "  %-40s %.2f" % ("total", total / duration)
+
+
+def report(out=sys.stdout):
+    """
+    Print all the statistics.
+
+    :param out: file where the statistics must be printed
+    :type  out: file
+    """
+    with lock:
+        print >>out, "Counters:"
+        for name in sorted(counters):
+            print >>out, "  %-40s %d" % (name, counters[name])
+        print >>out, "Measures (count / average / maximum):"
+        for name in sorted(measures):
+            n, total, maximum = measures[name]
+            print >>out, "  %-40s %d / %.3f / %.3f" % (name, n, total/n, maximum)
+        print >>out, "Events:"
+        for t, message in events:
+            print >>out, "  [%s] %s" % (time.strftime("%H:%M:%S", time.localtime(t)), message)
+    report_wakeups(out)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
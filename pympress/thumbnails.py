@@ -0,0 +1,266 @@
+#       thumbnails.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.thumbnails` -- thumbnails of all the pages
+---------------------------------------------------------
+
+This module contains the :class:`~pympress.thumbnails.ThumbnailCache` class,
+which manages small renders of the pages of a document. They are used in the
+overview of the Presenter window, and as a last resort when a page must be
+displayed before it could be rendered.
+
+Thumbnails are rendered in a background thread, in order of distance from the
+current page, except for the pages that are currently visible in the overview,
+which are always rendered first. The memory used by the thumbnails is bounded:
+when there are too many of them, the ones for the pages that are the farthest
+from the current page are dropped (they will be rendered again if needed).
+"""
+
+import threading
+import time
+
+import gobject
+
+import pympress.stats
+
+from pympress.document import PDF_CONTENT_PAGE
+
+class ThumbnailCache:
+    """Background rendering and caching of the thumbnails of all the pages."""
+
+    #: Width of the thumbnails, in pixels.
+    width = 160
+
+    #: Maximum memory used by the thumbnails, in bytes.
+    max_memory = 32 * 1024 * 1024
+
+    #: The current :class:`~pympress.document.Document`.
+    doc = None
+
+    #: :class:`~pympress.pixbufcache.PixbufCache` used to render the
+    #: thumbnails (so that they share its render lock).
+    cache = None
+
+    #: The thumbnails, as a dictionary of :class:`cairo.ImageSurface` indexed
+    #: by page numbers.
+    thumbnails = {}
+
+    #: Memory currently used by :attr:`thumbnails`, in bytes.
+    memory = 0
+
+    #: Number of the current page: thumbnails are rendered in order of distance
+    #: from it.
+    cur_page = 0
+
+    #: Pages that are currently visible and must be rendered first.
+    visible = set()
+
+    #: :class:`~threading.Condition` used to manage concurrent accesses to the
+    #: attributes above, and to wake up the rendering thread when there is
+    #: something new to do.
+    cond = None
+
+    #: Function called (in the main loop) with a page number each time a
+    #: thumbnail has been rendered, or ``None``.
+    callback = None
+
+    #: The rendering thread.
+    thread = None
+
+    def __init__(self, doc, cache, callback=None):
+        """
+        :param doc: the current document
+        :type  doc: :class:`pympress.document.Document`
+        :param cache: the cache used to render pages
+        :type  cache: :class:`~pympress.pixbufcache.PixbufCache`
+        :param callback: see :attr:`callback`
+        :type  callback: function
+        """
+        self.doc = doc
+        self.cache = cache
+        self.callback = callback
+        self.thumbnails = {}
+        self.visible = set()
+        self.cond = threading.Condition()
+
+    def start(self):
+        """Start rendering thumbnails in the background."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.renderer)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def get(self, page_nb):
+        """
+        Get the thumbnail of a page.
+
+        :param page_nb: number of the page
+        :type  page_nb: integer
+        :return: the thumbnail if available, or ``None`` otherwise
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        with self.cond:
+            return self.thumbnails.get(page_nb)
+
+    def set_current(self, page_nb):
+        """
+        Change the current page, i.e. the page around which thumbnails must be
+        rendered first.
+
+        :param page_nb: number of the current page
+        :type  page_nb: integer
+        """
+        with self.cond:
+            self.cur_page = page_nb
+            self.cond.notify()
+
+    def set_visible(self, pages):
+        """
+        Set the pages that are currently visible, whose thumbnails must be
+        rendered before the others.
+
+        :param pages: numbers of the visible pages
+        :type  pages: iterable of integers
+        """
+        with self.cond:
+            self.visible = set(pages)
+            self.cond.notify()
+
+    def remap(self, mapping):
+        """
+        Update the thumbnails after the document has been reloaded (see
+        :meth:`pympress.pixbufcache.PixbufCache.remap`).
+
+        :param mapping: dictionary whose keys are the new page numbers of the
+           unchanged pages, and whose values are their old page numbers
+        :type  mapping: dictionary
+        """
+        with self.cond:
+            kept = dict((nb, self.thumbnails[old_nb]) for nb, old_nb in mapping.iteritems()
+                        if old_nb in self.thumbnails)
+            self.thumbnails = kept
+            self.memory = sum(self.size_of(t) for t in kept.itervalues())
+            self.cond.notify()
+
+    def size_of(self, thumbnail):
+        """
+        Get the memory used by a thumbnail.
+
+        :param thumbnail: the thumbnail
+        :type  thumbnail: :class:`cairo.ImageSurface`
+        :return: size in bytes
+        :rtype: integer
+        """
+        return thumbnail.get_stride() * thumbnail.get_height()
+
+    def next_job(self):
+        """
+        Choose the next thumbnail to render. Visible pages are rendered first,
+        then the pages closest to the current page, as long as they fit in
+        memory (or are closer than the farthest thumbnail, which will then be
+        dropped). Must be called with :attr:`cond` acquired.
+
+        :return: the number of the page to render, or ``None`` if there is
+           nothing to do
+        :rtype: integer
+        """
+        if not self.doc.is_open():
+            return None
+
+        distance = lambda p: abs(p - self.cur_page)
+        nb_pages = self.doc.pages_number()
+
+        missing = [p for p in self.visible if p not in self.thumbnails and p < nb_pages]
+        if missing:
+            return min(missing, key=distance)
+
+        missing = [p for p in xrange(nb_pages) if p not in self.thumbnails]
+        if not missing:
+            return None
+        page_nb = min(missing, key=distance)
+
+        if self.thumbnails:
+            average = self.memory / len(self.thumbnails)
+            if self.memory + average > self.max_memory:
+                droppable = [p for p in self.thumbnails if p not in self.visible]
+                if not droppable or distance(max(droppable, key=distance)) <= distance(page_nb):
+                    return None
+        return page_nb
+
+    def shrink(self):
+        """
+        Drop the thumbnails of the pages farthest from the current page until
+        :attr:`max_memory` is respected. Visible pages are always kept. Must be
+        called with :attr:`cond` acquired.
+        """
+        pages = sorted(self.thumbnails, key=lambda p: abs(p - self.cur_page), reverse=True)
+        for p in pages:
+            if self.memory <= self.max_memory:
+                break
+            if p not in self.visible:
+                self.memory -= self.size_of(self.thumbnails[p])
+                self.cache.pool.put(self.thumbnails.pop(p))
+                pympress.stats.count("thumbnails evicted")
+
+    def renderer(self):
+        """
+        Rendering thread: render the thumbnails chosen by :meth:`next_job`,
+        forever.
+        """
+        while True:
+            with self.cond:
+                page_nb = self.next_job()
+                while page_nb is None:
+                    self.cond.wait()
+                    page_nb = self.next_job()
+                visible = page_nb in self.visible
+
+            # Let the rendering of real pages go first, unless this thumbnail
+            # is currently visible
+            if not visible:
+                time.sleep(0.05)
+
+            with self.doc.lock:
+                page = self.doc.page(page_nb)
+                if page is None:
+                    continue
+                generation = self.doc.generation
+            ratio = page.get_aspect_ratio(PDF_CONTENT_PAGE)
+            tw, th = self.width, max(1, int(round(self.width / ratio)))
+            thumbnail = self.cache.render(page, tw, th, PDF_CONTENT_PAGE)
+            pympress.stats.count("thumbnails rendered")
+
+            with self.cond:
+                if generation != self.doc.generation or page_nb in self.thumbnails:
+                    continue
+                self.thumbnails[page_nb] = thumbnail
+                self.memory += self.size_of(thumbnail)
+                self.shrink()
+
+            if self.callback is not None:
+                gobject.idle_add(self.callback, page_nb)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,214 @@
+#       tiles.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.tiles` -- tiled rendering of zoomed pages
+--------------------------------------------------------
+
+This module contains the :class:`~pympress.tiles.TileCache` class, which
+renders zoomed pages as fixed-size square tiles. When a page is zoomed, only
+the tiles that are visible are rendered, so a page can be magnified many times
+without ever allocating a surface for the whole zoomed page.
+
+Tiles are identified by ``(page, type, width, height, zoom, column, row)``
+tuples: the page number (see :meth:`pympress.pixbufcache.PixbufCache.key`), the
+type of document, the size of the widget in which the page fits when it is not
+zoomed, the zoom level (one of :const:`ZOOM_LEVELS`), and the position of the
+tile in the zoomed page. They are rendered on demand by a background thread,
+and kept in a cache of bounded size from which the least recently used tiles
+are evicted.
+"""
+
+import collections
+import threading
+
+import cairo
+import gobject
+
+import pympress.stats
+
+#: Available zoom levels.
+ZOOM_LEVELS = (1, 2, 4, 8, 16)
+
+
+def render_tile(page, key, size, surface=None):
+    """
+    Render a tile of a zoomed page.
+
+    :param page: the page to render
+    :type  page: :class:`pympress.document.Page`
+    :param key: the tile to render (see :mod:`pympress.tiles`)
+    :type  key: tuple
+    :param size: size of the tile in pixels
+    :type  size: integer
+    :param surface: surface of the right size to render the tile on, or
+       ``None`` to use a new surface
+    :type  surface: :class:`cairo.ImageSurface`
+    :return: the rendered tile
+    :rtype: :class:`cairo.ImageSurface`
+    """
+    page_nb, type, ww, wh, zoom, col, row = key
+    if surface is None:
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, size, size)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(0, 0, 0)
+    cr.paint()
+    cr.translate(-col * size, -row * size)
+    cr.scale(zoom, zoom)
+    page.render_cairo(cr, ww, wh, type)
+    surface.flush()
+    return surface
+
+
+class TileCache:
+    """Background rendering and caching of the tiles of zoomed pages."""
+
+    #: Size of the tiles, in pixels.
+    tile_size = 256
+
+    #: Maximum number of tiles kept in the cache.
+    max_tiles = 256
+
+    #: The current :class:`~pympress.document.Document`.
+    doc = None
+
+    #: :class:`~pympress.pixbufcache.PixbufCache` whose render lock and buffer
+    #: pool are used to render the tiles.
+    cache = None
+
+    #: The tiles, as an :class:`~collections.OrderedDict` of
+    #: :class:`cairo.ImageSurface` indexed by tile keys, from the least recently
+    #: used to the most recently used.
+    tiles = None
+
+    #: Keys of the tiles to render for each widget, as lists indexed by widget
+    #: names, the most urgent tile last.
+    jobs = {}
+
+    #: :class:`~threading.Condition` used to manage concurrent accesses to
+    #: :attr:`tiles` and :attr:`jobs`, and to wake up the rendering thread.
+    cond = None
+
+    #: Function called (in the main loop) with the key of each tile that has
+    #: been rendered, or ``None``.
+    callback = None
+
+    def __init__(self, doc, cache, callback=None):
+        """
+        :param doc: the current document
+        :type  doc: :class:`pympress.document.Document`
+        :param cache: the cache used to render pages
+        :type  cache: :class:`~pympress.pixbufcache.PixbufCache`
+        :param callback: see :attr:`callback`
+        :type  callback: function
+        """
+        self.doc = doc
+        self.cache = cache
+        self.callback = callback
+        self.tiles = collections.OrderedDict()
+        self.jobs = {}
+        self.cond = threading.Condition()
+
+        thread = threading.Thread(target=self.renderer)
+        thread.daemon = True
+        thread.start()
+
+    def get(self, key):
+        """
+        Get a tile from the cache.
+
+        :param key: the wanted tile
+        :type  key: tuple
+        :return: the tile if available, or ``None`` otherwise
+        :rtype: :class:`cairo.ImageSurface`
+        """
+        with self.cond:
+            tile = self.tiles.pop(key, None)
+            if tile is not None:
+                self.tiles[key] = tile
+            return tile
+
+    def request(self, name, keys):
+        """
+        Set the tiles to render for a widget. They replace the ones that were
+        requested before for the same widget (which are not visible anymore),
+        and are rendered in order.
+
+        :param name: name of the widget
+        :type  name: string
+        :param keys: the tiles to render
+        :type  keys: list of tuples
+        """
+        with self.cond:
+            self.jobs[name] = [key for key in reversed(keys) if key not in self.tiles]
+            self.cond.notify()
+
+    def cancel(self):
+        """Forget the tiles that have been requested but not rendered yet."""
+        with self.cond:
+            self.jobs.clear()
+
+    def clear(self):
+        """Forget all the tiles (e.g. after the document has been reloaded)."""
+        with self.cond:
+            self.tiles.clear()
+            self.jobs.clear()
+
+    def renderer(self):
+        """
+        Rendering thread: render the requested tiles, forever.
+        """
+        while True:
+            with self.cond:
+                while not any(self.jobs.itervalues()):
+                    self.cond.wait()
+                name = min(name for name, keys in self.jobs.iteritems() if keys)
+                key = self.jobs[name].pop()
+                if key in self.tiles:
+                    continue
+
+            with self.doc.lock:
+                page = self.doc.page(key[0])
+                if page is None:
+                    continue
+                generation = self.doc.generation
+
+            size = self.tile_size
+            with self.cache.render_lock:
+                tile = render_tile(page, key, size, self.cache.pool.get(size, size))
+            pympress.stats.count("tiles rendered")
+
+            with self.cond:
+                if generation != self.doc.generation:
+                    continue
+                self.tiles[key] = tile
+                del tile
+                while len(self.tiles) > self.max_tiles:
+                    self.cache.pool.put(self.tiles.popitem(False)[1])
+
+            if self.callback is not None:
+                gobject.idle_add(self.callback, key)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
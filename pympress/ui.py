@@ -29,12 +29,9 @@ current and the next page, as well as a time counter and a clock.
 Both windows are managed by the :class:`~pympress.ui.UI` class.
 """
 
-import os
 import sys
 import time
 
-import pkg_resources
-
 import pygtk
 pygtk.require('2.0')
 import gobject
@@ -42,14 +39,14 @@ import gtk
 import pango
 
 import pympress.pixbufcache
+import pympress.screensaver
+import pympress.search
+import pympress.stats
+import pympress.thumbnails
+import pympress.tiles
 import pympress.util
 
-#: "Regular" PDF file (without notes)
-PDF_REGULAR      = 0
-#: Content page (left side) of a PDF file with notes
-PDF_CONTENT_PAGE = 1
-#: Notes page (right side) of a PDF file with notes
-PDF_NOTES_PAGE   = 2
+from pympress.document import PDF_REGULAR, PDF_CONTENT_PAGE, PDF_NOTES_PAGE
 
 class UI:
     """Pympress GUI management."""
@@ -59,6 +56,8 @@ class UI:
 
     #: Content window, as a :class:`gtk.Window` instance.
     c_win = gtk.Window(gtk.WINDOW_TOPLEVEL)
+    #: Presenter window, as a :class:`gtk.Window` instance.
+    p_win = None
     #: :class:`~gtk.AspectFrame` for the Content window.
     c_frame = gtk.AspectFrame(ratio=4./3., obey_child=False)
     #: :class:`~gtk.DrawingArea` for the Content window.
@@ -93,6 +92,11 @@ class UI:
     delta = 0
     #: Timer paused status.
     paused = True
+    #: ID of the GLib source of the next update of the timer and clock labels.
+    time_source = None
+    #: Text currently displayed by the timer and clock labels, so that they
+    #: are only updated when it changes.
+    time_texts = (None, None)
 
     #: Fullscreen toggle. By default, don't start in fullscreen mode.
     fullscreen = False
@@ -102,6 +106,82 @@ class UI:
 
     #: Whether to use notes mode or not
     notes_mode = False
+    #: :class:`~gtk.ToggleAction` used to switch notes mode on and off
+    notes_action = None
+
+    #: Whether pages that are not in the cache should be rendered in the
+    #: background while a low-resolution preview is displayed (``True``), or
+    #: rendered immediately, blocking the GUI (``False``)
+    progressive = True
+    #: Ratio between the size of the widgets and the size of the previews
+    preview_scale = 4
+
+    #: Maximum time (in milliseconds) between a navigation event and the first
+    #: paint of the new page in the Content window. When a page is not in the
+    #: cache, pympress waits for it at most until this deadline, and then
+    #: displays the best available substitute instead (see :meth:`on_expose`).
+    deadline = 50
+    #: Time of the last navigation event whose page has not been displayed yet,
+    #: or ``None``.
+    nav_time = None
+
+    #: Dictionary of the widgets displaying pages, indexed by their names
+    widgets = {}
+    #: Number of the page whose full render is currently displayed by each
+    #: widget, indexed by widget names. Widgets displaying a substitute (or
+    #: nothing yet) are not listed.
+    displayed = {}
+
+    #: :class:`~pympress.thumbnails.ThumbnailCache` instance.
+    thumbnails = None
+    #: :class:`~gtk.Alignment` containing the main part of the Presenter window
+    #: (hidden when the overview is displayed).
+    p_align = None
+    #: :class:`~gtk.ScrolledWindow` containing the overview of all the slides.
+    overview = None
+    #: :class:`~gtk.DrawingArea` for the overview of all the slides.
+    overview_da = None
+    #: :class:`~gtk.ToggleAction` used to show and hide the overview
+    overview_action = None
+    #: Space between the thumbnails in the overview, in pixels.
+    overview_padding = 10
+
+    #: :class:`~pympress.search.SearchIndex` instance.
+    search = None
+    #: :class:`~gtk.HBox` containing the search entry, hidden by default.
+    search_bar = None
+    #: :class:`~gtk.Entry` in which the searched text is typed.
+    search_entry = None
+    #: :class:`~gtk.Label` displaying the search results.
+    search_label = None
+    #: Numbers of the pages matching the current search.
+    search_results = []
+
+    #: :class:`~pympress.tiles.TileCache` instance, used to display the current
+    #: page when it is zoomed.
+    tiles = None
+    #: Index of the current zoom level in :const:`pympress.tiles.ZOOM_LEVELS`
+    #: (0 when the current page is not zoomed).
+    zoom = 0
+    #: Position of the top-left corner of the zoomed view, as fractions of the
+    #: width and height of the page.
+    zoom_origin = (0., 0.)
+
+    #: :class:`~pympress.screensaver.Screensaver` instance.
+    screensaver = None
+
+    #: :class:`gtk.gdk.Cursor` displayed over hyperlinks.
+    link_cursor = None
+    #: Hyperlink under the mouse pointer in each widget, indexed by widget
+    #: names, so that the cursor is only changed when it changes.
+    hovered = {}
+
+    #: :class:`~pympress.frames.FramePublisher` to which the frames of the
+    #: Content window are published, or ``None``.
+    frames = None
+    #: Last frame published, as a ``(page number, width, height)`` tuple, so
+    #: that each frame is only published once.
+    published = None
 
     #: To remember digital key
     s_go_page_num = ""
@@ -114,11 +194,15 @@ class UI:
         """
         black = gtk.gdk.Color(0, 0, 0)
 
-        # Common to both windows
-        icon_list = pympress.util.load_icons()
-
         # Pixbuf cache
-        self.cache = pympress.pixbufcache.PixbufCache(doc)
+        self.cache = pympress.pixbufcache.PixbufCache(doc, self.on_rendered)
+        self.widgets = {"c_da": self.c_da, "p_da_cur": self.p_da_cur, "p_da_next": self.p_da_next}
+        self.hovered = {}
+        self.displayed = {}
+        self.thumbnails = pympress.thumbnails.ThumbnailCache(doc, self.cache, self.on_thumbnail)
+        self.search = pympress.search.SearchIndex(doc, self.on_search_progress)
+        self.tiles = pympress.tiles.TileCache(doc, self.cache, self.on_tile)
+        self.screensaver = pympress.screensaver.Screensaver()
 
         # Use notes mode by default if the document has notes
         self.notes_mode = doc.has_notes()
@@ -128,7 +212,6 @@ class UI:
         self.c_win.set_default_size(800, 600)
         self.c_win.modify_bg(gtk.STATE_NORMAL, black)
         self.c_win.connect("delete-event", gtk.main_quit)
-        self.c_win.set_icon_list(*icon_list)
 
         self.c_frame.modify_bg(gtk.STATE_NORMAL, black)
 
@@ -136,9 +219,9 @@ class UI:
         self.c_da.connect("expose-event", self.on_expose)
         self.c_da.set_name("c_da")
         if self.notes_mode:
-            self.cache.add_widget("c_da", pympress.document.PDF_CONTENT_PAGE)
+            self.cache.add_widget("c_da", PDF_CONTENT_PAGE)
         else:
-            self.cache.add_widget("c_da", pympress.document.PDF_REGULAR)
+            self.cache.add_widget("c_da", PDF_REGULAR)
         self.c_da.connect("configure-event", self.on_configure)
 
         self.c_frame.add(self.c_da)
@@ -149,16 +232,15 @@ class UI:
         self.c_win.connect("scroll-event", self.on_navigation)
 
         # Presenter window
-        p_win = gtk.Window(gtk.WINDOW_TOPLEVEL)
-        p_win.set_title("pympress presenter")
-        p_win.set_default_size(800, 600)
-        p_win.set_position(gtk.WIN_POS_CENTER)
-        p_win.connect("delete-event", gtk.main_quit)
-        p_win.set_icon_list(*icon_list)
+        self.p_win = gtk.Window(gtk.WINDOW_TOPLEVEL)
+        self.p_win.set_title("pympress presenter")
+        self.p_win.set_default_size(800, 600)
+        self.p_win.set_position(gtk.WIN_POS_CENTER)
+        self.p_win.connect("delete-event", gtk.main_quit)
 
         # Put Menu and Table in VBox
         bigvbox = gtk.VBox(False, 2)
-        p_win.add(bigvbox)
+        self.p_win.add(bigvbox)
 
         # UI Manager for menu
         ui_manager = gtk.UIManager()
@@ -174,6 +256,8 @@ class UI:
             <menuitem action="Reset timer"/>
             <menuitem action="Fullscreen"/>
             <menuitem action="Notes mode"/>
+            <menuitem action="Overview"/>
+            <menuitem action="Search"/>
           </menu>
           <menu action="Help">
             <menuitem action="About"/>
@@ -183,7 +267,7 @@ class UI:
 
         # Accelerator group
         accel_group = ui_manager.get_accel_group()
-        p_win.add_accel_group(accel_group)
+        self.p_win.add_accel_group(accel_group)
 
         # Action group
         action_group = gtk.ActionGroup("MenuBar")
@@ -195,14 +279,18 @@ class UI:
 
             ("Quit",         gtk.STOCK_QUIT, "_Quit",        "q",  None, gtk.main_quit),
             ("Reset timer",  None,           "_Reset timer", "r",  None, self.reset_timer),
+            ("Search",       gtk.STOCK_FIND, "_Search",      "slash", None, self.show_search),
             ("About",        None,           "_About",       None, None, self.menu_about),
         ])
         action_group.add_toggle_actions([
             ("Pause timer",  None,           "_Pause timer", "p",  None, self.switch_pause,      True),
             ("Fullscreen",   None,           "_Fullscreen",  "f",  None, self.switch_fullscreen, False),
             ("Notes mode",   None,           "_Note mode",   "n",  None, self.switch_mode,       self.notes_mode),
+            ("Overview",     None,           "_Overview",    "o",  None, self.switch_overview,   False),
         ])
         ui_manager.insert_action_group(action_group)
+        self.notes_action = action_group.get_action("Notes mode")
+        self.overview_action = action_group.get_action("Overview")
 
         # Add menu bar to the window
         menubar = ui_manager.get_widget('/MenuBar')
@@ -210,6 +298,25 @@ class UI:
         h.set_right_justified(True)
         bigvbox.pack_start(menubar, False)
 
+        # Search bar, hidden by default
+        self.search_bar = gtk.HBox(False, 10)
+        self.search_bar.set_border_width(5)
+        self.search_entry = gtk.Entry()
+        self.search_entry.connect("changed", self.update_search)
+        self.search_entry.connect("activate", self.on_search_activate)
+        self.search_entry.connect("key-press-event", self.on_search_key)
+        self.search_label = gtk.Label()
+        self.search_label.set_alignment(0, 0.5)
+        self.search_label.set_ellipsize(pango.ELLIPSIZE_END)
+        label = gtk.Label("Search:")
+        self.search_bar.pack_start(label, False)
+        self.search_bar.pack_start(self.search_entry, False)
+        self.search_bar.pack_start(self.search_label)
+        for w in [label, self.search_entry, self.search_label]:
+            w.show()
+        self.search_bar.set_no_show_all(True)
+        bigvbox.pack_start(self.search_bar, False)
+
         # A little space around everything in the window
         align = gtk.Alignment(0.5, 0.5, 1, 1)
         align.set_padding(20, 20, 20, 20)
@@ -220,6 +327,22 @@ class UI:
         table.set_row_spacings(25)
         align.add(table)
         bigvbox.pack_end(align)
+        self.p_align = align
+
+        # Overview of all the slides, hidden by default
+        self.overview = gtk.ScrolledWindow()
+        self.overview.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
+        self.overview_da = gtk.DrawingArea()
+        self.overview_da.modify_bg(gtk.STATE_NORMAL, black)
+        self.overview_da.add_events(gtk.gdk.BUTTON_PRESS_MASK)
+        self.overview_da.connect("expose-event", self.on_overview_expose)
+        self.overview_da.connect("button-press-event", self.on_overview_click)
+        self.overview.connect("size-allocate", self.on_overview_resize)
+        self.overview.add_with_viewport(self.overview_da)
+        self.overview_da.show()
+        self.overview.get_child().show()
+        self.overview.set_no_show_all(True)
+        bigvbox.pack_end(self.overview)
 
         # "Current slide" frame
         #frame = gtk.Frame("Current slide")
@@ -294,38 +417,34 @@ class UI:
         self.label_clock.set_use_markup(True)
         align.add(self.label_clock)
 
-        p_win.connect("destroy", gtk.main_quit)
-        p_win.show_all()
+        self.p_win.connect("destroy", gtk.main_quit)
+        self.p_win.show_all()
 
 
         # Add events
-        p_win.add_events(gtk.gdk.KEY_PRESS_MASK | gtk.gdk.SCROLL_MASK)
-        p_win.connect("key-press-event", self.on_navigation)
-        p_win.connect("scroll-event", self.on_navigation)
+        self.p_win.add_events(gtk.gdk.KEY_PRESS_MASK | gtk.gdk.SCROLL_MASK)
+        self.p_win.connect("key-press-event", self.on_navigation)
+        self.p_win.connect("scroll-event", self.on_navigation)
 
-        # Hyperlinks if available
+        # Hyperlinks if available. With motion hints, X only sends a new
+        # motion event once the previous one has been handled (see on_link).
         if pympress.util.poppler_links_available():
-            self.c_da.add_events(gtk.gdk.BUTTON_PRESS_MASK | gtk.gdk.POINTER_MOTION_MASK)
-            self.c_da.connect("button-press-event", self.on_link)
-            self.c_da.connect("motion-notify-event", self.on_link)
-
-            self.p_da_cur.add_events(gtk.gdk.BUTTON_PRESS_MASK | gtk.gdk.POINTER_MOTION_MASK)
-            self.p_da_cur.connect("button-press-event", self.on_link)
-            self.p_da_cur.connect("motion-notify-event", self.on_link)
-
-            self.p_da_next.add_events(gtk.gdk.BUTTON_PRESS_MASK | gtk.gdk.POINTER_MOTION_MASK)
-            self.p_da_next.connect("button-press-event", self.on_link)
-            self.p_da_next.connect("motion-notify-event", self.on_link)
+            self.link_cursor = gtk.gdk.Cursor(gtk.gdk.HAND2)
+            for da in [self.c_da, self.p_da_cur, self.p_da_next]:
+                da.add_events(gtk.gdk.BUTTON_PRESS_MASK | gtk.gdk.POINTER_MOTION_MASK
+                              | gtk.gdk.POINTER_MOTION_HINT_MASK)
+                da.connect("button-press-event", self.on_link)
+                da.connect("motion-notify-event", self.on_link)
 
         # Setup timer
-        gobject.timeout_add(250, self.update_time)
+        self.update_time()
 
         # Document
         self.doc = doc
 
         # Show all windows
         self.c_win.show_all()
-        p_win.show_all()
+        self.p_win.show_all()
 
 
     def run(self):
@@ -334,6 +453,71 @@ class UI:
             gtk.main()
 
 
+    def on_document_ready(self):
+        """
+        Display the document as soon as it has been opened.
+
+        This is a kind of event which is supposed to be called only from the
+        :class:`~pympress.document.Document` class. The current page is
+        displayed first; everything that is not needed for that (e.g. loading
+        the windows icons) is deferred until the main loop is idle.
+        """
+        if self.doc.has_notes() != self.notes_mode:
+            # This calls switch_mode(), which displays the current page
+            self.notes_action.set_active(self.doc.has_notes())
+        else:
+            self.on_page_change(False)
+
+        gobject.idle_add(self.load_icons, priority=gobject.PRIORITY_LOW)
+        gobject.idle_add(self.start_background, priority=gobject.PRIORITY_LOW)
+
+
+    def start_background(self):
+        """
+        Start rendering the thumbnails, indexing the text of all the pages and
+        computing their fingerprints in the background.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        self.thumbnails.start()
+        self.search.start()
+        if not self.doc.watch:
+            # In watch mode, the document does it when it starts watching
+            self.doc.start_fingerprinting()
+        return False
+
+
+    def on_open_failed(self, message):
+        """
+        Tell the user that the document could not be opened, and quit.
+
+        :param message: the error message
+        :type  message: string
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        dialog = gtk.MessageDialog(type=gtk.MESSAGE_ERROR, buttons=gtk.BUTTONS_OK, message_format=message)
+        dialog.set_position(gtk.WIN_POS_CENTER)
+        dialog.run()
+        dialog.destroy()
+        gtk.main_quit()
+        return False
+
+
+    def load_icons(self):
+        """
+        Load the pympress icons and set them on both windows.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        icon_list = pympress.util.load_icons()
+        self.c_win.set_icon_list(*icon_list)
+        self.p_win.set_icon_list(*icon_list)
+        return False
+
+
     def menu_about(self, widget=None, event=None):
         """Display the "About pympress" dialog."""
         about = gtk.AboutDialog()
@@ -343,8 +527,7 @@ class UI:
         about.set_comments("pympress is a little PDF reader written in Python using Poppler for PDF rendering and GTK for the GUI.")
         about.set_website("http://www.pympress.org/")
         try:
-            req = pkg_resources.Requirement.parse("pympress")
-            icon_fn = pkg_resources.resource_filename(req, "share/pixmaps/pympress-128.png")
+            icon_fn = pympress.util.get_icon_path("pympress-128.png")
             about.set_logo(gtk.gdk.pixbuf_new_from_file(icon_fn))
         except Exception, e:
             print e
@@ -377,25 +560,80 @@ class UI:
             self.p_frame_next.set_property("ratio", pr)
 
         # Start counter if needed
-        if unpause:
+        if unpause and self.paused:
             self.paused = False
             if self.start_time == 0:
                 self.start_time = time.time()
+            self.update_time()
 
         # Update display
         self.update_page_numbers()
+        self.reset_zoom()
 
         # Don't queue draw event but draw directly (faster)
+        if self.nav_time is None:
+            self.nav_time = time.time()
         self.on_expose(self.c_da)
+        self.check_deadline()
         self.on_expose(self.p_da_cur)
         self.on_expose(self.p_da_next)
 
-        # Prerender the 4 next pages and the 2 previous ones
-        cur = page_cur.number()
-        page_max = min(self.doc.pages_number(), cur + 5)
-        page_min = max(0, cur - 2)
-        for p in range(cur+1, page_max) + range(cur, page_min, -1):
-            self.cache.prerender(p)
+        # Thumbnails and overview
+        self.thumbnails.set_current(page_cur.number())
+        if self.overview.get_visible():
+            self.overview_da.queue_draw()
+
+        # Prerender the next pages (further ahead for expensive ones) and the
+        # previous one
+        self.cache.prerender_around(page_cur.number())
+
+
+    def deadline_remaining(self):
+        """
+        Get the time left before the :attr:`deadline` of the last navigation
+        event.
+
+        :return: remaining time in seconds (0 if there is no pending navigation
+           event or if the deadline has already been missed)
+        :rtype: float
+        """
+        if self.nav_time is None:
+            return 0.
+        return max(0., self.nav_time + self.deadline/1000. - time.time())
+
+
+    def check_deadline(self):
+        """
+        Record how long it took to display a new page after a navigation event,
+        and whether the :attr:`deadline` has been missed. When nothing could be
+        painted at all, :meth:`on_expose` also counts a frame not painted.
+        """
+        latency = (time.time() - self.nav_time) * 1000
+        self.nav_time = None
+        pympress.stats.record("page change latency (ms)", latency)
+        if latency > self.deadline:
+            pympress.stats.count("page change deadline misses")
+
+
+    def on_document_reload(self, mapping):
+        """
+        Display the document again after it has been reloaded.
+
+        This is a kind of event which is supposed to be called only from the
+        :class:`~pympress.document.Document` class.
+
+        :param mapping: dictionary whose keys are the new page numbers of the
+           unchanged pages, and whose values are their old page numbers
+        :type  mapping: dictionary
+        """
+        self.cache.remap(mapping)
+        self.tiles.clear()
+        self.displayed.clear()
+        self.published = None
+        self.thumbnails.remap(mapping)
+        self.search.remap(mapping)
+        self.on_page_change(False)
+        self.update_search()
 
 
     def on_expose(self, widget, event=None):
@@ -407,11 +645,28 @@ class UI:
         be updated, and updates it, using the
         :class:`~pympress.pixbufcache.PixbufCache` if possible.
 
+        In progressive mode, when the page is not in the cache, it is rendered
+        in the background, and this function waits for it until the
+        :attr:`deadline` of the last navigation event. If it is still not
+        available, the best substitute is displayed instead: the same page
+        rendered for another widget (scaled), its thumbnail (if the widget
+        displays the same part of the page as the thumbnail), or a
+        low-resolution preview. The widget is redrawn
+        when the real page is available.
+
+        On a page change, if the new page is similar to the one that is
+        displayed (e.g. the next step of an overlay), only the tiles that differ
+        are repainted (see :meth:`pympress.pixbufcache.PixbufCache.dirty_area`).
+
+        When the current page is zoomed, it is painted by :meth:`paint_zoomed`.
+
         :param widget: the widget to update
         :type  widget: :class:`gtk.Widget`
         :param event: the GTK event (or ``None`` if called directly)
         :type  event: :class:`gtk.gdk.Event`
         """
+        if not self.doc.is_open():
+            return
 
         if widget in [self.c_da, self.p_da_cur]:
             # Current page
@@ -428,24 +683,275 @@ class UI:
                 widget.show_all()
                 widget.parent.set_shadow_type(gtk.SHADOW_IN)
 
-        # Instead of rendering the document to a Cairo surface (which is slow),
-        # use a pixbuf from the cache if possible.
+        # Instead of rendering the document each time (which is slow), use a
+        # surface from the cache if possible.
         name = widget.get_name()
         nb = page.number()
         pb = self.cache.get(name, nb)
         wtype = self.cache.get_widget_type(name)
-
-        if pb is None:
+        substitute_shown = False
+
+        if pb is None and self.progressive:
+            # Cache miss: find something to display meanwhile, let a background
+            # thread render the page in full resolution, and wait for it until
+            # the deadline. The preview is rendered before the full page is
+            # requested: once the background thread holds the render lock, it
+            # can't be rendered without waiting. If nothing is available, keep
+            # the widget as it is until the real page is available.
+            substitute = self.cache.get_substitute(name, nb)
+            if substitute is None and page.layout_type(wtype) == page.layout_type(PDF_CONTENT_PAGE):
+                # Thumbnails only show the content half of pages with notes
+                substitute = self.thumbnails.get(nb)
+            if substitute is None:
+                substitute = self.render_page(page, widget, wtype, self.preview_scale)
+
+            self.cache.request(name, nb)
+            remaining = self.deadline_remaining()
+            if remaining > 0:
+                pb = self.cache.wait(name, nb, remaining)
+            if pb is None:
+                pb = substitute
+                if pb is None:
+                    # The previous page stays on screen: this must not be
+                    # mistaken for a late page in the latency statistics
+                    pympress.stats.count("frames not painted")
+                    return
+                substitute_shown = True
+                pympress.stats.count("substitutes displayed")
+        elif pb is None:
             # Cache miss: render the page, and save it to the cache
-            self.render_page(page, widget, wtype)
-            ww, wh = widget.window.get_size()
-            pb = gtk.gdk.Pixbuf(gtk.gdk.COLORSPACE_RGB, False, 8, ww, wh)
-            pb.get_from_drawable(widget.window, widget.window.get_colormap(), 0, 0, 0, 0, ww, wh)
+            pb = self.render_page(page, widget, wtype)
+            if pb is None:
+                return
             self.cache.set(name, nb, pb)
-        else:
-            # Cache hit: draw the pixbuf from the cache to the widget
-            gc = widget.window.new_gc()
-            widget.window.draw_pixbuf(gc, pb, 0, 0, 0, 0)
+
+        area = event.area if event is not None else None
+        if self.zoom and widget in [self.c_da, self.p_da_cur]:
+            self.displayed.pop(name, None)
+            self.paint_zoomed(widget, nb, wtype, pb, area)
+            return
+
+        # Only repaint the exposed area, or the tiles that changed since the
+        # last page
+        rects = None
+        old_nb = self.displayed.get(name)
+        if substitute_shown:
+            self.displayed.pop(name, None)
+        elif area is None:
+            if old_nb is not None and old_nb != nb:
+                rects = self.cache.dirty_area(name, old_nb, nb)
+                if rects is not None:
+                    pympress.stats.count("partial repaints")
+            self.displayed[name] = nb
+        elif old_nb != nb:
+            ww, wh = widget.window.get_size()
+            if area.width >= ww and area.height >= wh:
+                self.displayed[name] = nb
+            else:
+                self.displayed.pop(name, None)
+        self.paint_surface(widget, pb, area, rects)
+        if widget is self.c_da and not substitute_shown:
+            self.publish_frame(nb, pb)
+
+
+    def publish_frame(self, nb, pb):
+        """
+        Publish the page displayed in the Content window to the external
+        programs (see :mod:`pympress.frames`), unless it has already been.
+        Zoomed views and substitutes are not published.
+
+        :param nb: number of the displayed page
+        :type  nb: integer
+        :param pb: the displayed page
+        :type  pb: :class:`cairo.ImageSurface`
+        """
+        if self.frames is None:
+            return
+        frame = (nb, pb.get_width(), pb.get_height())
+        if frame != self.published:
+            self.published = frame
+            self.frames.publish_surface(pb, nb)
+
+
+    def overview_geometry(self):
+        """
+        Compute the layout of the overview.
+
+        :return: number of columns, size of a cell (containing a thumbnail and
+           its page number), and horizontal offset of the first column
+        :rtype: (integer, integer, integer, integer)
+        """
+        pad = self.overview_padding
+        ratio = self.doc.page(0).get_aspect_ratio(PDF_CONTENT_PAGE)
+        cw = self.thumbnails.width + 2*pad
+        ch = int(self.thumbnails.width / ratio) + 3*pad + 12
+        aw = self.overview.get_allocation().width
+        cols = max(1, aw / cw)
+        return cols, cw, ch, (aw - cols*cw) / 2
+
+
+    def on_overview_resize(self, widget, allocation):
+        """
+        Resize the overview drawing area so that it can contain all the
+        thumbnails with the new width of the overview.
+
+        :param widget: the overview
+        :type  widget: :class:`gtk.ScrolledWindow`
+        :param allocation: the new size of the overview
+        :type  allocation: :class:`gtk.gdk.Rectangle`
+        """
+        if not self.doc.is_open():
+            return
+        cols, cw, ch, x0 = self.overview_geometry()
+        rows = (self.doc.pages_number() + cols - 1) / cols
+        self.overview_da.set_size_request(-1, rows * ch)
+
+
+    def on_overview_expose(self, widget, event):
+        """
+        Draw the thumbnails of the overview.
+
+        Only the thumbnails in the exposed area are drawn, and the thumbnails
+        of the pages that are visible are rendered first (the others are
+        rendered later in the background).
+
+        :param widget: the overview drawing area
+        :type  widget: :class:`gtk.DrawingArea`
+        :param event: the GTK event
+        :type  event: :class:`gtk.gdk.Event`
+        """
+        if not self.doc.is_open():
+            return
+
+        cols, cw, ch, x0 = self.overview_geometry()
+        nb_pages = self.doc.pages_number()
+        cur = self.doc.current_page().number()
+        pad = self.overview_padding
+
+        # Visible pages
+        adj = self.overview.get_vadjustment()
+        first = int(adj.get_value()) / ch * cols
+        last = int(adj.get_value() + adj.get_page_size()) / ch * cols + cols
+        self.thumbnails.set_visible(range(first, min(last, nb_pages)))
+
+        # Exposed pages
+        area = event.area
+        first = area.y / ch * cols
+        last = min(nb_pages, (area.y + area.height) / ch * cols + cols)
+
+        cr = widget.window.cairo_create()
+        cr.rectangle(area.x, area.y, area.width, area.height)
+        cr.clip()
+        cr.set_font_size(12)
+
+        for nb in range(first, last):
+            x = x0 + (nb % cols) * cw + pad
+            y = (nb / cols) * ch + pad
+            tw, th = self.thumbnails.width, ch - 3*pad - 12
+
+            # Highlight the current page
+            if nb == cur:
+                cr.set_source_rgb(0.8, 0.2, 0.2)
+                cr.rectangle(x - pad/2, y - pad/2, tw + pad, th + pad)
+                cr.fill()
+
+            thumbnail = self.thumbnails.get(nb)
+            cr.save()
+            if thumbnail is None:
+                cr.set_source_rgb(0.3, 0.3, 0.3)
+                cr.rectangle(x, y, tw, th)
+                cr.fill()
+            else:
+                cr.translate(x, y)
+                scale = min(float(tw) / thumbnail.get_width(), float(th) / thumbnail.get_height())
+                cr.scale(scale, scale)
+                cr.set_source_surface(thumbnail, 0, 0)
+                cr.paint()
+            cr.restore()
+
+            text = str(nb + 1)
+            cr.set_source_rgb(1, 1, 1)
+            x_bearing, y_bearing, w, h = cr.text_extents(text)[:4]
+            cr.move_to(x + (tw - w)/2 - x_bearing, y + th + pad - y_bearing)
+            cr.show_text(text)
+
+
+    def on_overview_click(self, widget, event):
+        """
+        Go to the page that has been clicked in the overview, and hide it.
+
+        :param widget: the overview drawing area
+        :type  widget: :class:`gtk.DrawingArea`
+        :param event: the GTK event
+        :type  event: :class:`gtk.gdk.Event`
+        """
+        if not self.doc.is_open():
+            return
+
+        cols, cw, ch, x0 = self.overview_geometry()
+        x, y = event.get_coords()
+        col = int(x - x0) / cw
+        if x < x0 or col >= cols:
+            return
+        nb = int(y) / ch * cols + col
+        if nb < self.doc.pages_number():
+            self.overview_action.set_active(False)
+            self.nav_time = time.time()
+            self.doc.goto(nb)
+            self.nav_time = None
+
+
+    def on_thumbnail(self, page_nb):
+        """
+        Draw a thumbnail in the overview once it has been rendered.
+
+        :param page_nb: number of the page whose thumbnail has been rendered
+        :type  page_nb: integer
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        if self.overview.get_visible():
+            cols, cw, ch, x0 = self.overview_geometry()
+            self.overview_da.queue_draw_area(x0 + (page_nb % cols) * cw, (page_nb / cols) * ch, cw, ch)
+        return False
+
+
+    def on_rendered(self, widget_name, page_nb):
+        """
+        Redraw a widget once a page requested during an expose event has been
+        rendered in the background.
+
+        :param widget_name: name of the widget
+        :type  widget_name: string
+        :param page_nb: number of the page that has been rendered
+        :type  page_nb: integer
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        self.widgets[widget_name].queue_draw()
+        return False
+
+
+    def on_tile(self, key):
+        """
+        Draw a tile of the zoomed page once it has been rendered.
+
+        :param key: the tile that has been rendered (see :mod:`pympress.tiles`)
+        :type  key: tuple
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        if not self.zoom or key[0] != self.cache.key(self.doc.current_page().number()):
+            return False
+
+        size = self.tiles.tile_size
+        for widget in [self.c_da, self.p_da_cur]:
+            if widget.window is None:
+                continue
+            ww, wh, z, ox, oy = self.zoom_geometry(widget)
+            if key[2:5] == (ww, wh, z):
+                widget.queue_draw_area(key[5]*size - ox, key[6]*size - oy, size, size)
+        return False
 
 
     def on_configure(self, widget, event):
@@ -476,6 +982,16 @@ class UI:
         :param event: the event that occured
         :type  event: :class:`gtk.gdk.Event`
         """
+        if not self.doc.is_open():
+            return
+
+        # Let the entries of the Presenter window handle the keys they need,
+        # before they are used for navigation or as accelerators
+        if event.type == gtk.gdk.KEY_PRESS and widget is self.p_win \
+                and isinstance(self.p_win.get_focus(), gtk.Entry):
+            return self.p_win.propagate_key_event(event)
+
+        self.nav_time = time.time()
         if event.type == gtk.gdk.KEY_PRESS:
             name = gtk.gdk.keyval_name(event.keyval)
 
@@ -501,6 +1017,10 @@ class UI:
                 self.switch_mode()
             elif name.upper() == "G":
                 self.select_page(widget, event, True)
+            elif name == "Escape" and self.overview.get_visible():
+                self.overview_action.set_active(False)
+            elif name == "Escape" and self.zoom:
+                self.reset_zoom()
             elif event.string.isdigit():
                 self.select_page(widget, event)
 
@@ -512,9 +1032,17 @@ class UI:
                     self.switch_pause()
                 elif name.upper() == "N":
                     self.switch_mode()
+                elif name.upper() == "O":
+                    self.overview_action.set_active(not self.overview.get_visible())
 
         elif event.type == gtk.gdk.SCROLL:
-            if event.direction in [gtk.gdk.SCROLL_RIGHT, gtk.gdk.SCROLL_DOWN]:
+            if event.state & gtk.gdk.CONTROL_MASK:
+                da = self.p_da_cur if widget is self.p_win else self.c_da
+                if event.direction == gtk.gdk.SCROLL_UP:
+                    self.zoom_at(da, 1)
+                elif event.direction == gtk.gdk.SCROLL_DOWN:
+                    self.zoom_at(da, -1)
+            elif event.direction in [gtk.gdk.SCROLL_RIGHT, gtk.gdk.SCROLL_DOWN]:
                 self.doc.goto_next()
             else:
                 self.doc.goto_prev()
@@ -522,16 +1050,25 @@ class UI:
         else:
             print "Unknown event %s" % event.type
 
+        # Forget the event if it did not change the page
+        self.nav_time = None
+
 
     def on_link(self, widget, event):
         """
         Manage events related to hyperlinks.
 
+        Motion events are compressed with motion hints: the position of the
+        pointer is only read when the previous motion event has been handled.
+        The cursor is only changed when the pointer enters or leaves a link.
+
         :param widget: the widget in which the event occured
         :type  widget: :class:`gtk.Widget`
         :param event: the event that occured
         :type  event: :class:`gtk.gdk.Event`
         """
+        if not self.doc.is_open():
+            return
 
         # Where did the event occur?
         if widget is self.p_da_next:
@@ -543,23 +1080,30 @@ class UI:
             page = self.doc.current_page()
 
         # Normalize event coordinates and get link
-        x, y = event.get_coords()
+        if event.type == gtk.gdk.MOTION_NOTIFY and event.is_hint:
+            x, y, state = event.window.get_pointer()
+        else:
+            x, y = event.get_coords()
         ww, wh = widget.window.get_size()
-        x2, y2 = x/ww, y/wh
+        x2, y2 = float(x)/ww, float(y)/wh
+        if self.zoom and widget is not self.p_da_next:
+            z = pympress.tiles.ZOOM_LEVELS[self.zoom]
+            x2, y2 = self.zoom_origin[0] + x2/z, self.zoom_origin[1] + y2/z
         link = page.get_link_at(x2, y2)
 
         # Event type?
         if event.type == gtk.gdk.BUTTON_PRESS:
             if link is not None:
+                self.nav_time = time.time()
                 dest = link.get_destination()
                 self.doc.goto(dest)
+                self.nav_time = None
 
         elif event.type == gtk.gdk.MOTION_NOTIFY:
-            if link is not None:
-                cursor = gtk.gdk.Cursor(gtk.gdk.HAND2)
-                widget.window.set_cursor(cursor)
-            else:
-                widget.window.set_cursor(None)
+            name = widget.get_name()
+            if link is not self.hovered.get(name):
+                self.hovered[name] = link
+                widget.window.set_cursor(self.link_cursor if link is not None else None)
 
         else:
             print "Unknown event %s" % event.type
@@ -578,6 +1122,8 @@ class UI:
         :param event: the event that occured
         :type  event: :class:`gtk.gdk.Event`
         """
+        if not self.doc.is_open():
+            return False
 
         widget = self.eb_cur.get_child()
 
@@ -627,38 +1173,201 @@ class UI:
 
 
 
-    def render_page(self, page, widget, wtype):
+    def render_page(self, page, widget, wtype, scale=1):
         """
-        Render a page on a widget.
+        Render a page for a widget.
+
+        The page is rendered off-screen, on a client-side surface with the size
+        of the widget, using the :meth:`pympress.document.Page.render_cairo`
+        method. It can then be painted on the widget with
+        :meth:`paint_surface`.
 
-        This function takes care of properly initializing the widget so that
-        everything looks fine in the end. The rendering to a Cairo surface is
-        done using the :meth:`pympress.document.Page.render_cairo` method.
+        If ``scale`` is greater than 1, a smaller preview is rendered instead,
+        but only if this can be done without waiting for another thread.
 
         :param page: the page to render
         :type  page: :class:`pympress.document.Page`
-        :param widget: the widget on which the page must be rendered
+        :param widget: the widget for which the page must be rendered
         :type  widget: :class:`gtk.DrawingArea`
         :param wtype: the type of document to render
         :type  wtype: integer
+        :param scale: ratio between the size of the widget and the size of the
+           render
+        :type  scale: integer
+        :return: the rendered page, or ``None`` if it could not be rendered
+        :rtype: :class:`cairo.ImageSurface`
         """
 
         # Make sure the widget is initialized
         if widget.window is None:
-            return
+            return None
 
         # Widget size
         ww, wh = widget.window.get_size()
+        if scale == 1:
+            return self.cache.render(page, ww, wh, wtype)
+        else:
+            return self.cache.render(page, max(1, ww/scale), max(1, wh/scale), wtype, False)
 
-        # Manual double buffering (since we use direct drawing instead of
-        # calling queue_draw() on the widget)
-        widget.window.begin_paint_rect(gtk.gdk.Rectangle(0, 0, ww, wh))
+
+    def paint_surface(self, widget, surface, area=None, rects=None):
+        """
+        Paint a rendered page on a widget.
+
+        Nothing is read back from the display: the surface is simply painted on
+        the widget, clipped to the given area. If the surface does not have the
+        same size as the widget (e.g. for a preview), it is scaled.
+
+        :param widget: the widget to paint
+        :type  widget: :class:`gtk.DrawingArea`
+        :param surface: the rendered page
+        :type  surface: :class:`cairo.ImageSurface`
+        :param area: the area of the widget to paint, or ``None`` for the whole
+           widget
+        :type  area: :class:`gtk.gdk.Rectangle`
+        :param rects: if not ``None``, only paint these parts of the widget
+        :type  rects: list of ``(x, y, width, height)`` tuples
+        """
+        if widget.window is None or rects == []:
+            return
 
         cr = widget.window.cairo_create()
-        page.render_cairo(cr, ww, wh, wtype)
+        if area is not None:
+            cr.rectangle(area.x, area.y, area.width, area.height)
+            cr.clip()
+        if rects is not None:
+            for x, y, w, h in rects:
+                cr.rectangle(x, y, w, h)
+            cr.clip()
 
-        # Blit off-screen buffer to screen
-        widget.window.end_paint()
+        ww, wh = widget.window.get_size()
+        sw, sh = surface.get_width(), surface.get_height()
+        if (sw, sh) != (ww, wh):
+            cr.scale(float(ww)/sw, float(wh)/sh)
+
+        cr.set_source_surface(surface, 0, 0)
+        cr.paint()
+
+
+    def zoom_geometry(self, widget):
+        """
+        Compute the position of the zoomed view of the current page on a
+        widget.
+
+        :param widget: the widget displaying the current page
+        :type  widget: :class:`gtk.DrawingArea`
+        :return: size of the widget, zoom factor, and offset of the view in the
+           zoomed page
+        :rtype: (integer, integer, integer, integer, integer)
+        """
+        ww, wh = widget.window.get_size()
+        z = pympress.tiles.ZOOM_LEVELS[self.zoom]
+        fx, fy = self.zoom_origin
+        return ww, wh, z, int(fx * ww * z), int(fy * wh * z)
+
+
+    def paint_zoomed(self, widget, page_nb, wtype, surface, area=None):
+        """
+        Paint the zoomed current page on a widget, tile by tile.
+
+        The visible tiles are taken from the :class:`~pympress.tiles.TileCache`.
+        The ones that are not available yet are requested, and the page
+        rendered at the normal size is scaled up to fill their place until they
+        are ready (see :meth:`on_tile`).
+
+        :param widget: the widget to paint
+        :type  widget: :class:`gtk.DrawingArea`
+        :param page_nb: number of the current page
+        :type  page_nb: integer
+        :param wtype: type of document displayed by the widget
+        :type  wtype: integer
+        :param surface: the page rendered at the size of the widget (or a
+           substitute)
+        :type  surface: :class:`cairo.ImageSurface`
+        :param area: the area of the widget to paint, or ``None`` for the whole
+           widget
+        :type  area: :class:`gtk.gdk.Rectangle`
+        """
+        if widget.window is None:
+            return
+
+        ww, wh, z, ox, oy = self.zoom_geometry(widget)
+        size = self.tiles.tile_size
+        key = self.cache.key(page_nb)
+
+        cr = widget.window.cairo_create()
+        if area is not None:
+            cr.rectangle(area.x, area.y, area.width, area.height)
+            cr.clip()
+
+        missing = []
+        for row in range(oy / size, (oy + wh - 1) / size + 1):
+            for col in range(ox / size, (ox + ww - 1) / size + 1):
+                tile_key = (key, wtype, ww, wh, z, col, row)
+                tile = self.tiles.get(tile_key)
+                x, y = col*size - ox, row*size - oy
+
+                cr.save()
+                cr.rectangle(x, y, size, size)
+                cr.clip()
+                if tile is not None:
+                    cr.set_source_surface(tile, x, y)
+                else:
+                    missing.append(tile_key)
+                    cr.translate(-ox, -oy)
+                    cr.scale(float(ww) * z / surface.get_width(), float(wh) * z / surface.get_height())
+                    cr.set_source_surface(surface, 0, 0)
+                cr.paint()
+                cr.restore()
+
+        self.tiles.request(widget.get_name(), missing)
+
+
+    def zoom_at(self, widget, step):
+        """
+        Zoom the current page in or out, keeping the point under the mouse
+        pointer in place.
+
+        :param widget: the widget under the pointer
+        :type  widget: :class:`gtk.DrawingArea`
+        :param step: number of zoom levels to go up (or down if negative)
+        :type  step: integer
+        """
+        levels = pympress.tiles.ZOOM_LEVELS
+        zoom = max(0, min(len(levels) - 1, self.zoom + step))
+        if zoom == self.zoom or widget.window is None:
+            return
+        if zoom == 0:
+            self.reset_zoom()
+            return
+
+        ww, wh = widget.window.get_size()
+        x, y = widget.get_pointer()
+        fx = min(max(float(x) / ww, 0), 1)
+        fy = min(max(float(y) / wh, 0), 1)
+
+        # Point of the page under the pointer, which must stay there
+        old, new = levels[self.zoom], levels[zoom]
+        px, py = self.zoom_origin[0] + fx/old, self.zoom_origin[1] + fy/old
+        self.zoom_origin = (min(max(px - fx/new, 0), 1 - 1./new),
+                            min(max(py - fy/new, 0), 1 - 1./new))
+        self.zoom = zoom
+
+        self.c_da.queue_draw()
+        self.p_da_cur.queue_draw()
+
+
+    def reset_zoom(self):
+        """Display the current page at its normal size again, if it is zoomed."""
+        if not self.zoom:
+            return
+        self.zoom = 0
+        self.zoom_origin = (0., 0.)
+        self.tiles.cancel()
+        self.displayed.pop("c_da", None)
+        self.displayed.pop("p_da_cur", None)
+        self.c_da.queue_draw()
+        self.p_da_cur.queue_draw()
 
 
     def restore_current_label(self):
@@ -691,9 +1400,15 @@ class UI:
 
     def update_time(self):
         """
-        Update the timer and clock labels.
+        Update the timer and clock labels, and schedule the next update.
 
-        :return: ``True`` (to prevent the timer from stopping)
+        To avoid useless wakeups, the labels are only updated when their text
+        changes, and the next update is scheduled right after the next second
+        boundary of the clock or of the timer (see :meth:`next_time_update`),
+        instead of polling.
+
+        :return: ``False`` (when used as a timeout callback: the next update
+           has its own timeout)
         :rtype: boolean
         """
 
@@ -709,10 +1424,46 @@ class UI:
         if self.paused:
             elapsed += " (pause)"
 
-        self.label_time.set_markup(text % elapsed)
-        self.label_clock.set_markup(text % clock)
+        if (elapsed, clock) != self.time_texts:
+            if elapsed != self.time_texts[0]:
+                self.label_time.set_markup(text % elapsed)
+            if clock != self.time_texts[1]:
+                self.label_clock.set_markup(text % clock)
+            self.time_texts = (elapsed, clock)
+
+        if self.time_source is not None:
+            gobject.source_remove(self.time_source)
+        self.time_source = gobject.timeout_add(self.next_time_update(), self.on_time_timeout)
+        pympress.stats.count("timer wakeups")
+        return False
 
-        return True
+
+    def on_time_timeout(self):
+        """
+        Timeout callback updating the timer and clock labels.
+
+        :return: ``False`` (the next update has its own timeout)
+        :rtype: boolean
+        """
+        self.time_source = None
+        return self.update_time()
+
+
+    def next_time_update(self):
+        """
+        Compute when the timer or clock labels change next: at the next second
+        of the clock, or of the timer if it is running.
+
+        :return: delay before the next change, in milliseconds
+        :rtype: integer
+        """
+        now = time.time()
+        delay = 1 - now % 1
+        if not self.paused:
+            delay = min(delay, 1 - (now - self.start_time) % 1)
+        # GLib timeouts have a millisecond resolution: make sure the boundary
+        # has been crossed when the timeout fires
+        return int(delay * 1000) + 5
 
 
     def switch_pause(self, widget=None, event=None):
@@ -735,6 +1486,9 @@ class UI:
         """
         Enable or disable the screensaver.
 
+        This returns immediately: the commands are run in the background (see
+        :mod:`pympress.screensaver`).
+
         .. warning:: At the moment, this is only supported on POSIX systems
            where :command:`xdg-screensaver` is installed and working. For now,
            this feature has only been tested on **Linux with xscreensaver**.
@@ -743,41 +1497,7 @@ class UI:
            disabled; otherwise it will be enabled
         :type  must_disable: boolean
         """
-        if os.name == 'posix':
-            # On Linux, set screensaver with xdg-screensaver
-            # (compatible with xscreensaver, gnome-screensaver and ksaver or whatever)
-            cmd = "suspend" if must_disable else "resume"
-            status = os.system("xdg-screensaver %s %s" % (cmd, self.c_win.window.xid))
-            if status != 0:
-                print >>sys.stderr, "Warning: Could not set screensaver status: got status %d" % status
-
-            # Also manage screen blanking via DPMS
-            if must_disable:
-                # Get current DPMS status
-                pipe = os.popen("xset q") # TODO: check if this works on all locales
-                dpms_status = "Disabled"
-                for line in pipe.readlines():
-                    if line.count("DPMS is") > 0:
-                        dpms_status = line.split()[-1]
-                        break
-                pipe.close()
-
-                # Set the new value correctly
-                if dpms_status == "Enabled":
-                    self.dpms_was_enabled = True
-                    status = os.system("xset -dpms")
-                    if status != 0:
-                        print >>sys.stderr, "Warning: Could not disable DPMS screen blanking: got status %d" % status
-                else:
-                    self.dpms_was_enabled = False
-
-            elif self.dpms_was_enabled:
-                # Re-enable DPMS
-                status = os.system("xset +dpms")
-                if status != 0:
-                    print >>sys.stderr, "Warning: Could not enable DPMS screen blanking: got status %d" % status
-        else:
-            print >>sys.stderr, "Warning: Unsupported OS: can't enable/disable screensaver"
+        self.screensaver.set_enabled(not must_disable, self.c_win.window.xid)
 
 
     def switch_fullscreen(self, widget=None, event=None):
@@ -812,8 +1532,140 @@ class UI:
             self.cache.set_widget_type("c_da", PDF_CONTENT_PAGE)
             self.cache.set_widget_type("p_da_cur", PDF_NOTES_PAGE)
             self.cache.set_widget_type("p_da_next", PDF_CONTENT_PAGE)
+        self.displayed.clear()
+
+        if self.doc.is_open():
+            self.on_page_change(False)
+
+    def switch_overview(self, widget=None, event=None):
+        """
+        Show or hide the overview of all the slides in the Presenter window.
+        """
+        if self.overview.get_visible():
+            self.overview.hide()
+            self.p_align.show()
+        else:
+            self.p_align.hide()
+            self.overview.show()
+            if self.doc.is_open():
+                # Scroll to the current page
+                cols, cw, ch, x0 = self.overview_geometry()
+                row = self.doc.current_page().number() / cols
+                adj = self.overview.get_vadjustment()
+                adj.set_value(min(row * ch, max(0, adj.get_upper() - adj.get_page_size())))
+
+    def show_search(self, widget=None, event=None):
+        """
+        Show the search bar in the Presenter window, and give it the focus.
+        """
+        self.search_bar.show()
+        self.search_entry.grab_focus()
+        self.search_entry.select_region(0, -1)
+        self.update_search()
+
+
+    def hide_search(self):
+        """
+        Hide the search bar, and give the focus back to the Presenter window so
+        that keys are used for navigation again.
+        """
+        self.search_bar.hide()
+        self.p_win.set_focus(None)
+
+
+    def update_search(self, widget=None):
+        """
+        Search the text of the search entry in the document, and display the
+        results. This is done each time the text changes, and each time new
+        pages have been indexed, so the results are updated while the index is
+        being built.
+        """
+        if not self.search_bar.get_visible() or not self.doc.is_open():
+            return
+
+        text = self.search_entry.get_text()
+        nb_pages = self.doc.pages_number()
+        self.search_results = [p for p in self.search.search(text) if p < nb_pages]
+
+        if not text.strip():
+            message = ""
+        elif not self.search_results:
+            message = "No match"
+        else:
+            pages = ", ".join(str(p + 1) for p in self.search_results[:20])
+            if len(self.search_results) > 20:
+                pages += "..."
+            message = "%d match(es): slide %s" % (len(self.search_results), pages)
+        if not self.search.is_complete():
+            message += " (indexing...)"
+        self.search_label.set_text(message)
+
+
+    def on_search_progress(self):
+        """
+        Update the search results after new pages have been indexed.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        self.update_search()
+        return False
+
+
+    def on_search_activate(self, widget):
+        """
+        Go to the next page matching the search (Return key in the search
+        entry).
+
+        :param widget: the search entry
+        :type  widget: :class:`gtk.Entry`
+        """
+        self.goto_search_result(True)
+
+
+    def on_search_key(self, widget, event):
+        """
+        Manage special keys in the search entry: Escape hides the search bar,
+        and Shift+Return goes to the previous page matching the search.
+
+        :param widget: the search entry
+        :type  widget: :class:`gtk.Entry`
+        :param event: the GTK event
+        :type  event: :class:`gtk.gdk.Event`
+        :return: ``True`` if the key has been handled, ``False`` otherwise
+        :rtype: boolean
+        """
+        name = gtk.gdk.keyval_name(event.keyval)
+        if name == "Escape":
+            self.hide_search()
+            return True
+        elif name in ["Return", "KP_Enter"] and event.state & gtk.gdk.SHIFT_MASK:
+            self.goto_search_result(False)
+            return True
+        return False
+
+
+    def goto_search_result(self, forward):
+        """
+        Go to the next (or previous) page matching the search, wrapping around
+        the end of the document.
+
+        :param forward: ``True`` to go to the next match, ``False`` to go to the
+           previous one
+        :type  forward: boolean
+        """
+        if not self.search_results:
+            return
+
+        cur = self.doc.current_page().number()
+        if forward:
+            after = [p for p in self.search_results if p > cur]
+            page = after[0] if after else self.search_results[0]
+        else:
+            before = [p for p in self.search_results if p < cur]
+            page = before[-1] if before else self.search_results[-1]
+        self.doc.goto(page)
 
-        self.on_page_change(False)
 
     def select_page(self, widget=None, event=None, go=False):
         """
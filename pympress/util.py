@@ -22,37 +22,89 @@
 -------------------------------------------------
 """
 
-import pygtk
-pygtk.require('2.0')
-import gtk
-import pkg_resources
 import os, os.path, sys
+import threading
+import time
+import weakref
+
 import poppler
 
+#: Sizes of the icons given to the window manager. Other sizes are not loaded,
+#: since decoding them would only slow down the startup.
+ICON_SIZES = (16, 32, 48)
+
+def get_icon_path(name):
+    """
+    Get the path to one of the pympress icons from the pixmaps directory
+    (usually :file:`/usr/share/pixmaps` or something similar).
+
+    Installation paths are tried first, and :mod:`pkg_resources` (which is
+    slow to import) is only used as a last resort.
+
+    :param name: file name of the icon
+    :type  name: string
+    :return: path to the icon
+    :rtype: string
+    """
+    dirs = [
+        # Source tree or unpacked egg
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "share", "pixmaps"),
+        # Usual installation directories
+        os.path.join(sys.prefix, "share", "pixmaps"),
+        "/usr/local/share/pixmaps",
+        "/usr/share/pixmaps",
+    ]
+    for d in dirs:
+        path = os.path.join(d, name)
+        if os.path.exists(path):
+            return path
+
+    import pkg_resources
+    req = pkg_resources.Requirement.parse("pympress")
+    return pkg_resources.resource_filename(req, "share/pixmaps/%s" % name)
+
 def load_icons():
     """
-    Load pympress icons from the pixmaps directory (usually
-    :file:`/usr/share/pixmaps` or something similar).
+    Load pympress icons from the pixmaps directory (see :func:`get_icon_path`).
+    Only the sizes listed in :const:`ICON_SIZES` are loaded.
 
     :return: loaded icons
     :rtype: list of :class:`gtk.gdk.Pixbuf`
     """
-    
-    req = pkg_resources.Requirement.parse("pympress")
-    icon_names = pkg_resources.resource_listdir(req, "share/pixmaps")
+    import pygtk
+    pygtk.require('2.0')
+    import gtk
+
     icons = []
-    for icon_name in icon_names:
-        if os.path.splitext(icon_name)[1].lower() != ".png": continue
-        icon_fn = pkg_resources.resource_filename(req, "share/pixmaps/%s" % icon_name)
+    for size in ICON_SIZES:
         try:
+            icon_fn = get_icon_path("pympress-%d.png" % size)
             icon_pixbuf = gtk.gdk.pixbuf_new_from_file(icon_fn)
             icons.append(icon_pixbuf)
         except Exception, e:
             print e
-    
+
     return icons
 
 
+def get_cache_path(name):
+    """
+    Get the path to a file in the cache directory of pympress (usually
+    :file:`~/.cache/pympress`), which is used to keep metadata about documents
+    between two runs. The directory is created if needed.
+
+    :param name: file name in the cache directory
+    :type  name: string
+    :return: path to the file
+    :rtype: string
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    cache_dir = os.path.join(base, "pympress")
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return os.path.join(cache_dir, name)
+
+
 def poppler_links_available():
     """Check if hyperlinks are supported in python-poppler.
 
@@ -68,6 +120,97 @@ def poppler_links_available():
     else:
         return True
 
+#: All the :class:`~pympress.util.TrackedLock` instances, as a
+#: :class:`weakref.WeakSet`.
+tracked_locks = weakref.WeakSet()
+
+
+class TrackedLock:
+    """
+    A :class:`threading.Lock` which remembers which thread holds it, and where
+    it was acquired, so that it can be reported by the
+    :class:`~pympress.watchdog.Watchdog`. It is used in the same way as a
+    :class:`threading.Lock`, and is almost as fast.
+    """
+
+    #: Name of the lock, used in reports.
+    name = None
+
+    #: The actual :class:`threading.Lock`.
+    lock = None
+
+    #: Name of the thread holding the lock, or ``None``.
+    owner = None
+
+    #: Time at which the lock was acquired.
+    since = 0
+
+    #: Where the lock was acquired (file, line and function).
+    site = None
+
+    def __init__(self, name):
+        """
+        :param name: see :attr:`name`
+        :type  name: string
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        tracked_locks.add(self)
+
+    def acquired(self, frame):
+        """
+        Remember that the current thread holds the lock.
+
+        :param frame: the frame in which the lock was acquired
+        :type  frame: frame
+        """
+        self.owner = threading.current_thread().name
+        self.since = time.time()
+        self.site = "%s:%d (%s)" % (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+    def acquire(self, blocking=True):
+        """
+        Acquire the lock.
+
+        :param blocking: if ``False``, give up instead of waiting when the lock
+           is held by another thread
+        :type  blocking: boolean
+        :return: ``True`` if the lock has been acquired, ``False`` otherwise
+        :rtype: boolean
+        """
+        if not self.lock.acquire(blocking):
+            return False
+        self.acquired(sys._getframe(1))
+        return True
+
+    def release(self):
+        """Release the lock."""
+        self.owner = None
+        self.lock.release()
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.acquired(sys._getframe(1))
+        return True
+
+    def __exit__(self, *args):
+        self.release()
+
+    def describe(self, now):
+        """
+        Describe who holds the lock.
+
+        :param now: current time
+        :type  now: float
+        :return: a description of the owner of the lock, or ``None`` if the lock
+           is free
+        :rtype: string
+        """
+        owner, since, site = self.owner, self.since, self.site
+        if owner is None:
+            return None
+        return "%s: held by %s for %d ms, acquired at %s" % (self.name, owner, (now - since) * 1000, site)
+
 ##
 # Local Variables:
 # mode: python
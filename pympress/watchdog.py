@@ -0,0 +1,148 @@
+#       watchdog.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.watchdog` -- main loop stall detection
+-----------------------------------------------------
+
+This module contains the :class:`~pympress.watchdog.Watchdog` class, which
+detects when the GLib main loop is blocked (the GUI is then frozen), and writes
+a report to a log file: the Python stack of every thread, and which thread holds
+each :class:`~pympress.util.TrackedLock`. This tells what the main loop was
+waiting for (a synchronous render, an external command, a lock held by a
+rendering thread...), even for a freeze that happened during a real talk.
+"""
+
+import sys
+import threading
+import time
+import traceback
+
+import gobject
+
+import pympress.stats
+import pympress.util
+
+class Watchdog:
+    """Detection of the stalls of the GLib main loop."""
+
+    #: Time (in milliseconds) without heartbeat after which the main loop is
+    #: considered blocked.
+    threshold = 250
+
+    #: Time between two heartbeats, in milliseconds.
+    heartbeat = 50
+
+    #: Path to the file in which the reports are appended.
+    log_path = None
+
+    #: Time of the last heartbeat.
+    last_beat = 0
+
+    #: Whether the current stall has already been reported.
+    stalled = False
+
+    def __init__(self, threshold=None, log_path=None):
+        """
+        :param threshold: see :attr:`threshold`
+        :type  threshold: integer
+        :param log_path: see :attr:`log_path`; by default, :file:`stalls.log`
+           in the cache directory of pympress (see
+           :func:`pympress.util.get_cache_path`)
+        :type  log_path: string
+        """
+        if threshold is not None:
+            self.threshold = threshold
+        self.log_path = log_path or pympress.util.get_cache_path("stalls.log")
+
+    def start(self):
+        """Start sending heartbeats from the main loop, and watching them."""
+        self.last_beat = time.time()
+        gobject.timeout_add(self.heartbeat, self.beat)
+
+        thread = threading.Thread(target=self.monitor, name="watchdog")
+        thread.daemon = True
+        thread.start()
+
+    def beat(self):
+        """
+        Heartbeat, called by the main loop. If a stall has been reported, tell
+        how long it lasted.
+
+        :return: ``True`` (when used as a timeout callback)
+        :rtype: boolean
+        """
+        now = time.time()
+        if self.stalled:
+            duration = (now - self.last_beat) * 1000
+            pympress.stats.record("main loop stall (ms)", duration)
+            pympress.stats.log("Main loop stalled for %d ms (see %s)" % (duration, self.log_path))
+            self.stalled = False
+        self.last_beat = now
+        return True
+
+    def monitor(self):
+        """
+        Watchdog thread: check the heartbeats, and write a report when they
+        stop for more than :attr:`threshold` milliseconds. Each stall is only
+        reported once. It runs infinitely (until the program ends).
+        """
+        while True:
+            time.sleep(self.threshold / 4000.)
+            delay = time.time() - self.last_beat
+            if not self.stalled and delay * 1000 > self.threshold:
+                self.stalled = True
+                pympress.stats.count("main loop stalls")
+                self.report(delay)
+
+    def report(self, delay):
+        """
+        Append the stacks of all the threads and the owners of the tracked locks
+        to :attr:`log_path`.
+
+        :param delay: time since the last heartbeat, in seconds
+        :type  delay: float
+        """
+        now = time.time()
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        lines = ["=== %s: main loop blocked for %d ms" % (time.strftime("%Y-%m-%d %H:%M:%S"), delay * 1000)]
+        for ident, frame in sys._current_frames().items():
+            lines.append("--- Thread %s (%d):" % (names.get(ident, "?"), ident))
+            lines.append("".join(traceback.format_stack(frame)).rstrip())
+        lines.append("--- Locks:")
+        for lock in list(pympress.util.tracked_locks):
+            description = lock.describe(now)
+            if description is not None:
+                lines.append(description)
+
+        try:
+            with open(self.log_path, "a") as f:
+                f.write("\n".join(lines) + "\n\n")
+        except IOError, e:
+            print >>sys.stderr, "Warning: Could not write the stall report: %s" % e
+            return
+        print >>sys.stderr, "Main loop blocked for %d ms, stacks written to %s" % (delay * 1000, self.log_path)
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
@@ -0,0 +1,180 @@
+#       watcher.py
+#
+#       Copyright 2010 Thomas Jost <thomas.jost@gmail.com>
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+
+"""
+:mod:`pympress.watcher` -- file monitoring
+------------------------------------------
+
+This module is used to be notified when a file is modified, so that a document
+can be reloaded as soon as it has been recompiled. It uses inotify (through
+`pyinotify <http://github.com/seb-m/pyinotify>`_) when it is available, and
+falls back to periodically checking the modification time of the file
+otherwise.
+
+Notifications are always delivered in the GLib main loop.
+"""
+
+import os
+import os.path
+
+import gobject
+
+
+def file_state(path):
+    """
+    Get the current state of a file, which can be compared to a previous state
+    to know if the file has changed.
+
+    :param path: path to the file
+    :type  path: string
+    :return: modification time and size of the file, or ``None`` if it does not
+       exist
+    :rtype: (float, integer)
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+class FileWatcher:
+    """Call a function in the main loop when a file has been modified."""
+
+    #: Path of the watched file.
+    path = None
+    #: Function to call (without any argument) when the file has been modified.
+    callback = None
+    #: Time (in milliseconds) during which the file must not be modified before
+    #: calling :attr:`callback`. This prevents reading a file that is still
+    #: being written (e.g. between two LaTeX runs).
+    delay = 500
+    #: Time (in milliseconds) between two checks when inotify is not available.
+    poll_interval = 1000
+    #: Last known state of the file, as returned by :func:`file_state`.
+    state = None
+    #: ID of the pending "delay" timeout source, if any.
+    timeout_id = None
+    #: ID of the polling timeout source, if inotify is not available.
+    poll_id = None
+    #: :class:`pyinotify.ThreadedNotifier` instance, if inotify is available.
+    notifier = None
+
+    def __init__(self, path, callback, delay=500):
+        """
+        :param path: path to the file to watch
+        :type  path: string
+        :param callback: function to call when the file has been modified
+        :type  callback: function
+        :param delay: see :attr:`delay`
+        :type  delay: integer
+        """
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.delay = delay
+        self.state = file_state(self.path)
+
+        # pyinotify is an optional dependency, and it is slow to import: only
+        # import it when it is really needed.
+        try:
+            import pyinotify
+        except ImportError:
+            pyinotify = None
+
+        if pyinotify is not None:
+            # Watch the whole directory: many tools replace the file instead of
+            # rewriting it, which would break a watch on the file itself.
+            wm = pyinotify.WatchManager()
+            mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_CREATE
+            wm.add_watch(os.path.dirname(self.path), mask)
+            self.notifier = pyinotify.ThreadedNotifier(wm, self.on_inotify)
+            self.notifier.daemon = True
+            self.notifier.start()
+        else:
+            self.poll_id = gobject.timeout_add(self.poll_interval, self.on_poll)
+
+    def stop(self):
+        """Stop watching the file."""
+        if self.notifier is not None:
+            self.notifier.stop()
+            self.notifier = None
+        if self.poll_id is not None:
+            gobject.source_remove(self.poll_id)
+            self.poll_id = None
+        if self.timeout_id is not None:
+            gobject.source_remove(self.timeout_id)
+            self.timeout_id = None
+
+    def on_inotify(self, event):
+        """
+        Handle an inotify event. This is called in the notifier thread, so the
+        real work is deferred to the main loop.
+
+        :param event: the inotify event
+        :type  event: :class:`pyinotify.Event`
+        """
+        if os.path.abspath(event.pathname) == self.path:
+            gobject.idle_add(self.on_change)
+
+    def on_poll(self):
+        """
+        Check if the file has been modified since the last check.
+
+        :return: ``True`` (to keep polling)
+        :rtype: boolean
+        """
+        if file_state(self.path) != self.state:
+            self.on_change()
+        return True
+
+    def on_change(self):
+        """
+        Handle a modification of the file by (re)starting the :attr:`delay`
+        timeout.
+
+        :return: ``False`` (when used as an idle callback)
+        :rtype: boolean
+        """
+        if self.timeout_id is not None:
+            gobject.source_remove(self.timeout_id)
+        self.timeout_id = gobject.timeout_add(self.delay, self.on_settled)
+        return False
+
+    def on_settled(self):
+        """
+        Call :attr:`callback` if the file has not been modified during the last
+        :attr:`delay` milliseconds and really differs from its last known state.
+
+        :return: ``False`` (to remove the timeout source)
+        :rtype: boolean
+        """
+        self.timeout_id = None
+        state = file_state(self.path)
+        if state is not None and state != self.state:
+            self.state = state
+            self.callback()
+        return False
+
+##
+# Local Variables:
+# mode: python
+# indent-tabs-mode: nil
+# py-indent-offset: 4
+# fill-column: 80
+# end:
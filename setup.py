@@ -45,7 +45,7 @@ setup(name="pympress",
           'Topic :: Multimedia :: Graphics :: Viewers',
       ],
       packages=["pympress"],
-      scripts=["bin/pympress"],
+      scripts=["bin/pympress", "bin/pympress-frames"],
       data_files=[
           ("share/pixmaps", glob.glob("share/pixmaps/pympress*")),
       ],